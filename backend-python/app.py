@@ -5,9 +5,22 @@ import os
 from flask import Flask, jsonify
 from flask_cors import CORS
 from config import Config
-from models import db
+from models import db, upgrade_schema, reconcile_counters, backfill_source_hashes
+from storage import apply_sqlite_profile
+from wire import FastJSONProvider
+from tm import rebuild_translation_memory, index_translation_memory
+from jobs import init_job_queue
+from reaper import init_reaper, purge_deleted_segments, empty_trash
+from search import ensure_search_index, rebuild_search_index
+from blobs import get_blob_store
 from routes.projects import projects_bp
 from routes.files import files_bp
+from routes.uploads import uploads_bp
+from routes.matches import matches_bp
+from routes.pretranslate import pretranslate_bp, mt_bp
+from routes.jobs import jobs_bp
+from routes.search import search_bp
+from routes.events import events_bp
 # Removed: from routes.legacy import legacy_bp
 import logging
 
@@ -15,6 +28,8 @@ def create_app(config_class=Config):
     """Creates and configures the Flask application."""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # orjson-backed jsonify (falls back to the standard encoder)
+    app.json = FastJSONProvider(app)
 
     # Initialize extensions
     # Expose 'Content-Disposition' for file downloads
@@ -33,6 +48,9 @@ def create_app(config_class=Config):
     # Create database tables if they don't exist
     # Use app context for database operations
     with app.app_context():
+        # Connection pragmas must be in place before the first connection is opened
+        apply_sqlite_profile(db.engine, app.config['SQLITE_PROFILE'])
+
         # Check if tables already exist before creating
         # This is safer than calling create_all() unconditionally
         # inspector = db.inspect(db.engine)
@@ -43,11 +61,69 @@ def create_app(config_class=Config):
         #     app.logger.info("Database tables already exist.")
         # Simpler approach for SQLite during development:
         db.create_all()
+        # Add columns introduced after the database was first created
+        added_columns = upgrade_schema()
+        if added_columns:
+            app.logger.info(f"Added database columns: {', '.join(added_columns)}")
+            if any(column.endswith('_count') for column in added_columns):
+                # Newly added counters start at 0, rebuild them from the segment table
+                reconcile_counters()
+            if 'segment.source_hash' in added_columns:
+                # Existing segments need their repetition hashes
+                filled = backfill_source_hashes()
+                app.logger.info(f'Computed source hashes for {filled} existing segments')
+        # Full-text index kept in sync with the segment table by triggers
+        if ensure_search_index():
+            app.logger.info('Built the full-text search index')
+
+    # Worker threads for long-running operations (see jobs.py), started by the first request
+    init_job_queue(app)
+    # Removes segments and directories of deleted projects and files (see reaper.py), started likewise
+    init_reaper(app)
+
+    @app.cli.command('rebuild-tm')
+    def rebuild_tm_command():
+        """Add every translated segment to the translation memory."""
+        recorded = rebuild_translation_memory()
+        indexed = index_translation_memory()
+        print(f'Translation memory updated with {recorded} entries, {indexed} entries indexed for fuzzy lookup.')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Re-index every segment for full-text search."""
+        rebuild_search_index()
+        print('Full-text search index rebuilt.')
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Rebuild file/project segment counters from the segment table."""
+        reconcile_counters()
+        print('Segment counters reconciled.')
+
+    @app.cli.command('gc-blobs')
+    def gc_blobs_command():
+        """Recount blob references and remove unreferenced uploads from the blob store."""
+        removed = get_blob_store().sweep()
+        print(f'Blob store swept, {removed} files removed.')
+
+    @app.cli.command('purge-deleted')
+    def purge_deleted_command():
+        """Remove segments and directories of deleted projects and files now."""
+        purged = purge_deleted_segments(app.config['REAPER_BATCH_SIZE'])
+        removed = empty_trash()
+        print(f'{purged} segments of deleted files and {removed} trashed directories removed.')
 
 
     # Register blueprints
     app.register_blueprint(projects_bp)
     app.register_blueprint(files_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(matches_bp)
+    app.register_blueprint(pretranslate_bp)
+    app.register_blueprint(mt_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(events_bp)
     # Removed: app.register_blueprint(legacy_bp)
 
     # Simple root route for health check or basic info
@@ -0,0 +1,235 @@
+import multiprocessing
+import os
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from flask import current_app
+from werkzeug.utils import secure_filename
+from models import db, File
+from formats import INVALID_FORMAT_ERRORS, detect_format, get_format, iter_file_segments
+from blobs import parse_cache_key
+from ingest import insert_segments
+
+# Error message of files that cannot be decoded, shown per file in the summary
+UNREADABLE_ERROR = '无法读取文件内容，请确保文件为UTF-8编码'
+
+class BatchTooLarge(Exception):
+    """The uploaded files, with ZIP archives expanded, exceed the size limit."""
+
+class BatchItem:
+    """One file of a batch upload, stored in the blob store."""
+
+    def __init__(self, file_name, digest, file_path):
+        self.id = str(uuid.uuid4())
+        self.file_name = file_name
+        self.digest = digest
+        self.file_path = file_path
+        self.file_format = detect_format(file_name, file_path)
+        self.result = None # Summary entry, see ingest_batch
+
+def _is_archive_member(info):
+    """Regular files of an archive, without macOS resource forks and hidden files."""
+    name = os.path.basename(info.filename)
+    return not info.is_dir() and name and not name.startswith('.') and not info.filename.startswith('__MACOSX/')
+
+def _store_committed(store, stream):
+    """
+    Stores a stream's content like BlobStore.store, but commits the blob
+    reference on its own before the content is copied: the write lock is held
+    for one upsert, not for the copy. The reference is taken first so a
+    concurrent collect() cannot remove the blob while it is being written.
+    """
+    digest, size = store.hash_stream(stream)
+    path = store.acquire(digest, size)
+    db.session.commit()
+    return digest, path
+
+def release_blobs(store, digests):
+    """Drops committed blob references (one per digest) and collects the blobs. Commits."""
+    digests = list(digests)
+    for digest in digests:
+        store.release(digest)
+    db.session.commit()
+    store.collect(*digests)
+
+def save_batch_uploads(uploads, store, max_bytes):
+    """
+    Stores uploaded parts in the blob store and returns their BatchItems.
+    Parts named *.zip are expanded: each member becomes an item and the
+    archive itself is not kept. Each item's blob reference is committed in a
+    short transaction of its own (see _store_committed), so no write lock is
+    held while parts are hashed and copied; the caller must not have pending
+    changes.
+
+    On error the references taken so far are released and their blobs
+    collected.
+
+    Raises:
+        BatchTooLarge: If the expanded members exceed max_bytes in total.
+        zipfile.BadZipFile: If a *.zip part is not a valid archive.
+    """
+    items = []
+    taken = [] # digests whose reference is committed
+    expanded = 0
+
+    def add(file_name, stream):
+        digest, path = _store_committed(store, stream)
+        taken.append(digest)
+        store.ensure(digest, stream)
+        items.append(BatchItem(file_name, digest, path))
+
+    try:
+        for upload in uploads:
+            if not upload.filename.lower().endswith('.zip'):
+                add(secure_filename(upload.filename), upload.stream)
+                continue
+            # Members are streamed out of the spooled upload; the declared sizes
+            # are checked first so an archive bomb is rejected before extraction
+            with zipfile.ZipFile(upload.stream) as archive:
+                members = [info for info in archive.infolist() if _is_archive_member(info)]
+                expanded += sum(info.file_size for info in members)
+                if expanded > max_bytes:
+                    raise BatchTooLarge()
+                for info in members:
+                    with archive.open(info) as source:
+                        add(secure_filename(os.path.basename(info.filename)), source)
+    except Exception:
+        # Drop the references taken so far, and the blobs nothing else uses
+        db.session.rollback()
+        release_blobs(store, taken)
+        raise
+    return items
+
+def parse_saved_file(path, format_name, language_pair=None):
+    """
+    Reads and parses one stored upload; runs in the parse worker processes.
+
+    Returns:
+        (pairs, None) on success, ([], error message) otherwise.
+    """
+    file_format = get_format(format_name)
+    try:
+        pairs = list(iter_file_segments(path, file_format, language_pair=language_pair))
+    except UnicodeDecodeError:
+        return [], UNREADABLE_ERROR
+    except INVALID_FORMAT_ERRORS:
+        return [], file_format.invalid_message
+    return pairs, (None if pairs else file_format.empty_message)
+
+def get_parse_pool():
+    """
+    The app's process pool for parsing uploads (Config.PARSE_WORKERS
+    processes), created on first use; None when PARSE_WORKERS is 0.
+
+    Workers are never forked from the server process, whose other threads
+    (job workers, reaper, requests) may hold locks at fork time: they come
+    from a forkserver where available, otherwise they are spawned. Importing
+    the app module there only creates an app; its background threads start
+    with the first request (see jobs.init_job_queue).
+    """
+    workers = current_app.config['PARSE_WORKERS']
+    if not workers:
+        return None
+    if 'parse_pool' not in current_app.extensions:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        current_app.extensions['parse_pool'] = ProcessPoolExecutor(workers, mp_context=context)
+    return current_app.extensions['parse_pool']
+
+def _iter_parsed(items, store, language_pair):
+    """
+    (item, pairs, error) per item: first the items whose content was parsed
+    before (from the blob store's parse cache), then the others as parsing
+    finishes, in parallel when a pool is configured. Freshly parsed pairs are
+    written to the parse cache as they are consumed.
+    """
+    to_parse = []
+    for item in items:
+        cached = store.cached_pairs(item.digest, parse_cache_key(item.file_format, language_pair))
+        if cached is None:
+            to_parse.append(item)
+            continue
+        pairs = list(cached)
+        yield item, pairs, (None if pairs else item.file_format.empty_message)
+
+    def cache(item, pairs, error):
+        if error is not None:
+            return item, pairs, error
+        key = parse_cache_key(item.file_format, language_pair)
+        return item, store.caching_pairs(pairs, item.digest, key), None
+
+    pool = get_parse_pool()
+    if pool is None or len(to_parse) == 1:
+        for item in to_parse:
+            yield cache(item, *parse_saved_file(item.file_path, item.file_format.name, language_pair))
+        return
+    futures = {pool.submit(parse_saved_file, item.file_path, item.file_format.name, language_pair): item
+               for item in to_parse}
+    try:
+        for future in as_completed(futures):
+            yield cache(futures[future], *future.result())
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OOM killer); start a new pool next time
+        current_app.extensions.pop('parse_pool', None)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+def _import_item(project, project_id, item, pairs, language_pair):
+    """
+    Creates one parsed file with its segments and commits. The file's INSERT
+    opens the transaction (project is not reloaded), so it never upgrades a
+    stale read snapshot.
+
+    Returns:
+        (File, insert result, None), or (None, None, error message) after a rollback.
+    """
+    try:
+        new_file = File(id=item.id, file_name=item.file_name, file_path=item.file_path,
+                        upload_date=datetime.now(), project_id=project_id, completion_rate=0,
+                        file_format=item.file_format.name, blob_hash=item.digest)
+        db.session.add(new_file)
+        db.session.flush()
+        result = insert_segments(new_file.id, pairs, language_pair=language_pair)
+        new_file.apply_count_delta(result.segment_total, result.translated_total)
+        project.last_modified = datetime.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'批量上传导入文件出错 (File: {item.file_name}): {str(e)}')
+        return None, None, '导入文件失败'
+    return new_file, result, None
+
+def ingest_batch(project, items, store):
+    """
+    Parses the stored files of a batch upload in the parse pool (unless
+    their parse result is cached) and bulk inserts each parsed file into the
+    project as it arrives, committing file by file: the write lock is only
+    held while one file's segments are inserted, never while files are
+    parsed. Files that cannot be parsed or inserted release their blob
+    reference (and blob, unless shared) and are reported as failed.
+
+    If parsing itself breaks (e.g. BrokenProcessPool) the error propagates;
+    items without a result were not imported and still hold their reference.
+
+    Returns:
+        The created File objects; every item's result holds its summary entry.
+    """
+    created = []
+    project_id, language_pair = project.id, project.language_pair
+    # Parsing takes a while: end the read transaction that loaded the project
+    db.session.commit()
+    for item, pairs, error in _iter_parsed(items, store, language_pair):
+        if error is None:
+            new_file, result, error = _import_item(project, project_id, item, pairs, language_pair)
+        if error is not None:
+            release_blobs(store, [item.digest])
+            item.result = {'fileName': item.file_name, 'status': 'failed', 'error': error}
+            continue
+        created.append(new_file)
+        item.result = {'fileName': item.file_name, 'status': 'created', 'id': new_file.id,
+                       'segments': result.segment_total, 'prefilled': result.prefilled_total}
+    return created
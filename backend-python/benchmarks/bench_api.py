@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark of the projects/files blueprints through create_app().
+
+Generates synthetic projects (projects x files x segments, configurable text
+length), drives every route of projects_bp and files_bp with the Flask test
+client and reports per-route p50/p95/p99 latency, SQL statements per request,
+peak RSS and segments/second for upload and download. Results are written as
+JSON so runs can be compared across commits.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_api --files 4 --segments 20000 --output before.json
+    python -m benchmarks.bench_api --files 4 --segments 20000 --compare before.json
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import io
+import json
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def synthetic_document(segments, text_length, translated_ratio, rng):
+    """Builds an upload in the <seg><source><target> layout."""
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta', '&', '<tag>']
+    lines = []
+    for i in range(segments):
+        text = f'{i} '
+        while len(text) < text_length:
+            text += rng.choice(words) + ' '
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        target = f'T {text}' if rng.random() < translated_ratio else ''
+        lines.append(f'<seg>\n  <source>{text}</source>\n  <target>{target}</target>\n</seg>')
+    return '\n'.join(lines).encode('utf-8')
+
+class Recorder:
+    """Times test client calls and counts the SQL statements each one issues."""
+
+    def __init__(self, app, client, engine):
+        from sqlalchemy import event
+        self.app = app
+        self.client = client
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.covered = set()
+        self._statements = 0
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count_statement(*args):
+            self._statements += 1
+
+    def call(self, method, path, name=None, expect=(200,), **kwargs):
+        adapter = self.app.url_map.bind('localhost')
+        endpoint, _ = adapter.match(path.split('?')[0], method=method)
+        self.covered.add((endpoint, method))
+        name = name or f'{method} {endpoint}'
+
+        statements = self._statements
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        body = response.get_data() # drain streamed responses inside the timing
+        elapsed = time.perf_counter() - start
+        if response.status_code not in expect:
+            raise RuntimeError(f'{method} {path} -> {response.status_code}: {body[:200]!r}')
+
+        self.samples[name].append(elapsed * 1000)
+        self.queries[name].append(self._statements - statements)
+        return response, elapsed
+
+    def route_report(self):
+        report = {}
+        for name, values in sorted(self.samples.items()):
+            report[name] = {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.50), 3),
+                'p95_ms': round(percentile(values, 0.95), 3),
+                'p99_ms': round(percentile(values, 0.99), 3),
+                'queries': round(sum(self.queries[name]) / len(self.queries[name]), 1)
+            }
+        return report
+
+def run(args):
+    # Keep everything the app writes (database, uploads, caches) in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='bench_api_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+    if args.sqlite_profile:
+        os.environ['SQLITE_PROFILE'] = args.sqlite_profile
+
+    try:
+        import logging
+        from app import create_app
+        from config import Config
+        from models import db
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel(logging.WARNING)
+        client = app.test_client()
+        with app.app_context():
+            engine = db.engine
+        recorder = Recorder(app, client, engine)
+        rng = random.Random(args.seed)
+        throughput = {}
+        rss = {}
+
+        documents = [synthetic_document(args.segments, args.text_length, args.translated_ratio, rng)
+                     for _ in range(args.files)]
+
+        # --- create projects and upload files -------------------------------------
+        projects = {}
+        upload_time = 0.0
+        for p in range(args.projects):
+            response, _ = recorder.call('POST', '/api/projects', json={'name': f'bench {p}'}, expect=(201,))
+            project_id = response.get_json()['id']
+            projects[project_id] = []
+            for f, document in enumerate(documents):
+                response, elapsed = recorder.call(
+                    'POST', f'/api/projects/{project_id}/files', expect=(201,),
+                    data={'file': (io.BytesIO(document), f'bench-{f}.txt')},
+                    content_type='multipart/form-data')
+                upload_time += elapsed
+                projects[project_id].append(response.get_json()['id'])
+        uploaded = args.projects * args.files * args.segments
+        throughput['upload_segments_per_s'] = round(uploaded / upload_time)
+        rss['after_upload'] = round(peak_rss_mb(), 1)
+
+        # --- reads ------------------------------------------------------------------
+        download_time = 0.0
+        downloaded = 0
+        for _ in range(args.iterations):
+            recorder.call('GET', '/api/projects', name='GET projects.get_projects (summary)')
+            recorder.call('GET', '/api/projects?expand=files', name='GET projects.get_projects (expand=files)')
+            for project_id, file_ids in projects.items():
+                recorder.call('GET', f'/api/projects/{project_id}')
+                recorder.call('GET', f'/api/projects/{project_id}/files')
+                file_id = rng.choice(file_ids)
+                base = f'/api/projects/{project_id}/files/{file_id}'
+
+                response, _ = recorder.call('GET', base)
+                recorder.call('GET', base, name='GET files.get_project_file (304)', expect=(304,),
+                              headers={'If-None-Match': response.headers['ETag']})
+                recorder.call('GET', f'{base}/segments?limit=200', name='GET files.get_project_file_segments (first page)')
+                deep = max(args.segments - 400, 0)
+                recorder.call('GET', f'{base}/segments?after={deep}&limit=200',
+                              name='GET files.get_project_file_segments (deep page)')
+
+                # A PATCH bumps the revision so the next download renders from the database
+                indices = rng.sample(range(args.segments), min(args.patch_size, args.segments))
+                recorder.call('PATCH', base, json={str(i): f'edit {rng.random()}' for i in indices})
+
+                response, elapsed = recorder.call('GET', f'{base}/download',
+                                                  name='GET files.download_project_file (render)')
+                download_time += elapsed
+                downloaded += args.segments
+                recorder.call('GET', f'{base}/download', name='GET files.download_project_file (cached)')
+                recorder.call('GET', f'{base}/download', name='GET files.download_project_file (cached, gzip)',
+                              headers={'Accept-Encoding': 'gzip'})
+                recorder.call('GET', f'{base}/download', name='GET files.download_project_file (304)',
+                              expect=(304,), headers={'If-None-Match': response.headers['ETag']})
+        throughput['download_segments_per_s'] = round(downloaded / download_time) if download_time else None
+        rss['after_reads'] = round(peak_rss_mb(), 1)
+
+        # --- full writes ------------------------------------------------------------
+        for project_id, file_ids in projects.items():
+            recorder.call('PUT', f'/api/projects/{project_id}', json={'description': 'benchmarked'})
+            file_id = file_ids[0]
+            response, _ = recorder.call('GET', f'/api/projects/{project_id}/files/{file_id}')
+            translated = response.get_json()['translatedSegments']
+            recorder.call('PUT', f'/api/projects/{project_id}/files/{file_id}',
+                          json={'translatedSegments': [text or 'filled' for text in translated]})
+        rss['after_writes'] = round(peak_rss_mb(), 1)
+
+        # --- deletes ----------------------------------------------------------------
+        for project_id, file_ids in projects.items():
+            recorder.call('DELETE', f'/api/projects/{project_id}/files/{file_ids[-1]}')
+            recorder.call('DELETE', f'/api/projects/{project_id}')
+        rss['peak'] = round(peak_rss_mb(), 1)
+
+        # Every route of both blueprints should have been exercised
+        all_routes = {(rule.endpoint, method)
+                      for rule in app.url_map.iter_rules()
+                      if rule.endpoint.split('.')[0] in ('projects', 'files')
+                      for method in rule.methods - {'HEAD', 'OPTIONS'}}
+        uncovered = sorted(f'{method} {endpoint}' for endpoint, method in all_routes - recorder.covered)
+
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'params': vars(args) | {'output': None, 'compare': None}
+            },
+            'routes': recorder.route_report(),
+            'throughput': throughput,
+            'peak_rss_mb': rss,
+            'uncovered_routes': uncovered
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def print_report(result, baseline=None):
+    base_routes = baseline['routes'] if baseline else {}
+    print(f"{'route':<62} {'n':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'sql':>6}" + ('  p50 vs base' if baseline else ''))
+    for name, stats in result['routes'].items():
+        line = (f"{name:<62} {stats['count']:>4} {stats['p50_ms']:>8.2f}m {stats['p95_ms']:>8.2f}m "
+                f"{stats['p99_ms']:>8.2f}m {stats['queries']:>6}")
+        if name in base_routes and base_routes[name]['p50_ms']:
+            line += f"  {stats['p50_ms'] / base_routes[name]['p50_ms']:>6.2f}x"
+        print(line)
+    for key, value in result['throughput'].items():
+        base = baseline['throughput'].get(key) if baseline else None
+        print(f'{key}: {value}' + (f' (base {base})' if base else ''))
+    print(f"peak RSS (MB): {result['peak_rss_mb']}")
+    if result['uncovered_routes']:
+        print(f"routes not exercised: {', '.join(result['uncovered_routes'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--projects', type=int, default=2)
+    parser.add_argument('--files', type=int, default=3, help='files per project')
+    parser.add_argument('--segments', type=int, default=5000, help='segments per file')
+    parser.add_argument('--text-length', type=int, default=80, help='characters per source segment')
+    parser.add_argument('--translated-ratio', type=float, default=0.3)
+    parser.add_argument('--iterations', type=int, default=10, help='rounds of read requests')
+    parser.add_argument('--patch-size', type=int, default=10, help='segments changed per PATCH')
+    parser.add_argument('--sqlite-profile', default=None, help='override SQLITE_PROFILE')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--compare', help='baseline JSON from a previous run')
+    args = parser.parse_args()
+
+    result = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+if __name__ == '__main__':
+    main()
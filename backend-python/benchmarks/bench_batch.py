@@ -0,0 +1,110 @@
+"""
+Batch upload benchmark: POST /files/batch with a ZIP archive of synthetic
+files, through the test client, for different PARSE_WORKERS values.
+
+Parsing scales with the worker processes; the inserts are done by the
+request's single SQLite writer, so the speedup is bounded by the share of
+the time spent parsing. Compare with the parse-only time printed first.
+
+Meanwhile another client keeps PATCHing a segment of a different project;
+its slowest request shows how long the batch kept other writers waiting
+(files are committed one by one, so about one file's insert).
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_batch --files 200 --segments 2000 --workers 0,2,4
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import io
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from utils import parse_file_content
+
+def synthetic_file(number, segments):
+    parts = []
+    for i in range(segments):
+        target = f'Übersetzung {number}-{i}' if i % 3 == 0 else ''
+        parts.append(f'<seg>\n  <source>File {number}, sentence {i} of the manual.</source>\n'
+                     f'  <target>{target}</target>\n</seg>')
+    return '\n'.join(parts)
+
+def patch_loop(client, url, stop, latencies):
+    """PATCHes one segment until stop is set, recording (latency, status) per request."""
+    number = 0
+    while not stop.is_set():
+        number += 1
+        start = time.perf_counter()
+        response = client.patch(url, json={'0': f'edit {number}'})
+        latencies.append((time.perf_counter() - start, response.status_code))
+        time.sleep(0.05)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--segments', type=int, default=2000, help='segments per file')
+    parser.add_argument('--workers', default='0,2,4', help='comma-separated PARSE_WORKERS values to compare')
+    args = parser.parse_args()
+
+    contents = [synthetic_file(number, args.segments) for number in range(args.files)]
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+        for number, content in enumerate(contents):
+            z.writestr(f'files/file_{number}.txt', content)
+    archive = archive.getvalue()
+
+    start = time.perf_counter()
+    for content in contents:
+        parse_file_content(content)
+    print(f'{args.files} files x {args.segments} segments, archive {len(archive) / 1e6:.1f} MB; '
+          f'parsing alone, one process: {time.perf_counter() - start:.2f}s')
+
+    # Keep everything the app writes (database, uploads) in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='bench_batch_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        import logging
+        from app import create_app
+        from config import Config
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel(logging.WARNING)
+        client = app.test_client()
+        probe_project_id = client.post('/api/projects', json={'name': 'probe'}).get_json()['id']
+        probe_file_id = client.post(f'/api/projects/{probe_project_id}/files',
+                                    data={'file': (io.BytesIO(synthetic_file(0, 10).encode('utf-8')), 'probe.txt')},
+                                    content_type='multipart/form-data').get_json()['id']
+        probe_url = f'/api/projects/{probe_project_id}/files/{probe_file_id}'
+        for workers in (int(value) for value in args.workers.split(',')):
+            app.config['PARSE_WORKERS'] = workers
+            app.extensions.pop('parse_pool', None)
+            project_id = client.post('/api/projects', json={'name': f'bench {workers}'}).get_json()['id']
+            stop = threading.Event()
+            latencies = []
+            probe = threading.Thread(target=patch_loop, args=(app.test_client(), probe_url, stop, latencies))
+            probe.start()
+            start = time.perf_counter()
+            response = client.post(f'/api/projects/{project_id}/files/batch',
+                                   data={'files': (io.BytesIO(archive), 'batch.zip')},
+                                   content_type='multipart/form-data')
+            elapsed = time.perf_counter() - start
+            stop.set()
+            probe.join()
+            result = response.get_json()
+            failed = sum(1 for _, status in latencies if status != 200)
+            print(f'PARSE_WORKERS {workers:>2}: {result["created"]} files in {elapsed:.2f}s, '
+                  f'{args.files * args.segments / elapsed:,.0f} segments/s; concurrent PATCH slowest '
+                  f'{max((latency for latency, _ in latencies), default=0):.2f}s, {failed} failed')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
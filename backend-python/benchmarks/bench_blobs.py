@@ -0,0 +1,83 @@
+"""
+Blob store benchmark: uploading the same content into several projects.
+
+The first upload writes the blob and parses it (filling the parse cache);
+every later upload of the same bytes only hashes the request body and bulk
+inserts the cached pairs. Prints the time of the first and the later
+uploads, and the size of the blob store against the total uploaded.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_blobs --segments 100000 --projects 5 --format xliff
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import io
+import shutil
+import tempfile
+import time
+from formats import get_format
+
+LANGUAGE_PAIR = ('en', 'de')
+
+def synthetic_rows(count):
+    for i in range(count):
+        yield (f'Source sentence number {i} of the manual, with some more words in it.',
+               f'Übersetzung Nummer {i} des Handbuchs.' if i % 2 else '')
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=100000)
+    parser.add_argument('--projects', type=int, default=5, help='projects the same file is uploaded to')
+    parser.add_argument('--format', default='seg', help='format of the uploaded file')
+    args = parser.parse_args()
+
+    file_format = get_format(args.format)
+    if file_format.source_required:
+        parser.error(f'{args.format} cannot be generated from synthetic rows')
+    content = ''.join(file_format.write(synthetic_rows(args.segments), LANGUAGE_PAIR)).encode('utf-8')
+    file_name = f'bench{file_format.extensions[0]}'
+
+    # Keep everything the app writes (database, blobs) in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='bench_blobs_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        import logging
+        from app import create_app
+        from config import Config
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel(logging.WARNING)
+        client = app.test_client()
+        print(f'{args.segments} segments, {args.format}, {len(content) / 1e6:.1f} MB per upload')
+        for number in range(args.projects):
+            project_id = client.post('/api/projects', json={
+                'name': f'bench {number}', 'sourceLanguage': LANGUAGE_PAIR[0], 'targetLanguage': LANGUAGE_PAIR[1]
+            }).get_json()['id']
+            start = time.perf_counter()
+            response = client.post(f'/api/projects/{project_id}/files',
+                                   data={'file': (io.BytesIO(content), file_name)},
+                                   content_type='multipart/form-data')
+            elapsed = time.perf_counter() - start
+            if response.status_code != 201:
+                print(f'upload failed: {response.get_json()}')
+                return
+            label = 'first upload (write + parse)' if number == 0 else f'upload {number + 1} (cached)'
+            print(f'{label:>30}: {elapsed:6.2f}s, {args.segments / elapsed:>9,.0f} segments/s')
+        stored = directory_size(app.config['BLOB_STORE_DIR'])
+        print(f'blob store {stored / 1e6:.1f} MB (blob + parse cache) for '
+              f'{args.projects * len(content) / 1e6:.1f} MB uploaded')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
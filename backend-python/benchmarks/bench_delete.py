@@ -0,0 +1,141 @@
+"""
+Project deletion benchmark: the ORM cascade the API used to run against
+DELETE /api/projects/<id>, which removes rows with set-based statements and
+leaves the segments to the background reaper.
+
+Two identical projects of --files files with --segments segments each are
+created directly in the database. One is deleted with db.session.delete()
+(loading and deleting every segment object), the other through the test
+client, which the background reaper follows by purging the segments in
+batches. Meanwhile a probe thread keeps updating a segment of a third
+project; its slowest write shows how long other writers waited for SQLite's
+lock (writes failing with "database is locked" after the busy timeout are
+counted).
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_delete --files 20 --segments 20000
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+def synthetic_pairs(number, count):
+    for i in range(count):
+        yield (f'File {number}, sentence {i} of the manual, with some more words in it.',
+               f'Datei {number}, Satz {i} des Handbuchs.' if i % 2 else '')
+
+class WriteProbe:
+    """Thread updating one segment in a loop, recording the slowest write."""
+
+    def __init__(self, app, segment_id):
+        self.app = app
+        self.segment_id = segment_id
+        self.slowest = 0.0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        line = f'slowest concurrent write {self.slowest:6.2f}s'
+        return line + f', {self.failed} failed' if self.failed else line
+
+    def _run(self):
+        from sqlalchemy.exc import OperationalError
+        from models import db, Segment
+        table = Segment.__table__
+        with self.app.app_context():
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    db.session.execute(table.update().where(table.c.id == self.segment_id)
+                                       .values(translated_text=str(start)))
+                    db.session.commit()
+                except OperationalError:
+                    db.session.rollback()
+                    self.failed += 1
+                self.slowest = max(self.slowest, time.perf_counter() - start)
+                time.sleep(0.01)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--segments', type=int, default=20000, help='segments per file')
+    args = parser.parse_args()
+
+    # Keep everything the app writes (database, trash) in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='bench_delete_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        import logging
+        from app import create_app
+        from config import Config
+        from models import db, Project, File, Segment, DeletedFile
+        from ingest import insert_segments
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        def create_project(name, files):
+            project = Project(id=str(uuid.uuid4()), name=name, source_language='en', target_language='de')
+            db.session.add(project)
+            for number in range(files):
+                file = File(id=str(uuid.uuid4()), file_name=f'file_{number}.txt', file_path='', project=project)
+                db.session.add(file)
+                db.session.flush()
+                result = insert_segments(file.id, synthetic_pairs(number, args.segments))
+                file.apply_count_delta(result.segment_total, result.translated_total)
+            db.session.commit()
+            return project.id
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel(logging.WARNING)
+        with app.app_context():
+            orm_project_id = create_project('orm', args.files)
+            api_project_id = create_project('api', args.files)
+            probe_project_id = create_project('probe', 1)
+            probe_segment_id = (db.session.query(Segment.id).join(File)
+                                .filter(File.project_id == probe_project_id).first()[0])
+        print(f'{args.files} files x {args.segments} segments per project')
+
+        with app.app_context(), WriteProbe(app, probe_segment_id) as probe:
+            start = time.perf_counter()
+            db.session.delete(db.session.get(Project, orm_project_id))
+            db.session.commit()
+            elapsed = time.perf_counter() - start
+        print(f'{"ORM cascade":>24}: {elapsed:7.2f}s, {probe.report()}')
+
+        client = app.test_client()
+        with app.app_context(), WriteProbe(app, probe_segment_id) as probe:
+            start = time.perf_counter()
+            response = client.delete(f'/api/projects/{api_project_id}')
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                print(f'delete failed: {response.get_json()}')
+                return
+            print(f'{"DELETE request":>24}: {elapsed:7.2f}s')
+            # The request woke the reaper: wait for its tombstones to disappear
+            while db.session.query(DeletedFile.file_id).first() is not None:
+                db.session.rollback()
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+        print(f'{"reaper done after":>24}: {elapsed:7.2f}s, {probe.report()}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+File format benchmark: streaming write and read throughput of every
+registered format, without the database.
+
+For each format, --segments synthetic rows are written to a temporary file
+with the format's writer and read back with its reader; the pairs read must
+equal the pairs written. Formats that merge exports into the uploaded
+document are written into a generated source document of theirs, and small
+hand-written XLIFF and PO files (ids, contexts, plurals, inline markup) are
+checked to come back with only their targets changed. With --memory the
+peak Python allocation of each read is traced as well (slower), which stays
+flat as --segments grows.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_formats --segments 200000 --formats xliff,tmx,po,srt,seg
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+from formats import FORMATS, get_format, iter_file_segments
+
+LANGUAGE_PAIR = ('en', 'de')
+
+def synthetic_rows(count):
+    for i in range(count):
+        yield (f'Source sentence number {i} of the manual, with <markup> & entities.',
+               f'Übersetzung Nummer {i} des Handbuchs.' if i % 2 else '')
+
+def write_srt_source(path, count):
+    """SRT source document whose blocks carry the synthetic source texts."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, (original, _) in enumerate(synthetic_rows(count)):
+            seconds = i * 2
+            f.write(f'{i + 1}\n00:{seconds // 60 % 60:02d}:{seconds % 60:02d},000 --> '
+                    f'00:{seconds // 60 % 60:02d}:{seconds % 60:02d},900\n{original}\n\n')
+
+def write_source(path, file_format, count):
+    """Uploaded document an export of file_format merges into, holding the synthetic source texts."""
+    if file_format.name == 'srt':
+        write_srt_source(path, count)
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        for piece in file_format.write(((original, '') for original, _ in synthetic_rows(count)), LANGUAGE_PAIR):
+            f.write(piece)
+
+# (format, uploaded document, translations in segment order, expected export)
+MERGE_CASES = [
+    ('po', """# UI strings
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+
+msgctxt "menu"
+msgid "Open"
+msgstr ""
+
+msgctxt "status"
+msgid "Open"
+msgstr ""
+
+#, fuzzy, c-format
+msgid "%d file"
+msgid_plural "%d files"
+msgstr[0] "%d Datei"
+msgstr[1] "%d Dateien"
+""", ['Öffnen', 'Geöffnet', '%d Datei'], """# UI strings
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+
+msgctxt "menu"
+msgid "Open"
+msgstr "Öffnen"
+
+msgctxt "status"
+msgid "Open"
+msgstr "Geöffnet"
+
+#, c-format
+msgid "%d file"
+msgid_plural "%d files"
+msgstr[0] "%d Datei"
+msgstr[1] "%d Dateien"
+"""),
+    ('xliff', """<?xml version="1.0" encoding="UTF-8"?>
+<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">
+  <file original="ui.properties" source-language="en" target-language="de" datatype="plaintext">
+    <body>
+      <trans-unit id="btn.save">
+        <source>Save <g id="1">all</g> files<x id="2"/></source>
+        <note>Toolbar button</note>
+      </trans-unit>
+      <trans-unit id="btn.keep">
+        <source>Keep <ph id="1">{0}</ph></source>
+        <target state="translated">Behalten <ph id="1">{0}</ph></target>
+      </trans-unit>
+      <trans-unit id="btn.close">
+        <source>Close</source>
+        <target state="new"/>
+      </trans-unit>
+    </body>
+  </file>
+</xliff>
+""", ['Alle Dateien speichern', 'Behalten {0}', 'Schließen & beenden'], """<?xml version="1.0" encoding="UTF-8"?>
+<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">
+  <file original="ui.properties" source-language="en" target-language="de" datatype="plaintext">
+    <body>
+      <trans-unit id="btn.save">
+        <source>Save <g id="1">all</g> files<x id="2"/></source>
+        <target>Alle Dateien speichern</target>
+        <note>Toolbar button</note>
+      </trans-unit>
+      <trans-unit id="btn.keep">
+        <source>Keep <ph id="1">{0}</ph></source>
+        <target state="translated">Behalten <ph id="1">{0}</ph></target>
+      </trans-unit>
+      <trans-unit id="btn.close">
+        <source>Close</source>
+        <target state="new">Schließen &amp; beenden</target>
+      </trans-unit>
+    </body>
+  </file>
+</xliff>
+"""),
+]
+
+def check_merges(work_dir):
+    """Exports each MERGE_CASES document with its translations; prints what does not match."""
+    for name, document, translations, expected in MERGE_CASES:
+        file_format = get_format(name)
+        path = os.path.join(work_dir, f'merge{file_format.extensions[0]}')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(document)
+        sources = [original for original, _ in iter_file_segments(path, file_format)]
+        merged = ''.join(file_format.write(zip(sources, translations), LANGUAGE_PAIR, path))
+        if merged != expected:
+            print(f'{name}: merged export differs from the expected document')
+
+def expected_pairs(file_format, count):
+    # SRT holds no translations: the export writes them in place of the source text
+    if file_format.name == 'srt':
+        return [(translated or original, '') for original, translated in synthetic_rows(count)]
+    return list(synthetic_rows(count))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=200000)
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated format names')
+    parser.add_argument('--memory', action='store_true', help='trace peak memory of the readers')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_formats_')
+    try:
+        check_merges(work_dir)
+        for name in args.formats.split(','):
+            file_format = get_format(name)
+            path = os.path.join(work_dir, f'bench{file_format.extensions[0]}')
+            source_path = None
+            if file_format.needs_source:
+                source_path = os.path.join(work_dir, f'source{file_format.extensions[0]}')
+                write_source(source_path, file_format, args.segments)
+
+            start = time.perf_counter()
+            with open(path, 'w', encoding='utf-8') as f:
+                for piece in file_format.write(synthetic_rows(args.segments), LANGUAGE_PAIR, source_path):
+                    f.write(piece)
+            write_time = time.perf_counter() - start
+            size = os.path.getsize(path)
+
+            if args.memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            pairs = list(iter_file_segments(path, file_format, language_pair=LANGUAGE_PAIR)) \
+                if not args.memory else None
+            if args.memory:
+                count = sum(1 for _ in iter_file_segments(path, file_format, language_pair=LANGUAGE_PAIR))
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            read_time = time.perf_counter() - start
+
+            if pairs is not None:
+                count = len(pairs)
+                if pairs != expected_pairs(file_format, args.segments):
+                    print(f'{name}: round trip mismatch')
+            line = (f'{name:>6}: {size / 1e6:7.1f} MB, write {args.segments / write_time:>9,.0f} seg/s '
+                    f'({size / 1e6 / write_time:6.1f} MB/s), read {count / read_time:>9,.0f} seg/s '
+                    f'({size / 1e6 / read_time:6.1f} MB/s)')
+            if args.memory:
+                line += f', read peak {peak / 1e6:.1f} MB'
+            print(line)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
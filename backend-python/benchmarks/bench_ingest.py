@@ -0,0 +1,87 @@
+"""
+Segment ingestion benchmark: ORM unit of work vs. ingest.insert_segments.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_ingest --segments 200000 --chunk-size 5000
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import time
+import uuid
+from models import db, Project, File, Segment
+from ingest import insert_segments
+
+def synthetic_pairs(count, text_length):
+    """Yields (source, target) pairs; every other segment is translated."""
+    padding = 'x' * max(text_length - 20, 0)
+    for i in range(count):
+        yield f'Source {i} {padding}', (f'Target {i} {padding}' if i % 2 == 0 else '')
+
+def orm_insert(file_id, pairs):
+    """The previous upload path: one Segment object per pair and add_all."""
+    segments = [Segment(file_id=file_id, segment_index=index, original_text=source, translated_text=target)
+                for index, (source, target) in enumerate(pairs)]
+    db.session.add_all(segments)
+    db.session.flush()
+    return len(segments)
+
+def core_insert(file_id, pairs, chunk_size):
+    return insert_segments(file_id, pairs, chunk_size=chunk_size).segment_total
+
+def run_once(method, args):
+    project = Project(id=str(uuid.uuid4()), name='bench')
+    file = File(id=str(uuid.uuid4()), file_name='bench.txt', file_path='', project=project)
+    db.session.add_all([project, file])
+    db.session.flush()
+
+    pairs = synthetic_pairs(args.segments, args.text_length)
+    start = time.perf_counter()
+    if method == 'orm':
+        inserted = orm_insert(file.id, pairs)
+    else:
+        inserted = core_insert(file.id, pairs, args.chunk_size)
+    db.session.commit()
+    elapsed = time.perf_counter() - start
+    db.session.expunge_all()
+    return inserted, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=100000)
+    parser.add_argument('--text-length', type=int, default=80)
+    parser.add_argument('--chunk-size', type=int, help='segments per insert (default: SEGMENT_INSERT_CHUNK_SIZE)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--methods', default='orm,core')
+    args = parser.parse_args()
+
+    # Keep everything the app writes in a scratch directory; set before app.py is
+    # imported, since importing it creates an app with the default configuration
+    work_dir = tempfile.mkdtemp(prefix='bench_ingest_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        from app import create_app
+        from config import Config
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        args.chunk_size = args.chunk_size or Config.SEGMENT_INSERT_CHUNK_SIZE
+        app = create_app(BenchConfig)
+        with app.app_context():
+            for method in args.methods.split(','):
+                best = None
+                for _ in range(args.repeat):
+                    inserted, elapsed = run_once(method, args)
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f'{method:>5}: {inserted} segments, best {best:.3f}s, '
+                      f'{inserted / best:,.0f} segments/s')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
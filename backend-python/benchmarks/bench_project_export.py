@@ -0,0 +1,101 @@
+"""
+Project archive benchmark: GET /api/projects/<id>/export against downloading
+every file separately, through the test client.
+
+A project of --files files with --segments segments each is created
+directly in the database. The archive is read chunk by chunk as a client
+would, for each PROJECT_EXPORT_WORKERS value; with --memory the peak Python
+allocation while streaming is traced as well (slower), which is bounded by
+the workers' queues, not by the number or size of the files.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_project_export --files 500 --segments 200 --workers 0,2,4
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+def synthetic_pairs(number, count):
+    for i in range(count):
+        yield (f'File {number}, sentence {i} of the manual, with some more words in it.',
+               f'Datei {number}, Satz {i} des Handbuchs.' if i % 2 else '')
+
+def read_all(client, url):
+    """Total bytes of a streamed response."""
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--segments', type=int, default=200, help='segments per file')
+    parser.add_argument('--workers', default='0,2,4', help='comma-separated PROJECT_EXPORT_WORKERS values to compare')
+    parser.add_argument('--memory', action='store_true', help='trace peak memory while streaming the archive')
+    args = parser.parse_args()
+
+    # Keep everything the app writes (database, export cache) in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='bench_project_export_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        import logging
+        from app import create_app
+        from config import Config
+        from models import db, Project, File
+        from ingest import insert_segments
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel(logging.WARNING)
+        with app.app_context():
+            project = Project(id=str(uuid.uuid4()), name='bench', source_language='en', target_language='de')
+            db.session.add(project)
+            file_ids = []
+            for number in range(args.files):
+                file = File(id=str(uuid.uuid4()), file_name=f'file_{number}.txt', file_path='', project=project)
+                db.session.add(file)
+                db.session.flush()
+                result = insert_segments(file.id, synthetic_pairs(number, args.segments))
+                file.apply_count_delta(result.segment_total, result.translated_total)
+                file_ids.append(file.id)
+            db.session.commit()
+            project_id = project.id
+
+        client = app.test_client()
+        print(f'{args.files} files x {args.segments} segments')
+        start = time.perf_counter()
+        total = sum(read_all(client, f'/api/projects/{project_id}/files/{file_id}/download')
+                    for file_id in file_ids)
+        print(f'{"one download per file":>28}: {time.perf_counter() - start:6.2f}s, {total / 1e6:7.1f} MB (text)')
+        # The downloads filled the export cache: clear it so the archives render from the database
+        shutil.rmtree(app.config['EXPORT_CACHE_DIR'])
+        os.makedirs(app.config['EXPORT_CACHE_DIR'])
+
+        for workers in (int(value) for value in args.workers.split(',')):
+            app.config['PROJECT_EXPORT_WORKERS'] = workers
+            if args.memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            size = read_all(client, f'/api/projects/{project_id}/export')
+            elapsed = time.perf_counter() - start
+            line = f'{f"archive, {workers} workers":>28}: {elapsed:6.2f}s, {size / 1e6:7.1f} MB (zip)'
+            if args.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                line += f', peak {peak / 1e6:.1f} MB'
+            print(line)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
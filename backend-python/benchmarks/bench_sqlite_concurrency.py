@@ -0,0 +1,137 @@
+"""
+Reader latency while a writer holds long write transactions, per SQLite profile.
+
+A writer thread repeatedly rewrites a large block of segments and keeps its
+transaction open for --hold-ms before committing; reader threads meanwhile page
+through the segment table. Under the rollback journal ('default') readers stall
+or fail with "database is locked" while the writer holds its lock; under WAL
+('development'/'production') they keep reading the last committed snapshot.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_sqlite_concurrency --profiles default,production
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from sqlalchemy.exc import OperationalError
+from models import db, Project, File, Segment
+from ingest import insert_segments
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def seed(segments):
+    project = Project(id=str(uuid.uuid4()), name='bench')
+    file = File(id=str(uuid.uuid4()), file_name='bench.txt', file_path='', project=project)
+    db.session.add_all([project, file])
+    db.session.flush()
+    insert_segments(file.id, ((f'Source sentence {i} ' + 'x' * 60, '') for i in range(segments)))
+    db.session.commit()
+    return file.id
+
+def writer(app, file_id, args, stop, stats):
+    table = Segment.__table__
+    with app.app_context():
+        round_no = 0
+        while not stop.is_set():
+            round_no += 1
+            try:
+                db.session.execute(table.update()
+                                   .where(table.c.file_id == file_id,
+                                          table.c.segment_index < args.write_rows)
+                                   .values(translated_text=f'round {round_no} ' + 'y' * 60))
+                time.sleep(args.hold_ms / 1000)
+                db.session.commit()
+                stats['writes'] += 1
+            except OperationalError:
+                db.session.rollback()
+                stats['write_errors'] += 1
+
+def reader(app, file_id, args, stop, latencies, stats):
+    with app.app_context():
+        after = -1
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                rows = (db.session.query(Segment.segment_index, Segment.translated_text)
+                        .filter(Segment.file_id == file_id, Segment.segment_index > after)
+                        .order_by(Segment.segment_index)
+                        .limit(200)
+                        .all())
+                db.session.commit() # end the read transaction
+                latencies.append((time.perf_counter() - start) * 1000)
+                after = rows[-1][0] if len(rows) == 200 else -1
+            except OperationalError:
+                db.session.rollback()
+                stats['read_errors'] += 1
+
+def run_profile(profile, args, data_dir):
+    from app import create_app
+    from config import Config
+
+    work_dir = tempfile.mkdtemp(prefix=f'{profile}_', dir=data_dir)
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+        SQLITE_PROFILE = profile
+        # Readers give up quickly instead of waiting out pysqlite's default 5s timeout
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': args.reader_timeout}}
+
+    try:
+        app = create_app(BenchConfig)
+        with app.app_context():
+            file_id = seed(args.segments)
+
+        stop = threading.Event()
+        latencies = []
+        stats = {'writes': 0, 'write_errors': 0, 'read_errors': 0}
+        threads = [threading.Thread(target=writer, args=(app, file_id, args, stop, stats))]
+        threads += [threading.Thread(target=reader, args=(app, file_id, args, stop, latencies, stats))
+                    for _ in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            db.engine.dispose()
+
+        print(f'{profile:>12}: {len(latencies)} reads, p50 {percentile(latencies, 0.5):.2f}ms, '
+              f'p99 {percentile(latencies, 0.99):.2f}ms, max {max(latencies, default=float("nan")):.2f}ms, '
+              f'read errors {stats["read_errors"]}, writes {stats["writes"]}, write errors {stats["write_errors"]}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='default,production')
+    parser.add_argument('--segments', type=int, default=100000)
+    parser.add_argument('--write-rows', type=int, default=50000, help='rows rewritten per write transaction')
+    parser.add_argument('--hold-ms', type=int, default=200, help='time the writer keeps its transaction open')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds')
+    parser.add_argument('--reader-timeout', type=float, default=1.0, help='sqlite busy timeout for the test, seconds')
+    args = parser.parse_args()
+
+    # Keep everything the app writes in a scratch directory; set before app.py is
+    # imported, since importing it creates an app with the default configuration
+    data_dir = tempfile.mkdtemp(prefix='bench_sqlite_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = data_dir
+    try:
+        for profile in args.profiles.split(','):
+            run_profile(profile, args, data_dir)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Resumable upload benchmark: several clients sending large files in chunks
+at the same time, through the test client.
+
+Each client creates an upload session and PUTs its file in --chunk-size
+byte ranges; the uploads are then completed with ?async=1. Request bodies
+are fed to the app from streams that read the in-memory documents piece by
+piece, so the peak traced while receiving is the memory the server side
+needs, which stays at a few read buffers per concurrent request whatever
+the file or chunk size.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_uploads --size-mb 64 --clients 4 --chunk-size-mb 8
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+class SliceReader:
+    """Readable stream over document[start:end] that never copies more than a read's worth."""
+
+    def __init__(self, document, start, end):
+        self.view = memoryview(document)
+        self.position = start
+        self.end = end
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.end - self.position
+        data = self.view[self.position:min(self.position + size, self.end)].tobytes()
+        self.position += len(data)
+        return data
+
+    # The test client measures the body by seeking to its end
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        self.position = offset if whence == 0 else self.end + offset
+        return self.position
+
+def synthetic_document(size, number):
+    """A seg document of about size bytes."""
+    pieces = []
+    total = 0
+    i = 0
+    while total < size:
+        piece = (f'<seg>\n  <source>Client {number}, sentence {i} of a long manual.</source>\n'
+                 f'  <target></target>\n</seg>\n').encode('utf-8')
+        pieces.append(piece)
+        total += len(piece)
+        i += 1
+    return b''.join(pieces)
+
+def send(client, project_id, document, chunk_size, upload_ids):
+    """Creates a session and PUTs the document in chunks."""
+    base = f'/api/projects/{project_id}/uploads'
+    size = len(document)
+    upload_id = client.post(base, json={'fileName': 'large.txt', 'size': size}).get_json()['id']
+    for offset in range(0, size, chunk_size):
+        end = min(offset + chunk_size, size)
+        response = client.put(f'{base}/{upload_id}', input_stream=SliceReader(document, offset, end),
+                              content_length=end - offset,
+                              headers={'Content-Range': f'bytes {offset}-{end - 1}/{size}'})
+        assert response.status_code == 200, response.get_json()
+    upload_ids.append(upload_id)
+
+def complete(client, project_id, upload_id):
+    """Completes an upload with ?async=1 (large files are imported by a background job) and waits for the job."""
+    response = client.post(f'/api/projects/{project_id}/uploads/{upload_id}/complete', query_string={'async': '1'})
+    assert response.status_code == 202, response.get_json()
+    job_url = response.headers['Location']
+    while client.get(job_url).get_json()['status'] in ('queued', 'running'):
+        time.sleep(0.1)
+    return client.get(job_url).get_json()['status'] == 'succeeded'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=64)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--chunk-size-mb', type=float, default=8)
+    args = parser.parse_args()
+
+    # Keep everything the app writes (database, sessions, blobs) in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='bench_uploads_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        import logging
+        from app import create_app
+        from config import Config
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel(logging.WARNING)
+        client = app.test_client()
+        project_id = client.post('/api/projects', json={'name': 'bench'}).get_json()['id']
+        documents = [synthetic_document(int(args.size_mb * 1e6), number) for number in range(args.clients)]
+        chunk_size = int(args.chunk_size_mb * 1e6)
+
+        upload_ids = []
+        threads = [threading.Thread(target=send, args=(app.test_client(), project_id, document, chunk_size, upload_ids))
+                   for document in documents]
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sent = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if len(upload_ids) != args.clients:
+            print('some uploads failed')
+            return
+        total = sum(len(document) for document in documents)
+        print(f'{args.clients} clients x {args.size_mb:g} MB in {args.chunk_size_mb:g} MB chunks: '
+              f'sent in {sent:.2f}s ({total / 1e6 / sent:.0f} MB/s, traced)')
+        print(f'server-side peak memory above baseline while receiving: {(peak - baseline) / 1e6:.1f} MB')
+
+        start = time.perf_counter()
+        imported = sum(complete(client, project_id, upload_id) for upload_id in upload_ids)
+        print(f'{imported} files completed and imported in {time.perf_counter() - start:.2f}s')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
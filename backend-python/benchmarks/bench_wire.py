@@ -0,0 +1,109 @@
+"""
+Wire format benchmark: time to first byte and total time of the file
+content endpoints.
+
+Compares the previous path (Segment objects from File.segments, encoded by
+Flask's standard jsonify) with the JSON, columnar and NDJSON formats of
+GET /files/<id> and /files/<id>/segments, through the test client. For
+streamed responses the first byte arrives with the first chunk, before the
+rest of the cursor has been read.
+
+Usage (from backend-python/):
+    python -m benchmarks.bench_wire --segments 100000 --repeat 3
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import tempfile
+import time
+import uuid
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from models import db, Project, File, Segment
+from ingest import insert_segments
+from wire import orjson
+
+def synthetic_pairs(count):
+    for i in range(count):
+        yield (f'Source sentence number {i} of the manual, with some more words in it.',
+               f'Übersetzung Nummer {i} des Handbuchs.' if i % 2 else '')
+
+def legacy_file_json(file_id):
+    """The endpoint as it was: ORM objects per segment, standard library encoder."""
+    file = db.session.get(File, file_id)
+    data = file.to_dict(include_segments=False)
+    ordered_segments = file.segments.order_by(Segment.segment_index).all()
+    data['originalSegments'] = [seg.original_text for seg in ordered_segments]
+    data['translatedSegments'] = [seg.translated_text for seg in ordered_segments]
+    return DefaultJSONProvider(current_app._get_current_object()).response(data)
+
+def measure(client, url, repeat):
+    """Best (time to first byte, total time, body size) over repeat requests."""
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        response = client.get(url, buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks, b''))
+        first_byte = time.perf_counter() - start
+        for chunk in chunks:
+            size += len(chunk)
+        total = time.perf_counter() - start
+        response.close()
+        if best is None or total < best[1]:
+            best = (first_byte, total, size)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Keep everything the app writes in a scratch directory; set before app.py is
+    # imported, since importing it creates an app with the default configuration
+    work_dir = tempfile.mkdtemp(prefix='bench_wire_')
+    os.environ['AUTO_TRANSLATE_DATA_DIR'] = work_dir
+
+    try:
+        from app import create_app
+        from config import Config
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(work_dir, "bench.sqlite")}'
+
+        app = create_app(BenchConfig)
+        app.add_url_rule('/bench/legacy/<file_id>', 'bench_legacy', legacy_file_json)
+        with app.app_context():
+            project = Project(id=str(uuid.uuid4()), name='bench')
+            file = File(id=str(uuid.uuid4()), file_name='bench.txt', file_path='', project=project)
+            db.session.add_all([project, file])
+            db.session.flush()
+            result = insert_segments(file.id, synthetic_pairs(args.segments))
+            file.apply_count_delta(result.segment_total, result.translated_total)
+            db.session.commit()
+            base = f'/api/projects/{project.id}/files/{file.id}'
+
+        print(f'{args.segments} segments, JSON encoder: {"orjson" if orjson is not None else "json (orjson not installed)"}')
+        cases = [
+            ('file, previous jsonify', f'/bench/legacy/{file.id}'),
+            ('file, json', base),
+            ('file, ndjson', f'{base}?format=ndjson'),
+            ('segments, json (1000)', f'{base}/segments?limit=1000'),
+            ('segments, columns (1000)', f'{base}/segments?limit=1000&format=columns'),
+            ('segments, ndjson (all)', f'{base}/segments?format=ndjson'),
+        ]
+        client = app.test_client()
+        with app.app_context():
+            for label, url in cases:
+                first_byte, total, size = measure(client, url, args.repeat)
+                print(f'{label:>26}: first byte {first_byte * 1000:8.1f} ms, '
+                      f'total {total * 1000:8.1f} ms, {size / 1e6:7.2f} MB')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
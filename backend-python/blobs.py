@@ -0,0 +1,275 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Blob, File
+from formats import iter_file_segments
+from utils import READ_CHUNK_SIZE
+
+# Bump when a reader changes what it yields, so older parse results are not reused
+PARSE_CACHE_VERSION = 1
+# Temporary files older than this (seconds) are left over from crashed writes,
+# and so are references acquired longer ago without a File row (see sweep)
+STALE_TEMP_SECONDS = 3600
+
+class BlobStore:
+    """
+    Content-addressed store of uploaded files.
+
+    Each distinct upload is kept once, as <root>/<sha[:2]>/<sha>, and counted
+    by a Blob row: every File that uses it holds one reference, and so does a
+    batch upload between storing the file and committing its File row (see
+    batch.save_batch_uploads). Next to a blob, the (source, target) pairs parsed out of it are cached as gzipped
+    JSON lines named <sha>.<parse key>.pairs.gz, so uploading known content
+    again skips both writing and parsing it.
+
+    A reference is taken (acquire) before a blob is written and dropped
+    (release) in the transaction that deletes its File; once that commits,
+    collect() removes unreferenced blobs. Both take SQLite's write lock, so a
+    blob is never removed while another upload is taking a reference to it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def parse_cache_path(self, digest, key):
+        return os.path.join(self.root, digest[:2], f'{digest}.{key}.pairs.gz')
+
+    def hash_stream(self, stream):
+        """(SHA-256 hex digest, size) of a binary stream, read from its current position; rewinds it."""
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+        stream.seek(0)
+        return digest.hexdigest(), size
+
+    def acquire(self, digest, size, count=1):
+        """Adds count references to a blob, creating its row; returns the blob's path. The caller commits."""
+        now = datetime.utcnow()
+        statement = sqlite_insert(Blob.__table__).values(
+            sha256=digest, size=size, ref_count=count, created_at=now, acquired_at=now)
+        statement = statement.on_conflict_do_update(
+            index_elements=['sha256'],
+            set_={'ref_count': Blob.__table__.c.ref_count + count, 'acquired_at': now}
+        )
+        db.session.execute(statement)
+        return self.path_for(digest)
+
+    def release(self, digest, count=1):
+        """Drops count references to a blob; call collect() after committing."""
+        table = Blob.__table__
+        db.session.execute(table.update().where(table.c.sha256 == digest)
+                           .values(ref_count=table.c.ref_count - count))
+
+    def ensure(self, digest, stream):
+        """
+        Writes a blob from a binary stream unless it is already stored.
+
+        Returns:
+            True if the blob was written, False if it existed.
+        """
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, READ_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return True
+
+    def store(self, stream):
+        """
+        Stores the content of a seekable binary stream (e.g. an upload's
+        spooled file or an archive member), taking one reference.
+
+        Returns:
+            (digest, path of the blob).
+        """
+        digest, size = self.hash_stream(stream)
+        path = self.acquire(digest, size)
+        self.ensure(digest, stream)
+        return digest, path
+
+    def adopt(self, path, digest, size):
+        """
+        Moves a complete file (digest and size computed by the caller) into
+        the store, taking one reference; if the content is already stored the
+        file is removed instead.
+
+        Returns:
+            The path of the blob.
+        """
+        blob_path = self.acquire(digest, size)
+        if os.path.exists(blob_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            shutil.move(path, blob_path) # a rename unless the upload directory is on another device
+        return blob_path
+
+    def collect(self, *digests):
+        """
+        Removes the given blobs if nothing references them any more: rows
+        whose count dropped to zero, and files whose row was never committed
+        (a failed upload). Commits.
+        """
+        table = Blob.__table__
+        digests = set(digests)
+        if not digests:
+            return 0
+        db.session.execute(table.delete().where(table.c.sha256.in_(digests)).where(table.c.ref_count <= 0))
+        referenced = {digest for (digest,) in db.session.query(Blob.sha256).filter(Blob.sha256.in_(digests))}
+        # The files go while the write lock is still held: nobody can acquire them meanwhile
+        removed = digests - referenced
+        for digest in removed:
+            self._remove_files(digest)
+        db.session.commit()
+        return len(removed)
+
+    def _remove_files(self, digest):
+        directory = os.path.join(self.root, digest[:2])
+        if not os.path.isdir(directory):
+            return
+        for entry in os.scandir(directory):
+            if entry.name == digest or entry.name.startswith(f'{digest}.'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def cached_pairs(self, digest, key):
+        """Iterator over the cached parse result of a blob, or None if it has not been parsed with key yet."""
+        path = self.parse_cache_path(digest, key)
+        if not os.path.exists(path):
+            return None
+        return self._read_pairs(path)
+
+    def _read_pairs(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                source_text, target_text = json.loads(line)
+                yield source_text, target_text
+
+    def caching_pairs(self, pairs, digest, key):
+        """
+        Passes parsed pairs through while writing them to the blob's parse
+        cache. The entry is published only if the pairs are consumed to the
+        end, so a document that fails to parse leaves nothing behind.
+        """
+        path = self.parse_cache_path(digest, key)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        completed = False
+        try:
+            # Level 1: the entry is written while the upload is being ingested
+            with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=1) as f:
+                for pair in pairs:
+                    f.write(json.dumps(pair, ensure_ascii=False))
+                    f.write('\n')
+                    yield pair
+            os.replace(temp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def iter_segments(self, digest, file_format, language_pair=None):
+        """
+        (source, target) pairs of a stored upload: from the parse cache if
+        the blob was parsed before, else read from the blob with the format's
+        reader and cached on the way through.
+
+        Raises:
+            The reader's errors, see formats.iter_file_segments().
+        """
+        key = parse_cache_key(file_format, language_pair)
+        cached = self.cached_pairs(digest, key)
+        if cached is not None:
+            return cached
+        pairs = iter_file_segments(self.path_for(digest), file_format, language_pair=language_pair)
+        return self.caching_pairs(pairs, digest, key)
+
+    def sweep(self):
+        """
+        Reconciles reference counts with the File rows, then removes
+        unreferenced blobs, files without a Blob row and stale temporary
+        files. Commits.
+
+        Blobs acquired within STALE_TEMP_SECONDS keep their count: it may
+        include references of batch uploads still parsing, whose File rows
+        are not committed yet.
+
+        Returns:
+            Number of files removed.
+        """
+        table = Blob.__table__
+        references = (db.select(db.func.count(File.id)).where(File.blob_hash == table.c.sha256)
+                      .scalar_subquery())
+        acquired_before = datetime.utcnow() - timedelta(seconds=STALE_TEMP_SECONDS)
+        db.session.execute(table.update()
+                           .where(db.func.coalesce(table.c.acquired_at, table.c.created_at) < acquired_before)
+                           .values(ref_count=references))
+        db.session.execute(table.delete().where(table.c.ref_count <= 0))
+        known = {digest for (digest,) in db.session.query(Blob.sha256)}
+        removed = 0
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith('.tmp'):
+                    orphaned = entry.stat().st_mtime < stale_before
+                else:
+                    orphaned = entry.name.split('.', 1)[0] not in known
+                if orphaned:
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        db.session.commit()
+        return removed
+
+def parse_cache_key(file_format, language_pair=None):
+    """Parse cache key of a format; formats whose reader depends on the project's languages include them."""
+    key = f'{file_format.name}-v{PARSE_CACHE_VERSION}'
+    if file_format.reads_languages and language_pair:
+        languages = '-'.join(language or '' for language in language_pair)
+        key += '-' + hashlib.blake2b(languages.encode('utf-8'), digest_size=6).hexdigest()
+    return key
+
+def get_blob_store():
+    """The app's BlobStore (Config.BLOB_STORE_DIR)."""
+    return BlobStore(current_app.config['BLOB_STORE_DIR'])
+
+def release_file_blobs(files):
+    """
+    Drops the blob references held by files about to be deleted: File objects
+    or rows with a blob_hash (legacy files without a blob are skipped).
+
+    Returns:
+        The released digests, to pass to BlobStore.collect() after committing.
+    """
+    counts = {}
+    for file in files:
+        if file.blob_hash:
+            counts[file.blob_hash] = counts.get(file.blob_hash, 0) + 1
+    store = get_blob_store()
+    for digest, count in counts.items():
+        store.release(digest, count)
+    return list(counts)
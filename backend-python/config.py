@@ -3,18 +3,84 @@ import os
 # Base directory of the backend application
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-# Data directory configuration
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+# Data directory configuration (AUTO_TRANSLATE_DATA_DIR relocates all data, e.g. for benchmarks)
+DATA_DIR = os.environ.get('AUTO_TRANSLATE_DATA_DIR', os.path.join(BASE_DIR, 'data'))
 PROJECTS_DIR = os.path.join(DATA_DIR, 'projects')
 DB_FILE = os.path.join(DATA_DIR, 'database.sqlite')
+EXPORT_CACHE_DIR = os.path.join(DATA_DIR, 'export_cache')
+BLOB_STORE_DIR = os.path.join(DATA_DIR, 'blobs')
+UPLOAD_SESSION_DIR = os.path.join(DATA_DIR, 'uploads')
+TRASH_DIR = os.path.join(DATA_DIR, 'trash')
+
+# SQLite connection pragmas, applied to every new connection (see storage.py).
+# 'default' leaves SQLite's own settings (rollback journal, no busy timeout).
+SQLITE_PROFILES = {
+    'default': {},
+    'development': {
+        'journal_mode': 'WAL',      # readers are not blocked by a writer
+        'busy_timeout': 5000,       # wait (ms) for the write lock instead of failing
+        'synchronous': 'NORMAL',
+    },
+    'production': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 15000,
+        'synchronous': 'NORMAL',    # safe with WAL, fsync only at checkpoints
+        'cache_size': -64000,       # negative = KiB, ~64MB page cache per connection
+        'mmap_size': 268435456,     # 256MB memory-mapped reads
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Machine translation engines: name -> {'class': import path of a mt.TranslationEngine
+# subclass, other keys override its class attributes (batch limits, concurrency, ...)}
+MT_ENGINES = {
+    'local': {'class': 'mt.LocalEngine'}, # deterministic offline stand-in
+}
 
 # Flask App Configuration
 class Config:
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_FILE}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # Max 16MB upload
+    # Uploads are parsed and inserted incrementally, so the cap only bounds disk usage
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))  # Max 1GB upload
+    # Resumable uploads (see uploads.py) send the file in chunks, each one a request under MAX_CONTENT_LENGTH
+    UPLOAD_SESSION_DIR = UPLOAD_SESSION_DIR
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 10 * 1024 * 1024 * 1024)) # Max 10GB per resumable upload
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024 # Chunk size suggested to clients
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600)) # Seconds an idle session is kept
+    SEGMENT_INSERT_CHUNK_SIZE = 5000 # Segments written per flush while importing a file
+    EXPORT_CACHE_DIR = EXPORT_CACHE_DIR
+    EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 1024 * 1024 * 1024)) # LRU-evicted beyond this
+    # Threads rendering files of a project ZIP ahead of the writer, 0 = one at a time in the request
+    PROJECT_EXPORT_WORKERS = int(os.environ.get('PROJECT_EXPORT_WORKERS', min(2, (os.cpu_count() or 1) - 1)))
+    BLOB_STORE_DIR = BLOB_STORE_DIR # Uploads by SHA-256, with their cached parse results
+    # Deleted projects and files lose their rows at once; segments and directories are removed by reaper.py
+    TRASH_DIR = TRASH_DIR
+    REAPER_BATCH_SIZE = 5000 # Segments deleted per write transaction
+    REAPER_BATCH_PAUSE = 0.1 # Seconds between batches, for writers waiting on the lock
+    REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', 300)) # Seconds between checks when not woken by a deletion
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production') # Key of SQLITE_PROFILES
+    MT_ENGINES = MT_ENGINES
+    MT_ENGINE = os.environ.get('MT_ENGINE', 'local') # Default key of MT_ENGINES
+    MT_CACHE_MAX_ENTRIES = int(os.environ.get('MT_CACHE_MAX_ENTRIES', 1000000)) # LRU-evicted beyond this, 0 disables the cache
+    MT_CACHE_TTL = int(os.environ.get('MT_CACHE_TTL', 90 * 24 * 3600)) or None # Seconds an entry stays valid, 0 = forever
+    # Job workers and the reaper start with the first request a process serves, so importing the app
+    # (flask CLI commands, the reloader's parent process, scripts) never runs them; 0 disables them
+    BACKGROUND_WORKERS = os.environ.get('BACKGROUND_WORKERS', '1') != '0'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2)) # Background job threads per serving process
+    JOB_HEARTBEAT_INTERVAL = 30 # Seconds between heartbeats (and progress writes) of a process's running jobs
+    # Running jobs without a heartbeat for this long are failed (their process exited); keep it
+    # above the longest write transaction of a job, during which the heartbeat cannot be written
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 300))
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1)) # Processes parsing batch uploads, 0 = parse in the request
+    SSE_HEARTBEAT_SECONDS = 15 # Keep-alive comment interval of event streams
+    EVENT_QUEUE_SIZE = 1000 # Events buffered per stream client before it is told to resync
     SECRET_KEY = os.environ.get('SECRET_KEY', 'your-default-secret-key') # Good practice to have a secret key
 
 # Ensure data directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(PROJECTS_DIR, exist_ok=True)
+os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+os.makedirs(TRASH_DIR, exist_ok=True)
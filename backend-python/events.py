@@ -0,0 +1,143 @@
+import itertools
+import json
+import queue
+import threading
+from flask import current_app
+from models import db, File
+
+# Files with more changed segments than this get a 'file-changed' event
+# (clients refetch) instead of a 'segments' delta
+MAX_DELTA_SEGMENTS = 500
+
+class Subscription:
+    """One event stream client: a bounded queue of (id, event, data) tuples."""
+
+    def __init__(self, channels, size):
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=size)
+        # Set when events were dropped because the client fell behind
+        self.overflowed = False
+
+class EventBroker:
+    """
+    In-process publish/subscribe for Server-Sent Events.
+
+    Channels are 'project:<id>' and 'file:<id>'. Publishing never blocks: a
+    subscriber whose queue is full misses events and is sent a 'resync'
+    event instead, telling the client to reload. Only subscribers of the same
+    app process receive events.
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        subscription = Subscription(channels, self.queue_size)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+            event_id = next(self._ids)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait((event_id, event, data))
+            except queue.Full:
+                subscription.overflowed = True
+
+def format_event(event_id, event, data):
+    """One SSE message; data is compact JSON on a single line."""
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(",", ":"))}\n\n'
+
+def iter_events(broker, subscription, heartbeat):
+    """
+    Yields SSE messages for a subscription until the client disconnects.
+    A comment line is sent every heartbeat seconds so proxies keep the
+    connection open and dead clients are noticed.
+    """
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                yield format_event(0, 'resync', {})
+            try:
+                event_id, event, data = subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event_id, event, data)
+    finally:
+        broker.unsubscribe(subscription)
+
+def get_broker():
+    if 'events' not in current_app.extensions:
+        current_app.extensions['events'] = EventBroker(current_app.config['EVENT_QUEUE_SIZE'])
+    return current_app.extensions['events']
+
+def publish(event, data, project_id, file_id=None):
+    """Publishes to the project's channel and, with file_id, to the file's channel."""
+    broker = get_broker()
+    broker.publish(f'project:{project_id}', event, data)
+    if file_id is not None:
+        broker.publish(f'file:{file_id}', event, data)
+
+def _file_progress(file, project):
+    return {
+        'fileId': file.id,
+        'revision': file.revision,
+        'segmentCount': file.segment_count,
+        'translatedCount': file.translated_count,
+        'completionRate': file.completion_rate,
+        'projectCompletionRate': project.completion_rate
+    }
+
+def publish_file_changes(project, changes):
+    """
+    Publishes committed segment changes, {file_id: {segment_index: text}}.
+    A value of None stands for "many segments changed" (e.g. pretranslation).
+
+    File channels get a 'segments' delta (or 'file-changed'); the project
+    channel gets a compact 'file-progress' event per file.
+    """
+    broker = get_broker()
+    for file_id, segments in changes.items():
+        file = db.session.get(File, file_id)
+        if file is None:
+            continue
+        progress = _file_progress(file, project)
+        if segments is None or len(segments) > MAX_DELTA_SEGMENTS:
+            broker.publish(f'file:{file_id}', 'file-changed', progress)
+        elif segments:
+            broker.publish(f'file:{file_id}', 'segments', {**progress, 'segments': segments})
+        broker.publish(f'project:{project.id}', 'file-progress', progress)
+
+def publish_file_added(file, project):
+    publish('file-added', {**file.to_dict(include_segments=False),
+                           'projectCompletionRate': project.completion_rate}, project.id)
+
+def publish_file_deleted(file_id, project):
+    publish('file-deleted', {'fileId': file_id, 'projectCompletionRate': project.completion_rate},
+            project.id, file_id)
+
+def publish_job(job, progress=None):
+    """Job status or progress; goes to the job's project and file streams."""
+    if job.project_id is not None:
+        publish('job', job.to_dict(progress), job.project_id, job.file_id)
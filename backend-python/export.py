@@ -0,0 +1,365 @@
+import os
+import queue
+import threading
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from flask import current_app
+from models import db, Segment
+from formats import DEFAULT_FORMAT, get_format
+
+# Segments fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 1000
+# Rendered text is buffered up to roughly this many characters before being yielded
+EXPORT_BUFFER_SIZE = 64 * 1024
+# Rendered chunks a project archive worker may get ahead of the ZIP writer, per file
+ARCHIVE_QUEUE_CHUNKS = 16
+
+def iter_segment_rows(file_id, fetch_size=EXPORT_FETCH_SIZE):
+    """Yields (original_text, translated_text) in segment order from a streaming cursor."""
+    query = (db.session.query(Segment.original_text, Segment.translated_text)
+             .filter(Segment.file_id == file_id)
+             .order_by(Segment.segment_index)
+             .execution_options(yield_per=fetch_size))
+    yield from query
+
+def iter_export(file_id, file_format=None, language_pair=None, source_path=None, buffer_size=EXPORT_BUFFER_SIZE):
+    """
+    Yields the translated file content as text chunks.
+
+    Args:
+        file_format: A formats.FileFormat; defaults to the native seg layout.
+        language_pair: (source_language, target_language) written into the
+                       document by formats that record them.
+        source_path: The uploaded document to merge the rows into, for
+                     formats with needs_source (see export_source_path).
+
+    Memory use is bounded by buffer_size and the cursor fetch size, not by the
+    number of segments.
+    """
+    file_format = file_format or get_format(DEFAULT_FORMAT)
+    buffer = []
+    buffered = 0
+    for piece in file_format.write(iter_segment_rows(file_id), language_pair, source_path):
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= buffer_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def export_source_path(file, file_format):
+    """
+    The uploaded document an export merges into: only exports to the file's
+    own format have one, conversions generate a new document.
+    """
+    if file_format.needs_source and file_format.name == file.file_format:
+        return file.file_path
+    return None
+
+def export_chunks(file, file_format):
+    """The gzip-compressed export of a file in a format, as stored in the ExportCache."""
+    chunks = iter_export(file.id, file_format, file.project.language_pair, export_source_path(file, file_format))
+    return gzip_chunks(encode_chunks(chunks))
+
+def encode_chunks(chunks, encoding='utf-8'):
+    """Encodes text chunks to bytes."""
+    for chunk in chunks:
+        yield chunk.encode(encoding)
+
+def gzip_chunks(chunks, level=6):
+    """Compresses a stream of byte chunks into a single gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def translated_download_name(file_name, file_format=None):
+    """
+    'report.txt' -> 'report-translated.txt'; with a file_format whose
+    extensions do not include the file's, its first extension is used instead.
+    """
+    base_name, ext = os.path.splitext(file_name)
+    if file_format is not None and ext.lower() not in file_format.extensions:
+        ext = file_format.extensions[0]
+    return f"{base_name}-translated{ext}"
+
+def content_disposition(filename):
+    """Builds an attachment Content-Disposition header, with an RFC 5987 fallback for non-ASCII names."""
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{quote(filename)}"
+    return f'attachment; filename="{filename}"'
+
+def read_file_chunks(f, chunk_size=EXPORT_BUFFER_SIZE):
+    """Streams the raw bytes of an open binary file, closing it at the end."""
+    with f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+def gunzip_chunks(chunks):
+    """Decompresses a stream of gzip byte chunks."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    yield decompressor.flush()
+
+class ExportCache:
+    """
+    On-disk cache of gzip-compressed exports keyed by (file_id, revision, format).
+
+    Entries are plain files named <file_id>-<revision>.<format>.gz; their mtime
+    is the LRU clock (refreshed on every hit) and the oldest entries are removed
+    once the directory grows beyond max_bytes. Since the revision changes on
+    every segment write, entries never need invalidating, only evicting.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path_for(self, file_id, revision, fmt):
+        return os.path.join(self.cache_dir, f'{file_id}-{revision}.{fmt}.gz')
+
+    def get(self, file_id, revision, fmt):
+        """Returns the cached entry path (marking it recently used), or None."""
+        path = self.path_for(file_id, revision, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def open(self, file_id, revision, fmt):
+        """
+        Opens a cached entry for reading (marking it recently used), or
+        returns None. Streaming from the returned file is safe even if a
+        concurrent fill() evicts or discards the entry meanwhile: the file
+        is removed, but stays readable through the open handle.
+        """
+        path = self.path_for(file_id, revision, fmt)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return f
+
+    def fill(self, file_id, revision, fmt, chunks):
+        """
+        Passes gzip chunks through while writing them to the cache.
+
+        The entry is published atomically only if the stream is consumed to the
+        end; an aborted download leaves no partial entry behind.
+        """
+        path = self.path_for(file_id, revision, fmt)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        completed = False
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(temp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.discard(file_id, keep=path)
+        self.evict()
+
+    def discard(self, file_id, keep=None):
+        """Removes every cached entry of a file (except keep)."""
+        prefix = f'{file_id}-'
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(prefix) and not entry.name.endswith('.tmp') and entry.path != keep:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def discard_files(self, file_ids):
+        """Removes every cached entry of several files in one pass over the directory."""
+        file_ids = set(file_ids)
+        if not file_ids:
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.rsplit('-', 1)[0] in file_ids and not entry.name.endswith('.tmp'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class ArchiveEntry:
+    """One file of a project archive, with what rendering it needs outside the request's session."""
+
+    def __init__(self, file, file_format, name, language_pair=None):
+        self.name = name
+        self.file_id = file.id
+        self.revision = file.revision
+        self.format_name = file_format.name
+        self.language_pair = language_pair
+        self.source_path = export_source_path(file, file_format)
+        self.date_time = file.upload_date.timetuple()[:6] if file.upload_date else (1980, 1, 1, 0, 0, 0)
+
+def archive_entries(files, language_pair=None, file_format=None):
+    """
+    ArchiveEntries of a project's files in their own format (or file_format),
+    named like their downloads; repeated names get a ' (2)', ' (3)', ... suffix.
+    """
+    entries = []
+    used = set()
+    for file in files:
+        entry_format = file_format or get_format(file.file_format)
+        name = translated_download_name(file.file_name, entry_format)
+        base_name, ext = os.path.splitext(name)
+        number = 1
+        while name.lower() in used:
+            number += 1
+            name = f'{base_name} ({number}){ext}'
+        used.add(name.lower())
+        entries.append(ArchiveEntry(file, entry_format, name, language_pair))
+    return entries
+
+def render_entry(entry, cache=None):
+    """The translated content of an archive entry as byte chunks, from the ExportCache when it holds it."""
+    cached = cache.open(entry.file_id, entry.revision, entry.format_name) if cache else None
+    if cached is not None:
+        yield from gunzip_chunks(read_file_chunks(cached))
+        return
+    yield from encode_chunks(iter_export(entry.file_id, get_format(entry.format_name),
+                                         entry.language_pair, entry.source_path))
+
+class _ArchiveSink:
+    """Write-only file object collecting what ZipFile writes, drained after every write."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+# Marks the end of a file's chunks in its queue
+_END = object()
+
+def _render_into(app, entry, cache, chunks, cancelled):
+    """Renders an entry into a bounded queue in a worker thread; stops when the archive is abandoned."""
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        with app.app_context():
+            for chunk in render_entry(entry, cache):
+                if not put(chunk):
+                    return
+    except Exception as e:
+        put(e)
+        return
+    put(_END)
+
+def _drain(chunks):
+    while True:
+        item = chunks.get()
+        if item is _END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def _iter_rendered(entries, cache, workers):
+    """
+    (entry, chunks) in entry order. With workers, up to that many entries
+    are rendered ahead in threads (each with its own app context and
+    session) into queues of ARCHIVE_QUEUE_CHUNKS chunks, so memory is bounded
+    by workers x queue size whatever the number and size of the files.
+    """
+    if not workers:
+        for entry in entries:
+            yield entry, render_entry(entry, cache)
+        return
+    app = current_app._get_current_object()
+    cancelled = threading.Event()
+    pending = deque()
+    remaining = iter(entries)
+    with ThreadPoolExecutor(workers, thread_name_prefix='archive-render') as executor:
+        def start_next():
+            entry = next(remaining, None)
+            if entry is not None:
+                chunks = queue.Queue(ARCHIVE_QUEUE_CHUNKS)
+                executor.submit(_render_into, app, entry, cache, chunks, cancelled)
+                pending.append((entry, chunks))
+
+        try:
+            for _ in range(workers):
+                start_next()
+            while pending:
+                entry, chunks = pending.popleft()
+                yield entry, _drain(chunks)
+                start_next()
+        finally:
+            cancelled.set()
+
+def iter_archive(entries, cache=None, workers=0):
+    """
+    Streams a ZIP archive of the entries' translated content as byte chunks.
+
+    Each entry is rendered straight into the archive (ZIP64 data descriptors,
+    so no size needs to be known up front) and nothing is staged on disk;
+    see _iter_rendered for the parallel rendering.
+    """
+    sink = _ArchiveSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for entry, chunks in _iter_rendered(entries, cache, workers):
+            info = zipfile.ZipInfo(entry.name, date_time=entry.date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w', force_zip64=True) as target:
+                for chunk in chunks:
+                    target.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
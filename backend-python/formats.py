@@ -0,0 +1,642 @@
+import codecs
+import os
+import re
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from xml.sax.saxutils import escape, quoteattr
+from utils import READ_CHUNK_SIZE, detect_encoding, iter_segments
+
+# Bilingual file formats, keyed by name. Each format streams (source, target)
+# pairs out of a document for import and renders segment rows back into a
+# document for export, one piece at a time, so neither side holds the whole
+# document in memory. See register_format.
+FORMATS = {}
+
+# Name of the format files are assumed to be in when nothing else matches
+DEFAULT_FORMAT = 'seg'
+# Bytes read from the start of a file to sniff its format
+SNIFF_SIZE = 4096
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+class FormatError(ValueError):
+    """The content is not a valid document of the format (non-XML formats)."""
+
+# What readers raise for malformed input: XML formats raise the parser's error
+INVALID_FORMAT_ERRORS = (ET.ParseError, FormatError)
+
+class FileFormat:
+    """
+    A bilingual file format.
+
+    Subclasses implement read(), which yields (source_text, target_text)
+    pairs from an open file, and write(), which yields text pieces of a
+    document for (original_text, translated_text) rows in segment order.
+    Readers skip units without source text, so that write() can use the
+    same rule when it merges rows back into a source document.
+    """
+    name = None
+    label = None
+    extensions = ()
+    mimetype = 'text/plain'
+    # XML formats are read as bytes so the parser honours the encoding declaration
+    binary = False
+    # write() merges the rows into the originally uploaded document of the same
+    # format (source_path) when given one, keeping what the rows do not hold
+    # (e.g. SRT timings, XLIFF ids, PO contexts and plurals)
+    needs_source = False
+    # write() cannot generate a document without one, so nothing converts to the format
+    source_required = False
+    # read() depends on the language_pair (parse results are cached per language pair)
+    reads_languages = False
+    invalid_message = '文件格式无效'
+    empty_message = '文件内容为空或未包含可翻译的段落'
+
+    def sniff(self, head):
+        """Whether the first bytes of a file look like this format."""
+        return False
+
+    def read(self, stream, language_pair=None):
+        raise NotImplementedError
+
+    def write(self, rows, language_pair=None, source_path=None):
+        raise NotImplementedError
+
+def register_format(cls):
+    """Class decorator adding a format to FORMATS; sniffing tries formats in registration order."""
+    FORMATS[cls.name] = cls()
+    return cls
+
+def get_format(name):
+    """
+    Raises:
+        ValueError: If no format of that name is registered.
+    """
+    try:
+        return FORMATS[name]
+    except KeyError:
+        raise ValueError(f"Unknown file format '{name}', expected one of: {', '.join(FORMATS)}")
+
+def detect_format(file_name, path=None):
+    """
+    Format of a file: by extension, else by sniffing its first bytes, else
+    DEFAULT_FORMAT.
+    """
+    _, extension = os.path.splitext(file_name.lower())
+    for file_format in FORMATS.values():
+        if extension in file_format.extensions:
+            return file_format
+    if path is not None:
+        with open(path, 'rb') as f:
+            head = f.read(SNIFF_SIZE)
+        if head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+            # UTF-16 XML documents are sniffed on their UTF-8 re-encoding
+            head = head.decode('utf-16', errors='ignore').encode('utf-8')
+        for file_format in FORMATS.values():
+            if file_format.sniff(head):
+                return file_format
+    return FORMATS[DEFAULT_FORMAT]
+
+def iter_file_segments(path, file_format, encoding=None, language_pair=None):
+    """
+    Streams (source_text, target_text) pairs from a file on disk.
+
+    Args:
+        encoding: Text encoding of non-XML formats; detected with
+                  utils.detect_encoding() when omitted.
+
+    Raises:
+        UnicodeDecodeError: If the encoding cannot be determined.
+        ET.ParseError, FormatError: If the document is invalid.
+    """
+    if file_format.binary:
+        with open(path, 'rb') as f:
+            yield from file_format.read(f, language_pair)
+        return
+    encoding = encoding or detect_encoding(path)
+    with open(path, 'r', encoding=encoding, newline='') as f:
+        yield from file_format.read(f, language_pair)
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _child(element, name):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+def _text(element):
+    """Text of an element with inline markup flattened away."""
+    return ''.join(element.itertext()).strip() if element is not None else ''
+
+def _iter_xml_elements(stream, names, chunk_size=READ_CHUNK_SIZE):
+    """
+    Pull-parses an XML byte stream and yields every completed element whose
+    local name is in names. Each yielded element is detached from its parent
+    afterwards, so memory is bounded by the largest unit, not the document.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    open_elements = []
+
+    def drain():
+        for event, element in parser.read_events():
+            if event == 'start':
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            if _local_name(element.tag) in names:
+                yield element
+                if open_elements:
+                    open_elements[-1].remove(element)
+
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+XML_ENCODING_PATTERN = re.compile(rb'\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+def _xml_encoding(head):
+    """Python codec of an XML document from its first bytes: BOM, else declaration, else UTF-8."""
+    if head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    match = XML_ENCODING_PATTERN.match(head[3:] if head.startswith(codecs.BOM_UTF8) else head)
+    encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    return 'utf-8-sig' if codecs.lookup(encoding).name == 'utf-8' else encoding
+
+@register_format
+class XliffFormat(FileFormat):
+    """
+    XLIFF 1.2 (<trans-unit>) and 2.x (<unit><segment>). Exports write the
+    translations into the uploaded file's <target> elements, keeping ids,
+    notes and inline markup of the sources; conversions from other formats
+    generate XLIFF 1.2.
+    """
+    name = 'xliff'
+    label = 'XLIFF'
+    extensions = ('.xlf', '.xliff', '.sdlxliff', '.mqxliff')
+    mimetype = 'application/x-xliff+xml'
+    binary = True
+    needs_source = True
+    invalid_message = '文件格式无效，XLIFF 文档无法解析'
+
+    def sniff(self, head):
+        return b'<xliff' in head
+
+    def read(self, stream, language_pair=None):
+        # <unit> is only listed so that finished 2.x units are released
+        for element in _iter_xml_elements(stream, {'trans-unit', 'segment', 'unit'}):
+            if _local_name(element.tag) == 'unit' or element.get('translate') == 'no':
+                continue
+            source_text = _text(_child(element, 'source'))
+            if source_text:
+                yield source_text, _text(_child(element, 'target'))
+
+    def write(self, rows, language_pair=None, source_path=None):
+        if source_path is not None:
+            yield from self._merge(rows, source_path)
+            return
+        source_language, target_language = language_pair or (None, None)
+        yield XML_DECLARATION
+        yield '<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">\n'
+        yield (f'  <file original="segments" datatype="plaintext" '
+               f'source-language={quoteattr(source_language or "und")}'
+               + (f' target-language={quoteattr(target_language)}' if target_language else '')
+               + '>\n    <body>\n')
+        for unit_id, (original, translated) in enumerate(rows, start=1):
+            target = f'\n        <target>{escape(translated)}</target>' if translated else ''
+            yield (f'      <trans-unit id="{unit_id}">\n        <source>{escape(original)}</source>'
+                   f'{target}\n      </trans-unit>\n')
+        yield '    </body>\n  </file>\n</xliff>\n'
+
+    def _merge(self, rows, source_path, chunk_size=READ_CHUNK_SIZE):
+        """
+        The uploaded document with each translation replacing the content of
+        its unit's <target> (or added after the <source>), every other byte
+        copied as is. Units whose translation equals their target text keep
+        the target untouched, inline markup included.
+
+        The document is re-encoded as UTF-8 and parsed with expat for the byte
+        offsets of the spans to replace; bytes are written out as soon as no
+        open unit can still change them.
+        """
+        rows = iter(rows)
+        parser = xml.parsers.expat.ParserCreate(encoding='UTF-8')
+        data = bytearray() # The re-encoded document from offset base on
+        base = 0
+        edits = [] # (start, end, replacement) of spans not written out yet, in document order
+        depth = 0
+        position = 0 # Offset of the last parser event
+        unit = None # The open <trans-unit>/<segment>
+        capture = None # 'source' or 'target' while inside the unit's one
+
+        def start(name, attributes):
+            nonlocal depth, position, unit, capture
+            depth += 1
+            position = parser.CurrentByteIndex
+            local = name.rsplit(':', 1)[-1]
+            if unit is None:
+                if local in ('trans-unit', 'segment'):
+                    unit = {'depth': depth, 'start': position, 'prefix': name[:-len(local)],
+                            'skip': attributes.get('translate') == 'no', 'source': None, 'target': None}
+                return
+            if capture is not None:
+                unit['empty'] = False
+                if capture == 'target':
+                    unit.setdefault('target_inner', position)
+            elif depth == unit['depth'] + 1 and local in ('source', 'target') and unit[local] is None:
+                capture = local
+                unit[local] = []
+                unit['empty'] = True
+                if local == 'source':
+                    # Indentation of the <source>, repeated for an added <target>
+                    before = bytes(data[unit['start'] - base:position - base])
+                    newline = before.rfind(b'\n')
+                    unit['indent'] = before[newline:] if newline >= 0 and not before[newline:].strip() else b''
+                else:
+                    unit['target_name'] = name.encode('utf-8')
+                    unit['target_start'] = position
+
+        def characters(text):
+            nonlocal position
+            position = parser.CurrentByteIndex
+            if capture is not None:
+                unit['empty'] = False
+                if capture == 'target':
+                    unit.setdefault('target_inner', position)
+                unit[capture].append(text)
+
+        def end(name):
+            nonlocal depth, position, unit, capture
+            position = parser.CurrentByteIndex
+            if capture is not None and depth == unit['depth'] + 1:
+                # The end event of an empty-element tag comes after the tag, others at their end tag
+                self_closing = unit['empty'] and data[position - base - 2:position - base] == b'/>'
+                if capture == 'source':
+                    unit['source_end'] = position if self_closing else data.index(b'>', position - base) + 1 + base
+                elif self_closing:
+                    unit['target_end'] = position
+                else:
+                    unit.setdefault('target_inner', position)
+                    unit['target_close'] = position
+                capture = None
+            elif unit is not None and depth == unit['depth']:
+                finish(unit)
+                unit = None
+            depth -= 1
+
+        def finish(unit):
+            source_text = ''.join(unit['source'] or ()).strip()
+            if unit['skip'] or not source_text:
+                return
+            _, translated = next(rows, (source_text, ''))
+            if not translated or translated == ''.join(unit['target'] or ()).strip():
+                return
+            text = escape(translated).encode('utf-8')
+            if unit['target'] is None:
+                target_name = unit['prefix'].encode('utf-8') + b'target'
+                edits.append((unit['source_end'], unit['source_end'],
+                              unit['indent'] + b'<' + target_name + b'>' + text + b'</' + target_name + b'>'))
+            elif 'target_end' in unit:
+                tag = bytes(data[unit['target_start'] - base:unit['target_end'] - base - 2]).rstrip()
+                edits.append((unit['target_start'], unit['target_end'],
+                              tag + b'>' + text + b'</' + unit['target_name'] + b'>'))
+            else:
+                edits.append((unit['target_inner'], unit['target_close'], text))
+
+        parser.StartElementHandler = start
+        parser.CharacterDataHandler = characters
+        parser.EndElementHandler = end
+        decoder = codecs.getincrementaldecoder('utf-8')()
+
+        def flush(upto):
+            """Text of the document up to offset upto, with the edits applied."""
+            nonlocal base
+            if edits and edits[0][0] < upto < edits[0][1]:
+                upto = edits[0][0]
+            pieces = []
+            while edits and edits[0][1] <= upto:
+                span_start, span_end, replacement = edits.pop(0)
+                pieces += [bytes(data[:span_start - base]), replacement]
+                del data[:span_end - base]
+                base = span_end
+            pieces.append(bytes(data[:upto - base]))
+            del data[:upto - base]
+            base = upto
+            return decoder.decode(b''.join(pieces))
+
+        with open(source_path, 'rb') as source:
+            chunk = source.read(SNIFF_SIZE)
+            encoding = _xml_encoding(chunk)
+            text_decoder = codecs.getincrementaldecoder(encoding)()
+            encoded = text_decoder.decode(chunk).encode('utf-8')
+            if encoding != 'utf-8-sig' and encoded.startswith(b'<?xml'):
+                # The declaration would name the encoding the document is no longer in
+                edits.append((0, encoded.index(b'?>') + 2, XML_DECLARATION.rstrip('\n').encode('utf-8')))
+            while chunk:
+                data += encoded
+                parser.Parse(encoded, False)
+                text = flush(unit['start'] if unit is not None else position)
+                if text:
+                    yield text
+                chunk = source.read(chunk_size)
+                encoded = text_decoder.decode(chunk).encode('utf-8')
+            encoded = text_decoder.decode(b'', final=True).encode('utf-8')
+            data += encoded
+            parser.Parse(encoded, True)
+        yield flush(base + len(data)) + decoder.decode(b'', final=True)
+
+def _pick_variant(variants, language):
+    """Index of the (lang, text) variant matching a language exactly, else by primary subtag."""
+    if not language:
+        return None
+    language = language.lower()
+    for exact in (True, False):
+        for i, (variant_language, _) in enumerate(variants):
+            variant_language = (variant_language or '').lower()
+            if variant_language == language or (
+                    not exact and variant_language.split('-')[0] == language.split('-')[0]):
+                return i
+    return None
+
+@register_format
+class TmxFormat(FileFormat):
+    """TMX 1.4; the project's languages pick the source and target <tuv> of each <tu>."""
+    name = 'tmx'
+    label = 'TMX'
+    extensions = ('.tmx',)
+    mimetype = 'application/x-tmx+xml'
+    binary = True
+    reads_languages = True
+    invalid_message = '文件格式无效，TMX 文档无法解析'
+
+    def sniff(self, head):
+        return b'<tmx' in head
+
+    def read(self, stream, language_pair=None):
+        source_language, target_language = language_pair or (None, None)
+        header_language = None
+        for element in _iter_xml_elements(stream, {'header', 'tu'}):
+            if _local_name(element.tag) == 'header':
+                header_language = element.get('srclang')
+                if header_language == '*all*':
+                    header_language = None
+                continue
+            variants = [(tuv.get(XML_LANG) or tuv.get('lang'), _text(_child(tuv, 'seg')))
+                        for tuv in element if _local_name(tuv.tag) == 'tuv']
+            if not variants:
+                continue
+            source = _pick_variant(variants, source_language)
+            if source is None:
+                source = _pick_variant(variants, header_language) or 0
+            others = variants[:source] + variants[source + 1:]
+            target = _pick_variant(others, target_language)
+            source_text = variants[source][1]
+            if source_text:
+                yield source_text, (others[0 if target is None else target][1] if others else '')
+
+    def write(self, rows, language_pair=None, source_path=None):
+        source_language, target_language = language_pair or (None, None)
+        source_language = source_language or 'und'
+        target_language = target_language or 'und'
+        yield XML_DECLARATION
+        yield '<tmx version="1.4">\n'
+        yield (f'  <header creationtool="auto-translate" creationtoolversion="1" segtype="sentence" '
+               f'o-tmf="auto-translate" adminlang="en" srclang={quoteattr(source_language)} '
+               f'datatype="plaintext"/>\n  <body>\n')
+        for original, translated in rows:
+            target = (f'\n      <tuv xml:lang={quoteattr(target_language)}><seg>{escape(translated)}</seg></tuv>'
+                      if translated else '')
+            yield (f'    <tu>\n      <tuv xml:lang={quoteattr(source_language)}><seg>{escape(original)}</seg></tuv>'
+                   f'{target}\n    </tu>\n')
+        yield '  </body>\n</tmx>\n'
+
+PO_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\', 'a': '\a', 'b': '\b', 'f': '\f', 'v': '\v'}
+PO_ESCAPE_PATTERN = re.compile(r'\\(.)')
+PO_KEYWORD_PATTERN = re.compile(r'(msgctxt|msgid|msgid_plural|msgstr(?:\[\d+\])?)\s+(".*")$')
+
+def _po_unquote(text, line_number):
+    if len(text) < 2 or not text.startswith('"') or not text.endswith('"'):
+        raise FormatError(f'line {line_number}: expected a quoted string')
+    return PO_ESCAPE_PATTERN.sub(lambda match: PO_ESCAPES.get(match.group(1), match.group(1)), text[1:-1])
+
+def _po_field(keyword, text):
+    """keyword "text" line(s); multi-line texts are split after each newline, as xgettext does."""
+    escaped = text.replace('\\', '\\\\').replace('"', '\\"').replace('\t', '\\t').replace('\r', '\\r')
+    lines = escaped.split('\n')
+    if len(lines) == 1:
+        return f'{keyword} "{escaped}"\n'
+    parts = [line + '\\n' for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+    return f'{keyword} ""\n' + ''.join(f'"{part}"\n' for part in parts)
+
+PO_MSGSTR_KEYWORDS = ('msgstr', 'msgstr[0]')
+PO_CHARSET_PATTERN = re.compile(r'charset=[^\s;]+', re.IGNORECASE)
+
+def _iter_po_entries(stream):
+    """
+    (lines, fields, fuzzy) per entry of a PO text stream: the entry's raw
+    lines including the comments before it, the unquoted text of each of its
+    keywords and whether it is flagged fuzzy. Comments after the last entry
+    come with empty fields.
+    """
+    lines = []
+    fields = {}
+    key = None
+    fuzzy = False
+    for line_number, raw_line in enumerate(stream, start=1):
+        line = raw_line.strip().lstrip('\ufeff')
+        comment = line.startswith('#') or not line
+        match = None
+        if not comment and not line.startswith('"'):
+            match = PO_KEYWORD_PATTERN.match(line)
+            if match is None:
+                raise FormatError(f'line {line_number}: unexpected content')
+        # A comment, blank line, msgctxt or msgid after a msgstr starts the next entry
+        if (any(name.startswith('msgstr') for name in fields)
+                and (comment or (match is not None and match.group(1) in ('msgctxt', 'msgid')))):
+            yield lines, fields, fuzzy
+            lines, fields, key, fuzzy = [], {}, None, False
+        lines.append(raw_line)
+        if comment:
+            if line.startswith('#,') and 'fuzzy' in line:
+                fuzzy = True
+        elif match is None:
+            if key is None:
+                raise FormatError(f'line {line_number}: string outside of an entry')
+            fields[key] += _po_unquote(line, line_number)
+        else:
+            key = match.group(1)
+            fields[key] = _po_unquote(match.group(2), line_number)
+    if lines:
+        yield lines, fields, fuzzy
+
+def _po_replace_msgstr(lines, text, clear_fuzzy=True):
+    """
+    An entry's raw lines with its msgstr (msgstr[0] of plural entries)
+    replaced by text and, with clear_fuzzy, its fuzzy flag dropped.
+    """
+    result = []
+    key = None
+    for line in lines:
+        stripped = line.strip().lstrip('\ufeff')
+        if clear_fuzzy and stripped.startswith('#,'):
+            flags = [flag.strip() for flag in stripped[2:].split(',') if flag.strip() != 'fuzzy']
+            if flags:
+                result.append('#, ' + ', '.join(flags) + '\n')
+            continue
+        match = PO_KEYWORD_PATTERN.match(stripped)
+        if match is not None:
+            key = match.group(1)
+            if key in PO_MSGSTR_KEYWORDS:
+                result.append(_po_field(key, text))
+                continue
+        elif stripped.startswith('"') and key in PO_MSGSTR_KEYWORDS:
+            continue
+        result.append(line)
+    return result
+
+@register_format
+class PoFormat(FileFormat):
+    """
+    Gettext PO/POT. msgid is the source, msgstr (msgstr[0] for plurals) the
+    target. The header entry and obsolete (#~) entries are skipped; fuzzy
+    translations are imported as untranslated. Exports write the translations
+    into the uploaded file's entries, keeping their comments, contexts and
+    plural forms.
+    """
+    name = 'po'
+    label = 'PO'
+    extensions = ('.po', '.pot')
+    mimetype = 'text/x-gettext-translation'
+    needs_source = True
+    invalid_message = '文件格式无效，PO 文件无法解析'
+
+    def sniff(self, head):
+        return re.search(rb'^msgid\s+"', head, re.MULTILINE) is not None
+
+    def read(self, stream, language_pair=None):
+        for _, fields, fuzzy in _iter_po_entries(stream):
+            if fields.get('msgid'):
+                target = fields.get('msgstr', fields.get('msgstr[0]', ''))
+                yield fields['msgid'], ('' if fuzzy else target)
+
+    def write(self, rows, language_pair=None, source_path=None):
+        if source_path is not None:
+            yield from self._merge(rows, source_path)
+            return
+        _, target_language = language_pair or (None, None)
+        header = 'Content-Type: text/plain; charset=UTF-8\nContent-Transfer-Encoding: 8bit\n'
+        if target_language:
+            header += f'Language: {target_language}\n'
+        yield _po_field('msgid', '') + _po_field('msgstr', header)
+        # Repeated source texts get a msgctxt, PO requires unique (msgctxt, msgid)
+        seen = set()
+        for index, (original, translated) in enumerate(rows):
+            context = ''
+            if original in seen:
+                context = _po_field('msgctxt', str(index))
+            else:
+                seen.add(original)
+            yield '\n' + context + _po_field('msgid', original) + _po_field('msgstr', translated)
+
+    def _merge(self, rows, source_path):
+        """The uploaded file with each translated entry's msgstr replaced, every other line copied as is."""
+        rows = iter(rows)
+        with open(source_path, 'r', encoding=detect_encoding(source_path), newline='') as source:
+            for lines, fields, _ in _iter_po_entries(source):
+                if fields.get('msgid'):
+                    _, translated = next(rows, ('', ''))
+                    if translated:
+                        lines = _po_replace_msgstr(lines, translated)
+                elif 'msgid' in fields and 'msgctxt' not in fields and 'msgstr' in fields:
+                    # The header: the export is written in UTF-8 whatever the upload's charset
+                    header = PO_CHARSET_PATTERN.sub('charset=UTF-8', fields['msgstr'])
+                    if header != fields['msgstr']:
+                        lines = _po_replace_msgstr(lines, header, clear_fuzzy=False)
+                yield ''.join(lines)
+
+SRT_TIMING_PATTERN = re.compile(r'^\d+:\d{2}:\d{2}[,.]\d{1,3}\s*-->\s*\d+:\d{2}:\d{2}[,.]\d{1,3}')
+
+def _iter_srt_blocks(stream):
+    """(number, timing, text) per subtitle block of an SRT text stream."""
+    lines = []
+    for line_number, line in enumerate(stream, start=1):
+        line = line.rstrip('\r\n').lstrip('\ufeff')
+        if line.strip():
+            lines.append((line_number, line))
+            continue
+        if lines:
+            yield _srt_block(lines)
+            lines = []
+    if lines:
+        yield _srt_block(lines)
+
+def _srt_block(lines):
+    if len(lines) < 2 or not SRT_TIMING_PATTERN.match(lines[1][1].strip()):
+        raise FormatError(f'line {lines[0][0]}: expected a subtitle number and timing')
+    return lines[0][1].strip(), lines[1][1].strip(), '\n'.join(line for _, line in lines[2:]).strip()
+
+@register_format
+class SrtFormat(FileFormat):
+    """
+    SubRip subtitles. Each block's text is a source segment; exports write the
+    translations into the uploaded file's blocks, keeping numbers and timings.
+    """
+    name = 'srt'
+    label = 'SRT'
+    extensions = ('.srt',)
+    mimetype = 'application/x-subrip'
+    needs_source = True
+    source_required = True
+    invalid_message = '文件格式无效，SRT 字幕无法解析'
+
+    def sniff(self, head):
+        return re.match(rb'\s*(\xef\xbb\xbf)?\d+\s*\r?\n\d+:\d{2}:\d{2}[,.]\d+\s*-->', head) is not None
+
+    def read(self, stream, language_pair=None):
+        for _, _, text in _iter_srt_blocks(stream):
+            if text:
+                yield text, ''
+
+    def write(self, rows, language_pair=None, source_path=None):
+        rows = iter(rows)
+        with open(source_path, 'r', encoding=detect_encoding(source_path), newline='') as source:
+            for number, timing, text in _iter_srt_blocks(source):
+                if text:
+                    original, translated = next(rows, (text, ''))
+                    text = translated or original
+                yield f'{number}\n{timing}\n{text}\n\n'
+
+def escape_text(text):
+    """Basic escaping for XML characters within text content."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def render_segment(original, translated):
+    """Renders one segment in the <seg><source><target> layout."""
+    return f"<seg>\n  <source>{escape_text(original)}</source>\n  <target>{escape_text(translated)}</target>\n</seg>"
+
+@register_format
+class SegFormat(FileFormat):
+    """The native <seg><source>...</source><target>...</target></seg> layout."""
+    name = 'seg'
+    label = 'SEG'
+    extensions = ('.txt',)
+    mimetype = 'application/xml'
+    invalid_message = '文件格式无效，请使用 <seg><source>...</source><target>...</target></seg> 结构'
+    empty_message = '文件内容为空或未包含有效的 <seg> 标签'
+
+    def sniff(self, head):
+        return b'<seg' in head
+
+    def read(self, stream, language_pair=None):
+        yield from iter_segments(iter(lambda: stream.read(READ_CHUNK_SIZE), ''))
+
+    def write(self, rows, language_pair=None, source_path=None):
+        # Segments are separated by a newline, matching the layout accepted by utils.parse_file_content
+        separator = ''
+        for original, translated in rows:
+            yield separator + render_segment(original, translated)
+            separator = '\n'
@@ -0,0 +1,92 @@
+from collections import namedtuple
+from flask import current_app
+from models import db, Segment
+from utils import normalize_source, source_hash
+from tm import lookup_exact, record_translations
+from search import bulk_search_index
+
+IngestResult = namedtuple('IngestResult', ['segment_total', 'translated_total', 'prefilled_total'])
+
+def _chunk_size(chunk_size):
+    if chunk_size is not None:
+        return chunk_size
+    return current_app.config['SEGMENT_INSERT_CHUNK_SIZE']
+
+def _write_chunk(statement, rows, language_pair):
+    """
+    Records the file's own targets in the TM, prefills empty targets from it
+    (so repetitions inside the chunk are filled too), then inserts.
+    """
+    prefilled = 0
+    if language_pair is not None:
+        record_translations(language_pair,
+                            [(row['original_text'], row['translated_text']) for row in rows if row['translated_text']])
+        pending = [row for row in rows if not row['translated_text']]
+        if pending:
+            matches = lookup_exact(language_pair, [row['original_text'] for row in pending])
+            for row in pending:
+                target_text = matches.get(normalize_source(row['original_text']))
+                if target_text is not None:
+                    row['translated_text'] = target_text
+                    prefilled += 1
+    db.session.execute(statement, rows)
+    return prefilled
+
+def insert_segments(file_id, pairs, start_index=0, chunk_size=None, language_pair=None, progress=None):
+    """
+    Bulk inserts segments for a file with Core executemany statements.
+
+    Every row gets its source_hash, which groups repetitions for
+    File.propagate_translations.
+
+    No ORM objects are created; rows are buffered and written chunk_size at a
+    time inside the current session transaction, so memory stays bounded and
+    the caller decides when to commit.
+
+    Args:
+        file_id: ID of the owning File (its row must already be flushed).
+        pairs: Iterable of (source_text, target_text) tuples, e.g. from
+               formats.iter_file_segments.
+        start_index: segment_index assigned to the first pair.
+        chunk_size: Rows per INSERT; defaults to Config.SEGMENT_INSERT_CHUNK_SIZE.
+        language_pair: (source_language, target_language) of the project. When
+               given, empty targets are prefilled with exact translation memory
+               matches and targets present in the file are added to the TM.
+        progress: Optional callable, called with the number of segments
+               written so far after every chunk.
+
+    Returns:
+        IngestResult(segment_total, translated_total, prefilled_total);
+        translated_total includes prefilled segments.
+    """
+    chunk_size = _chunk_size(chunk_size)
+    statement = Segment.__table__.insert()
+    segment_total = 0
+    translated_total = 0
+    prefilled_total = 0
+    rows = []
+
+    # Full-text indexing happens once for the whole file, not per row
+    with bulk_search_index(file_id, start_index):
+        for index, (source_text, target_text) in enumerate(pairs, start=start_index):
+            rows.append({
+                'file_id': file_id,
+                'segment_index': index,
+                'original_text': source_text,
+                'translated_text': target_text,
+                'source_hash': source_hash(source_text)
+            })
+            if target_text != '':
+                translated_total += 1
+            if len(rows) >= chunk_size:
+                prefilled_total += _write_chunk(statement, rows, language_pair)
+                segment_total += len(rows)
+                rows = []
+                if progress is not None:
+                    progress(segment_total)
+
+        if rows:
+            prefilled_total += _write_chunk(statement, rows, language_pair)
+            segment_total += len(rows)
+
+    return IngestResult(segment_total, translated_total + prefilled_total, prefilled_total)
@@ -0,0 +1,322 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, Job, Project, File, delete_file_rows, delete_project_rows
+from formats import INVALID_FORMAT_ERRORS, get_format, iter_file_segments
+from ingest import insert_segments
+from mt import get_engine, pretranslate_file
+from export import ExportCache, export_chunks
+from blobs import get_blob_store, release_file_blobs
+from config import PROJECTS_DIR
+from reaper import move_to_trash, wake_reaper
+from events import publish, publish_job, publish_file_added, publish_file_changes
+
+# Job types -> handler(job, report); see job_handler
+JOB_HANDLERS = {}
+
+# Minimum seconds between two progress events of a job
+PROGRESS_EVENT_INTERVAL = 0.5
+
+class JobError(Exception):
+    """Expected job failure; the message is shown to the client as the job's error."""
+
+def job_handler(kind):
+    """
+    Registers a job handler. Handlers run in a worker thread inside an app
+    context and are called as handler(job, report): report(done, total=None)
+    publishes progress. The return value (JSON-serializable) becomes the job
+    result; raising JobError fails the job with that message. Handlers commit
+    their own work.
+    """
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+class JobQueue:
+    """
+    In-process worker pool fed by a queue of job ids.
+
+    Job rows are the persistent state: a job is claimed with an atomic
+    queued -> running UPDATE that records this queue as its owner, and jobs
+    still queued when the queue starts are resubmitted. While a job runs, a
+    heartbeat thread refreshes its heartbeat_at every JOB_HEARTBEAT_INTERVAL
+    seconds; running jobs whose heartbeat is older than JOB_STALE_SECONDS
+    belong to a process that exited and are failed. Several processes can
+    serve the same database. Progress of running jobs is kept in memory and
+    written to the rows by the heartbeat (and when the job ends), so
+    reporting never competes with the job's own write transaction for
+    SQLite's lock while other processes still see it move.
+
+    Nothing runs until start(), which the app calls when it serves its first
+    request (see init_job_queue); jobs submitted before wait in the queue.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._queue = queue.Queue()
+        self._progress = {}
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                         for i in range(workers)]
+        self._threads.append(threading.Thread(target=self._beat, name='job-heartbeat', daemon=True))
+
+    def start(self):
+        """Fails stale jobs, resubmits queued ones and starts the threads; later calls do nothing."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            with self.app.app_context():
+                self._fail_stale_jobs()
+                for (job_id,) in db.session.query(Job.id).filter_by(status='queued').order_by(Job.created_at):
+                    self.submit(job_id)
+            for thread in self._threads:
+                thread.start()
+            self._started = True
+
+    def submit(self, job_id):
+        self._queue.put(job_id)
+
+    def _fail_stale_jobs(self):
+        """Fails running jobs of other processes whose heartbeat expired."""
+        table = Job.__table__
+        stale_before = datetime.utcnow() - timedelta(seconds=self.app.config['JOB_STALE_SECONDS'])
+        db.session.execute(
+            table.update()
+            .where(table.c.status == 'running',
+                   db.or_(table.c.owner.is_(None), table.c.owner != self.owner),
+                   db.func.coalesce(table.c.heartbeat_at, table.c.started_at) < stale_before)
+            .values(status='failed', error='服务重启, 任务中断', finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def _beat(self):
+        table = Job.__table__
+        while True:
+            time.sleep(self.app.config['JOB_HEARTBEAT_INTERVAL'])
+            try:
+                with self.app.app_context():
+                    progress = self._progress.copy()
+                    if progress:
+                        db.session.execute(
+                            table.update()
+                            .where(table.c.owner == self.owner, table.c.status == 'running')
+                            .values(heartbeat_at=datetime.utcnow(),
+                                    progress=db.case({job_id: done for job_id, (done, _) in progress.items()},
+                                                     value=table.c.id, else_=table.c.progress),
+                                    total=db.case({job_id: total for job_id, (_, total) in progress.items()},
+                                                  value=table.c.id, else_=table.c.total))
+                        )
+                        db.session.commit()
+                    self._fail_stale_jobs()
+            except Exception:
+                # A job holding the write lock past the busy timeout: retried next interval
+                self.app.logger.exception('任务心跳写入出错')
+
+    def progress(self, job_id):
+        """(done, total) of a job running here, None for jobs of other processes or not running."""
+        return self._progress.get(job_id)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self.app.app_context():
+                    self._run(job_id)
+            except Exception:
+                self.app.logger.exception(f'任务执行器出错 (Job: {job_id})')
+
+    def _claim(self, job_id):
+        table = Job.__table__
+        claimed = db.session.execute(
+            table.update().where(table.c.id == job_id, table.c.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow(),
+                    owner=self.owner, heartbeat_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _run(self, job_id):
+        if not self._claim(job_id):
+            return
+        job = db.session.get(Job, job_id)
+        self._progress[job_id] = (0, None)
+        publish_job(job, (0, None))
+        last_event = time.monotonic()
+
+        def report(done, total=None):
+            nonlocal last_event
+            self._progress[job_id] = (done, total)
+            if time.monotonic() - last_event >= PROGRESS_EVENT_INTERVAL:
+                last_event = time.monotonic()
+                publish_job(job, (done, total))
+
+        try:
+            result = JOB_HANDLERS[job.kind](job, report)
+            status, error = 'succeeded', None
+        except Exception as e:
+            db.session.rollback()
+            result, status = None, 'failed'
+            error = str(e) if isinstance(e, JobError) else '任务执行失败'
+            if not isinstance(e, JobError):
+                current_app.logger.exception(f'后台任务出错 (Job: {job_id}, Type: {job.kind})')
+
+        done, total = self._progress.pop(job_id)
+        job = db.session.get(Job, job_id)
+        job.status = status
+        job.error = error
+        job.result = json.dumps(result, ensure_ascii=False) if result is not None else None
+        job.progress = total if status == 'succeeded' and total is not None else done
+        job.total = total
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        publish_job(job)
+
+def init_job_queue(app):
+    """
+    Creates the app's JobQueue (Config.JOB_WORKERS threads). It is started by
+    the first request the app serves, unless BACKGROUND_WORKERS is off, so
+    processes that only import the app never claim or fail jobs.
+    """
+    job_queue = JobQueue(app, app.config['JOB_WORKERS'])
+    app.extensions['job_queue'] = job_queue
+    if app.config['BACKGROUND_WORKERS']:
+        app.before_request(job_queue.start)
+    return job_queue
+
+def enqueue_job(kind, project_id=None, file_id=None, params=None):
+    """
+    Creates a queued job and hands it to the workers. Commits the current
+    session, so rows the job depends on (e.g. a new File) are committed with it.
+    """
+    job = Job(id=str(uuid.uuid4()), kind=kind, project_id=project_id, file_id=file_id,
+              params=json.dumps(params or {}, ensure_ascii=False))
+    db.session.add(job)
+    db.session.commit()
+    current_app.extensions['job_queue'].submit(job.id)
+    return job
+
+def job_progress(job):
+    """
+    (done, total) of a job for Job.to_dict: from memory while it runs in this
+    process, else as its row last recorded it (at most a heartbeat behind for
+    jobs running in other processes).
+    """
+    progress = current_app.extensions['job_queue'].progress(job.id)
+    return progress if progress is not None else (job.progress, job.total)
+
+def _export_cache():
+    return ExportCache(current_app.config['EXPORT_CACHE_DIR'], current_app.config['EXPORT_CACHE_MAX_BYTES'])
+
+def _remove_upload(file):
+    """Drops a file whose background ingestion failed, row and saved upload."""
+    db.session.rollback()
+    file_path = file.file_path
+    released = release_file_blobs([file])
+    delete_file_rows([file.id])
+    db.session.commit()
+    wake_reaper()
+    if released:
+        get_blob_store().collect(*released)
+    elif os.path.exists(file_path):
+        os.remove(file_path)
+
+@job_handler('ingest')
+def ingest_job(job, report):
+    """Parses a saved upload into segments (upload with ?async=1)."""
+    file = db.session.get(File, job.file_id)
+    if file is None:
+        raise JobError('文件不存在')
+    project = db.session.get(Project, file.project_id)
+    file_format = get_format(file.file_format)
+    if file.blob_hash:
+        # Content uploaded before comes straight from the blob store's parse cache
+        pairs = get_blob_store().iter_segments(file.blob_hash, file_format, project.language_pair)
+    else:
+        pairs = iter_file_segments(file.file_path, file_format, language_pair=project.language_pair)
+    try:
+        result = insert_segments(file.id, pairs, language_pair=project.language_pair, progress=report)
+    except UnicodeDecodeError:
+        _remove_upload(file)
+        raise JobError('无法读取文件内容，请确保文件为UTF-8编码')
+    except INVALID_FORMAT_ERRORS:
+        _remove_upload(file)
+        raise JobError(file_format.invalid_message)
+    if not result.segment_total:
+        _remove_upload(file)
+        raise JobError(file_format.empty_message)
+
+    file.apply_count_delta(result.segment_total, result.translated_total)
+    project.last_modified = datetime.now()
+    db.session.commit()
+    publish_file_added(file, project)
+    report(result.segment_total, result.segment_total)
+    return {'segments': result.segment_total, 'prefilled': result.prefilled_total}
+
+@job_handler('pretranslate')
+def pretranslate_job(job, report):
+    """Machine translates a file's untranslated segments, committing after every window."""
+    file = db.session.get(File, job.file_id)
+    if file is None:
+        raise JobError('文件不存在')
+    project = db.session.get(Project, file.project_id)
+    try:
+        engine = get_engine(json.loads(job.params).get('engine'))
+    except ValueError:
+        raise JobError('未知的机器翻译引擎')
+    untranslated = file.segment_count - file.translated_count
+
+    def window_done(processed):
+        db.session.commit()
+        publish_file_changes(project, {file.id: None})
+        report(processed, untranslated)
+
+    result = pretranslate_file(file, project.language_pair, engine, progress=window_done)
+    if result.translated:
+        project.last_modified = datetime.now()
+    db.session.commit()
+    return {'engine': result.engine, 'requested': result.requested, 'cached': result.cached,
+            'translated': result.translated}
+
+@job_handler('export')
+def export_job(job, report):
+    """Renders a file's export (in params['format'], else its own format) into the ExportCache."""
+    file = db.session.get(File, job.file_id)
+    if file is None:
+        raise JobError('文件不存在')
+    file_format = get_format(json.loads(job.params).get('format') or file.file_format)
+    cache = _export_cache()
+    if cache.get(file.id, file.revision, file_format.name) is None:
+        written = 0
+        for chunk in cache.fill(file.id, file.revision, file_format.name, export_chunks(file, file_format)):
+            written += len(chunk)
+            report(written)
+    return {'revision': file.revision, 'format': file_format.name}
+
+@job_handler('delete_project')
+def delete_project_job(job, report):
+    """Deletes a project with its files, segments, cached exports and directory."""
+    project = db.session.get(Project, job.project_id)
+    if project is None:
+        return {'deleted': False}
+    files = db.session.query(File.id, File.blob_hash).filter_by(project_id=project.id).all()
+    released = release_file_blobs(files)
+    # Rows only: segments and the project directory are left to the reaper
+    delete_project_rows(project.id)
+    db.session.commit()
+    publish('project-deleted', {'projectId': job.project_id}, job.project_id)
+    move_to_trash(os.path.join(PROJECTS_DIR, job.project_id))
+    wake_reaper()
+    _export_cache().discard_files(file.id for file in files)
+    get_blob_store().collect(*released)
+    return {'deleted': True}
@@ -1,9 +1,40 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm.util import identity_key
 from datetime import datetime
 import json
+from utils import source_hash
 
 db = SQLAlchemy()
 
+
+# 一次传播 UPDATE 中最多处理的原文哈希数
+PROPAGATE_BATCH_SIZE = 500
+
+
+def completion_rate_expr(translated, total):
+    """完成率的 SQL 表达式 (四舍五入的百分比), 计数更新和对账共用"""
+    return db.case((total > 0, db.cast(db.func.round(translated * 100.0 / total), db.Integer)),
+                   else_=0)
+
+
+def _apply_count_delta(model, key, segment_delta, translated_delta, **extra_values):
+    """在 SQL 中原子地累加一行的计数并同时重算完成率 (SET 右侧引用的是旧值)"""
+    table = model.__table__
+    values = dict(segment_count=table.c.segment_count + segment_delta,
+                  translated_count=table.c.translated_count + translated_delta,
+                  completion_rate=completion_rate_expr(table.c.translated_count + translated_delta,
+                                                       table.c.segment_count + segment_delta),
+                  **extra_values)
+    db.session.execute(table.update().where(table.c.id == key)
+                       .values(**values, **_keep_last_modified(table)))
+
+
+def _keep_last_modified(table):
+    """计数变化本身不算项目修改, 显式保留 last_modified 以免触发 onupdate"""
+    if 'last_modified' in table.c:
+        return {'last_modified': table.c.last_modified}
+    return {}
+
 # 新增 Segment 模型
 class Segment(db.Model):
     """段落模型"""
@@ -12,9 +43,13 @@ class Segment(db.Model):
     segment_index = db.Column(db.Integer, nullable=False) # 段落在文件中的顺序
     original_text = db.Column(db.Text, nullable=False)
     translated_text = db.Column(db.Text, nullable=False, default='') # 默认为空字符串
+    # utils.source_hash(原文), 相同哈希的段落构成一个重复组; 旧数据在启动时回填
+    source_hash = db.Column(db.BigInteger, nullable=True)
 
     # 确保 file_id 和 segment_index 组合唯一
-    __table_args__ = (db.UniqueConstraint('file_id', 'segment_index', name='_file_segment_uc'),)
+    __table_args__ = (db.UniqueConstraint('file_id', 'segment_index', name='_file_segment_uc'),
+                      # 重复组的查找和传播按 (哈希, 文件) 走索引
+                      db.Index('ix_segment_source_hash_file', 'source_hash', 'file_id'))
 
     def to_dict(self):
         """转换为字典表示 (主要在File.to_dict中使用)"""
@@ -24,6 +59,49 @@ class Segment(db.Model):
             'translated': self.translated_text
         }
 
+    @staticmethod
+    def apply_translations(file_id, translations):
+        """
+        按 {segment_index: text} 批量更新译文, 只触及给定的行.
+
+        Returns:
+            (translated_delta, translated_pairs):
+            已翻译段落数量的变化量 (新增非空译文 - 被清空的译文),
+            以及本次写入的非空译文 [(原文, 译文)], 供翻译记忆使用.
+
+        Raises:
+            KeyError: 如果某个 segment_index 不存在于该文件中.
+        """
+        if not translations:
+            return 0, []
+
+        # 只读取这些行的原文和"是否已翻译"状态, 用于计算增量
+        previous = {index: (original_text, was_translated)
+                    for index, original_text, was_translated in
+                    db.session.query(Segment.segment_index, Segment.original_text,
+                                     Segment.translated_text != '')
+                    .filter(Segment.file_id == file_id,
+                            Segment.segment_index.in_(list(translations)))
+                    .all()}
+        missing = [index for index in translations if index not in previous]
+        if missing:
+            raise KeyError(missing)
+
+        table = Segment.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.file_id == db.bindparam('b_file_id'),
+                   table.c.segment_index == db.bindparam('b_index'))
+            .values(translated_text=db.bindparam('b_text')),
+            [{'b_file_id': file_id, 'b_index': index, 'b_text': text}
+             for index, text in translations.items()]
+        )
+
+        translated_delta = sum(int(text != '') - int(bool(previous[index][1]))
+                               for index, text in translations.items())
+        translated_pairs = [(previous[index][0], text) for index, text in translations.items() if text]
+        return translated_delta, translated_pairs
+
 
 class Project(db.Model):
     """项目模型"""
@@ -33,43 +111,67 @@ class Project(db.Model):
     creation_date = db.Column(db.DateTime, default=datetime.utcnow)
     last_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     completion_rate = db.Column(db.Integer, default=0)
+    # 语言对, 翻译记忆按语言对区分 (未设置时为空字符串)
+    source_language = db.Column(db.String(16), nullable=False, default='', server_default='')
+    target_language = db.Column(db.String(16), nullable=False, default='', server_default='')
+    # 所有文件计数的汇总, 随每次写入增量维护
+    segment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    translated_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # 关联关系
     files = db.relationship('File', backref='project', lazy=True, cascade="all, delete-orphan")
+    upload_sessions = db.relationship('UploadSession', backref='project', lazy=True, cascade="all, delete-orphan")
     
-    def to_dict(self):
-        """转换为字典表示"""
+    def to_dict(self, include_segments=True):
+        """转换为字典表示 (include_segments=False 时文件只包含元数据, 不加载段落)"""
         return {
             'id': self.id,
             'name': self.name,
             'description': self.description or '',
+            'sourceLanguage': self.source_language,
+            'targetLanguage': self.target_language,
             'creationDate': self.creation_date.isoformat(),
             'lastModified': self.last_modified.isoformat(),
-            'files': [file.to_dict() for file in self.files],
-            'completionRate': self.completion_rate
+            'files': [file.to_dict(include_segments=include_segments) for file in self.files],
+            'completionRate': self.completion_rate,
+            'segmentCount': self.segment_count,
+            'translatedCount': self.translated_count
         }
-    
-    def update_completion_rate(self):
-        """更新项目完成率"""
-        if not self.files:
-            self.completion_rate = 0
-            return
-        
-        total_segments = 0
-        completed_segments = 0
-
-        for file in self.files:
-            try:
-                # 使用新的方式计算
-                segments_count = file.segments.count() # 查询段落数量
-                total_segments += segments_count
-                # 查询已翻译段落数量 (使用 with_parent 优化查询)
-                completed_segments += Segment.query.with_parent(file).filter(Segment.translated_text != '').count()
-            except Exception as e:
-                # 考虑日志记录 file.id
-                print(f"Error calculating completion rate for file {file.id}: {str(e)}")
-
-        self.completion_rate = round((completed_segments / total_segments) * 100) if total_segments > 0 else 0
+
+    def to_summary_dict(self, file_count):
+        """项目列表使用的轻量表示, 文件数由 summaries() 的聚合查询提供"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description or '',
+            'sourceLanguage': self.source_language,
+            'targetLanguage': self.target_language,
+            'creationDate': self.creation_date.isoformat(),
+            'lastModified': self.last_modified.isoformat(),
+            'completionRate': self.completion_rate,
+            'fileCount': file_count,
+            'segmentCount': self.segment_count,
+            'translatedCount': self.translated_count
+        }
+
+    @staticmethod
+    def summaries():
+        """一次 GROUP BY 汇总所有项目的文件数, 段落计数直接取自项目汇总列"""
+        rows = (db.session.query(Project, db.func.count(File.id))
+                .outerjoin(File, File.project_id == Project.id)
+                .group_by(Project.id)
+                .all())
+        return [project.to_summary_dict(file_count) for project, file_count in rows]
+
+    @property
+    def language_pair(self):
+        """(source_language, target_language), 翻译记忆的分区键"""
+        return self.source_language, self.target_language
+
+    def apply_count_delta(self, segment_delta=0, translated_delta=0):
+        """按增量更新项目计数和完成率, 与文件数量无关 (O(1))"""
+        _apply_count_delta(Project, self.id, segment_delta, translated_delta)
+        db.session.expire(self, ['segment_count', 'translated_count', 'completion_rate'])
 
 class File(db.Model):
     """文件模型"""
@@ -81,6 +183,15 @@ class File(db.Model):
     # original_segments = db.Column(db.Text, nullable=False)
     # translated_segments = db.Column(db.Text, nullable=False)
     completion_rate = db.Column(db.Integer, default=0)
+    # 段落总数 / 已翻译段落数, 随每次写入增量维护
+    segment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    translated_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 每次段落写入递增, 用作导出缓存键和 ETag
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 上传文件的格式 (formats.FORMATS 的键), 默认导出为同一格式
+    file_format = db.Column(db.String(16), nullable=False, default='seg', server_default='seg')
+    # 内容寻址存储中上传内容的 SHA-256 (见 blobs.py), file_path 指向该 blob; 旧文件为空
+    blob_hash = db.Column(db.String(64), index=True)
 
     # 外键
     project_id = db.Column(db.String(36), db.ForeignKey('project.id'), nullable=False)
@@ -93,35 +204,345 @@ class File(db.Model):
 
     # 移除旧的 @property 方法
 
-    def to_dict(self):
-        """转换为字典表示"""
-        # 从关系中获取段落
-        ordered_segments = self.segments.order_by(Segment.segment_index).all()
-        original_list = [seg.original_text for seg in ordered_segments]
-        translated_list = [seg.translated_text for seg in ordered_segments]
-
-        return {
+    def to_dict(self, include_segments=True):
+        """转换为字典表示 (include_segments=False 时跳过段落查询)"""
+        data = {
             'id': self.id,
             'fileName': self.file_name,
             'filePath': self.file_path, # 考虑是否真的需要暴露完整路径给前端
             'uploadDate': self.upload_date.isoformat(),
-            'originalSegments': original_list,
-            'translatedSegments': translated_list,
-            'completionRate': self.completion_rate
+            'completionRate': self.completion_rate,
+            'segmentCount': self.segment_count,
+            'translatedCount': self.translated_count,
+            'revision': self.revision,
+            'format': self.file_format
         }
+        if include_segments:
+            # 只查询两列, 不构建 Segment 对象
+            rows = (db.session.query(Segment.original_text, Segment.translated_text)
+                    .filter(Segment.file_id == self.id)
+                    .order_by(Segment.segment_index)
+                    .all())
+            data['originalSegments'] = [original for original, _ in rows]
+            data['translatedSegments'] = [translated for _, translated in rows]
+        return data
+
+    def apply_count_delta(self, segment_delta=0, translated_delta=0):
+        """
+        按增量更新文件及其所属项目的计数和完成率, 并递增文件 revision.
+
+        所有段落写入都应调用此方法. 文件行必须已写入数据库 (新建文件需先 flush).
+        """
+        _apply_count_delta(File, self.id, segment_delta, translated_delta,
+                           revision=File.__table__.c.revision + 1)
+        _apply_count_delta(Project, self.project_id, segment_delta, translated_delta)
+        db.session.expire(self, ['segment_count', 'translated_count', 'completion_rate', 'revision'])
+        project = db.session.identity_map.get(identity_key(Project, self.project_id))
+        if project is not None:
+            db.session.expire(project, ['segment_count', 'translated_count', 'completion_rate'])
+
+    def propagate_translations(self, translated_pairs, scope='file', changes=None):
+        """
+        把新确认的译文传播到原文相同 (按 source_hash) 且尚未翻译的段落.
+
+        每批哈希只执行一条集合式 UPDATE (CASE source_hash WHEN ... THEN 译文),
+        已有译文的段落不会被覆盖. 受影响文件 (及项目) 的计数按增量更新.
+
+        Args:
+            translated_pairs: [(原文, 译文)], 如 Segment.apply_translations 的返回值.
+            scope: 'file' 只在本文件内传播, 'project' 传播到同一项目的所有文件.
+            changes: 可选的字典, 填充的段落按 {file_id: {segment_index: 译文}} 记入其中
+                     (用于推送增量事件).
+
+        Returns:
+            被填充的段落数量.
+        """
+        targets = {}
+        for original_text, text in translated_pairs:
+            if text:
+                targets[source_hash(original_text)] = text
+        if not targets:
+            return 0
+
+        table = Segment.__table__
+        if scope == 'project':
+            in_scope = table.c.file_id.in_(db.select(File.id).where(File.project_id == self.project_id)
+                                           .scalar_subquery())
+        else:
+            in_scope = table.c.file_id == self.id
+
+        hashes = list(targets)
+        propagated_by_file = {}
+        for start in range(0, len(hashes), PROPAGATE_BATCH_SIZE):
+            batch = hashes[start:start + PROPAGATE_BATCH_SIZE]
+            condition = db.and_(table.c.source_hash.in_(batch), table.c.translated_text == '', in_scope)
+            # 先按文件统计将被填充的行数 (同一事务内, 与随后的 UPDATE 一致)
+            if changes is None:
+                counts = db.session.execute(
+                    db.select(table.c.file_id, db.func.count()).where(condition).group_by(table.c.file_id)
+                ).all()
+            else:
+                batch_counts = {}
+                for file_id, segment_index, row_hash in db.session.execute(
+                        db.select(table.c.file_id, table.c.segment_index, table.c.source_hash).where(condition)):
+                    changes.setdefault(file_id, {})[segment_index] = targets[row_hash]
+                    batch_counts[file_id] = batch_counts.get(file_id, 0) + 1
+                counts = list(batch_counts.items())
+            if not counts:
+                continue
+            db.session.execute(
+                table.update().where(condition)
+                .values(translated_text=db.case({row_hash: targets[row_hash] for row_hash in batch},
+                                                value=table.c.source_hash,
+                                                else_=table.c.translated_text))
+            )
+            for file_id, count in counts:
+                propagated_by_file[file_id] = propagated_by_file.get(file_id, 0) + count
+
+        for file_id, count in propagated_by_file.items():
+            target_file = self if file_id == self.id else db.session.get(File, file_id)
+            target_file.apply_count_delta(translated_delta=count)
+        return sum(propagated_by_file.values())
+
+    def repetitions(self):
+        """文件内出现多次的原文: [(source_hash, 首个段落索引, 次数)], 按首次出现排序"""
+        first_index = db.func.min(Segment.segment_index)
+        return (db.session.query(Segment.source_hash, first_index, db.func.count())
+                .filter(Segment.file_id == self.id, Segment.source_hash.isnot(None))
+                .group_by(Segment.source_hash)
+                .having(db.func.count() > 1)
+                .order_by(first_index)
+                .all())
+
+    def etag(self, variant):
+        """基于 revision 的弱 ETag 值, variant 区分同一文件的不同表示"""
+        return f'{self.id}-{self.revision}-{variant}'
+
+
+class TranslationMemory(db.Model):
+    """翻译记忆: 每个语言对下, 规范化原文 (按哈希) 对应的最新译文"""
+    __tablename__ = 'translation_memory'
+    id = db.Column(db.Integer, primary_key=True)
+    source_language = db.Column(db.String(16), nullable=False)
+    target_language = db.Column(db.String(16), nullable=False)
+    source_hash = db.Column(db.BigInteger, nullable=False) # tm.source_hash(原文)
+    source_text = db.Column(db.Text, nullable=False)
+    target_text = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 精确匹配查询只走这个唯一索引
+    __table_args__ = (db.UniqueConstraint('source_language', 'target_language', 'source_hash',
+                                          name='_tm_pair_hash_uc'),)
+
+
+class TranslationMemoryBand(db.Model):
+    """模糊匹配的 LSH 索引: 每个翻译记忆原文的每个 MinHash 分段对应一行 (见 tm.sketch_buckets)"""
+    __tablename__ = 'translation_memory_band'
+    bucket = db.Column(db.BigInteger, primary_key=True) # 语言对 + 分段序号 + 分段内 MinHash 值的哈希
+    source_hash = db.Column(db.BigInteger, primary_key=True) # 对应 TranslationMemory.source_hash
+
+    # 候选查询只读主键, 不需要 rowid
+    __table_args__ = {'sqlite_with_rowid': False}
+
+
+def delete_file_rows(file_ids):
+    """
+    用集合语句删除文件行 (调用方提交). 段落不在此删除: 每个文件记一条
+    DeletedFile 墓碑, 由后台 reaper 分批清除; 段落只能经由文件访问,
+    因此文件行删除后即不可见.
+    """
+    file_ids = list(file_ids)
+    if not file_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(DeletedFile.__table__.insert(), [{'file_id': file_id, 'deleted_at': now}
+                                                       for file_id in file_ids])
+    file_table = File.__table__
+    db.session.execute(file_table.delete().where(file_table.c.id.in_(file_ids)))
+
+
+def delete_project_rows(project_id):
+    """用集合语句删除项目及其文件和上传会话的行 (调用方提交), 段落同 delete_file_rows"""
+    file_table = File.__table__
+    db.session.execute(DeletedFile.__table__.insert().from_select(
+        ['file_id', 'deleted_at'],
+        db.select(file_table.c.id, db.literal(datetime.utcnow(), db.DateTime)).where(file_table.c.project_id == project_id)
+    ))
+    db.session.execute(file_table.delete().where(file_table.c.project_id == project_id))
+    session_table = UploadSession.__table__
+    db.session.execute(session_table.delete().where(session_table.c.project_id == project_id))
+    project_table = Project.__table__
+    db.session.execute(project_table.delete().where(project_table.c.id == project_id))
+
+
+def reconcile_counters():
+    """从 segment 表重建所有文件和项目的计数与完成率 (计数漂移时使用)"""
+    file_table = File.__table__
+    project_table = Project.__table__
+    segment_table = Segment.__table__
+
+    segment_total = (db.select(db.func.count())
+                     .where(segment_table.c.file_id == file_table.c.id)
+                     .scalar_subquery())
+    segment_translated = (db.select(db.func.count())
+                          .where(segment_table.c.file_id == file_table.c.id,
+                                 segment_table.c.translated_text != '')
+                          .scalar_subquery())
+    db.session.execute(file_table.update().values(segment_count=segment_total,
+                                                  translated_count=segment_translated))
+
+    file_total = (db.select(db.func.coalesce(db.func.sum(file_table.c.segment_count), 0))
+                  .where(file_table.c.project_id == project_table.c.id)
+                  .scalar_subquery())
+    file_translated = (db.select(db.func.coalesce(db.func.sum(file_table.c.translated_count), 0))
+                       .where(file_table.c.project_id == project_table.c.id)
+                       .scalar_subquery())
+    db.session.execute(project_table.update().values(segment_count=file_total,
+                                                     translated_count=file_translated,
+                                                     **_keep_last_modified(project_table)))
+
+    # 计数写入后再按新值重算完成率
+    for table in (file_table, project_table):
+        db.session.execute(table.update().values(
+            completion_rate=completion_rate_expr(table.c.translated_count, table.c.segment_count),
+            **_keep_last_modified(table)))
+    db.session.commit()
+
+
+class MTCacheEntry(db.Model):
+    """机器翻译结果缓存 (见 mt.MTCache), 按引擎、引擎版本、语言对和规范化原文寻址"""
+    __tablename__ = 'mt_cache'
+    # mt.mt_cache_key(...) 的 64 位哈希, 直接作为 rowid
+    cache_key = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    engine = db.Column(db.String(64), nullable=False)
+    engine_version = db.Column(db.String(32), nullable=False)
+    source_language = db.Column(db.String(16), nullable=False)
+    target_language = db.Column(db.String(16), nullable=False)
+    source_text = db.Column(db.Text, nullable=False) # 规范化后的原文, 用于排除哈希冲突
+    target_text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True) # TTL 按写入时间计算
+    last_used_at = db.Column(db.DateTime, nullable=False, index=True) # LRU 淘汰顺序
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Blob(db.Model):
+    """内容寻址存储中的上传内容 (见 blobs.BlobStore), 按引用它的 File 行计数"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # 最近一次获取引用的时间: 批量上传在 File 行提交前就提交引用, sweep 不重算最近获取过的 blob
+    acquired_at = db.Column(db.DateTime, nullable=True)
+
+
+class UploadSession(db.Model):
+    """分块续传的上传会话 (见 uploads.py). 已接收的字节写在 UPLOAD_SESSION_DIR/<id>.part, 其大小即为续传偏移"""
+    __tablename__ = 'upload_session'
+    id = db.Column(db.String(36), primary_key=True)
+    project_id = db.Column(db.String(36), db.ForeignKey('project.id'), nullable=False, index=True)
+    file_name = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False) # 客户端声明的文件总字节数
+    sha256 = db.Column(db.String(64)) # 客户端声明的校验和 (可选), 完成时核对
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True) # 过期按最后写入时间计算
+
+
+class DeletedFile(db.Model):
+    """已删除文件的墓碑: 文件行已删除, 其段落由 reaper.py 在后台分批清除"""
+    __tablename__ = 'deleted_file'
+    file_id = db.Column(db.String(36), primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    """后台任务 (见 jobs.py). 不设外键: 删除项目的任务在项目删除后仍可查询"""
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False) # jobs.JOB_HANDLERS 中的键
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True) # queued/running/succeeded/failed
+    project_id = db.Column(db.String(36), nullable=True, index=True)
+    file_id = db.Column(db.String(36), nullable=True)
+    params = db.Column(db.Text, nullable=False, default='{}') # JSON
+    result = db.Column(db.Text, nullable=True) # JSON, 成功时写入
+    error = db.Column(db.Text, nullable=True)
+    # 进度: 已处理数量 / 总数 (总数未知时为空); 运行中的进度保存在内存中, 结束时写入
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # 运行中的任务由其所属进程 (jobs.JobQueue.owner) 定期刷新心跳; 心跳过期说明该进程已退出
+    owner = db.Column(db.String(64), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self, progress=None):
+        """转换为字典表示; progress 为运行中任务的 (已处理, 总数), 覆盖数据库中的值"""
+        done, total = progress if progress is not None else (self.progress, self.total)
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'projectId': self.project_id,
+            'fileId': self.file_id,
+            'params': json.loads(self.params),
+            'result': json.loads(self.result) if self.result is not None else None,
+            'error': self.error,
+            'progress': done,
+            'total': total,
+            'createdAt': self.created_at.isoformat(),
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+def backfill_source_hashes(chunk_size=5000):
+    """为旧数据中 source_hash 为空的段落计算原文哈希"""
+    table = Segment.__table__
+    statement = (table.update().where(table.c.id == db.bindparam('b_id'))
+                 .values(source_hash=db.bindparam('b_hash')))
+    filled = 0
+    last_id = 0
+    while True:
+        rows = (db.session.query(Segment.id, Segment.original_text)
+                .filter(Segment.source_hash.is_(None), Segment.id > last_id)
+                .order_by(Segment.id)
+                .limit(chunk_size)
+                .all())
+        if not rows:
+            break
+        db.session.execute(statement, [{'b_id': segment_id, 'b_hash': source_hash(original_text)}
+                                       for segment_id, original_text in rows])
+        filled += len(rows)
+        last_id = rows[-1][0]
+    db.session.commit()
+    return filled
+
+
+def upgrade_schema():
+    """
+    为已存在的表补上模型中新增的列和索引 (create_all 不会修改已有表).
 
-    def update_completion_rate(self):
-        """更新文件完成率"""
-        try:
-            # 使用新的方式计算
-            total_segments = self.segments.count()
-            if total_segments == 0:
-                self.completion_rate = 0
-                return
-
-            completed_segments = self.segments.filter(Segment.translated_text != '').count()
-            self.completion_rate = round((completed_segments / total_segments) * 100)
-
-        except Exception as e:
-            print(f"Error updating file completion rate (File ID: {self.id}): {str(e)}")
-            self.completion_rate = 0
+    Returns:
+        新增列的 "表名.列名" 列表.
+    """
+    inspector = db.inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT '{column.server_default.arg}'" if not column.nullable \
+                        else f" DEFAULT '{column.server_default.arg}'"
+                connection.execute(db.text(ddl))
+                added.append(f'{table.name}.{column.name}')
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection)
+    return added
@@ -0,0 +1,380 @@
+import hashlib
+import importlib
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Segment, MTCacheEntry
+from utils import normalize_source
+
+# Untranslated segments read (and dispatched) per round of pretranslate_file
+PRETRANSLATE_WINDOW = 5000
+
+# Maximum number of cache keys bound into one IN (...) lookup
+CACHE_LOOKUP_BATCH_SIZE = 500
+
+PretranslateResult = namedtuple('PretranslateResult', ['engine', 'requested', 'cached', 'translated'])
+
+class EngineError(Exception):
+    """An engine call failed; the dispatcher gives up on the batch."""
+
+class TransientEngineError(EngineError):
+    """An engine call failed in a way worth retrying (timeouts, rate limiting, 5xx)."""
+
+class RateLimiter:
+    """Thread-safe token bucket: at most rate calls per second, bursts up to burst."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class TranslationEngine:
+    """
+    Base class of machine translation engines.
+
+    Subclasses implement translate(); the class attributes below are defaults
+    that the engine's entry in config.MT_ENGINES can override.
+    """
+    name = None
+    version = '1'
+    max_batch_segments = 50     # source strings per translate() call
+    max_batch_tokens = 4000     # estimated tokens per translate() call
+    concurrency = 4             # translate() calls in flight
+    requests_per_second = None  # None = not rate limited
+    max_retries = 3             # retries of a TransientEngineError
+    retry_delay = 0.5           # seconds, doubled after every retry
+
+    def __init__(self, name, **options):
+        self.name = name
+        for key, value in options.items():
+            if not hasattr(self, key):
+                raise ValueError(f"Unknown option '{key}' for engine '{name}'")
+            setattr(self, key, value)
+        self.rate_limiter = RateLimiter(self.requests_per_second) if self.requests_per_second else None
+
+    def estimate_tokens(self, text):
+        """Rough token count used to bound batches (about 4 UTF-8 bytes per token)."""
+        return len(text.encode('utf-8')) // 4 + 1
+
+    def translate(self, texts, language_pair):
+        """
+        Translates a batch of source strings.
+
+        Args:
+            texts: List of source strings.
+            language_pair: (source_language, target_language).
+
+        Returns:
+            List of translations in the same order as texts.
+
+        Raises:
+            TransientEngineError: For failures that may succeed when retried.
+            EngineError: For anything else.
+        """
+        raise NotImplementedError
+
+class LocalEngine(TranslationEngine):
+    """
+    Deterministic offline stand-in: "[target] source". latency (seconds per
+    call) simulates a remote service for benchmarks of the dispatcher.
+    """
+    latency = 0.0
+
+    def translate(self, texts, language_pair):
+        if self.latency:
+            time.sleep(self.latency)
+        _, target_language = language_pair
+        return [f'[{target_language}] {text}' for text in texts]
+
+def get_engine(name=None):
+    """
+    Returns the engine instance registered under name in config.MT_ENGINES
+    (Config.MT_ENGINE by default). Instances are kept per app so rate limits
+    are shared by all requests.
+
+    Raises:
+        ValueError: If no engine with that name is configured.
+    """
+    name = name or current_app.config['MT_ENGINE']
+    engines = current_app.extensions.setdefault('mt_engines', {})
+    if name not in engines:
+        try:
+            options = dict(current_app.config['MT_ENGINES'][name])
+        except KeyError:
+            raise ValueError(f"Unknown MT engine '{name}', expected one of: {', '.join(current_app.config['MT_ENGINES'])}")
+        module_name, class_name = options.pop('class').rsplit('.', 1)
+        engine_class = getattr(importlib.import_module(module_name), class_name)
+        engines[name] = engine_class(name, **options)
+    return engines[name]
+
+def mt_cache_key(engine, language_pair, normalized_source):
+    """Signed 64-bit key of (engine, engine version, language pair, normalized source)."""
+    key = '\t'.join((engine.name, engine.version, *language_pair, normalized_source))
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+class MTCache:
+    """
+    Persistent cache of engine output in the mt_cache table.
+
+    Entries are addressed by engine, engine version, language pair and
+    normalized source, so bumping an engine's version invalidates its
+    entries. Entries older than ttl seconds are ignored and purged; beyond
+    max_entries the least recently used are evicted. Hit/miss counters are
+    kept per app process. Reads and writes run in the caller's transaction.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _fresh_after(self, now):
+        return now - timedelta(seconds=self.ttl) if self.ttl else None
+
+    def lookup(self, engine, language_pair, texts):
+        """Returns {index in texts: cached translation} for the texts with a fresh entry."""
+        source_language, target_language = language_pair
+        now = datetime.utcnow()
+        fresh_after = self._fresh_after(now)
+        wanted = {}
+        for index, text in enumerate(texts):
+            normalized = normalize_source(text)
+            wanted.setdefault(mt_cache_key(engine, language_pair, normalized), []).append((index, normalized))
+
+        found = {}
+        hit_keys = []
+        keys = list(wanted)
+        for start in range(0, len(keys), CACHE_LOOKUP_BATCH_SIZE):
+            query = (db.session.query(MTCacheEntry.cache_key, MTCacheEntry.engine, MTCacheEntry.engine_version,
+                                      MTCacheEntry.source_language, MTCacheEntry.target_language,
+                                      MTCacheEntry.source_text, MTCacheEntry.target_text)
+                     .filter(MTCacheEntry.cache_key.in_(keys[start:start + CACHE_LOOKUP_BATCH_SIZE])))
+            if fresh_after is not None:
+                query = query.filter(MTCacheEntry.created_at >= fresh_after)
+            for key, name, version, source, target, source_text, target_text in query:
+                # A 64-bit key collision would map a different source here
+                if (name, version, source, target) != (engine.name, engine.version, source_language, target_language):
+                    continue
+                matched = False
+                for index, normalized in wanted[key]:
+                    if normalized == source_text:
+                        found[index] = target_text
+                        matched = True
+                if matched:
+                    hit_keys.append(key)
+
+        if hit_keys:
+            table = MTCacheEntry.__table__
+            db.session.execute(
+                table.update().where(table.c.cache_key == db.bindparam('b_key'))
+                .values(last_used_at=now, hits=table.c.hits + 1),
+                [{'b_key': key} for key in hit_keys]
+            )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def store(self, engine, language_pair, texts, translations):
+        """Adds (or refreshes) entries for engine output, then evicts."""
+        source_language, target_language = language_pair
+        now = datetime.utcnow()
+        rows = {}
+        for text, translation in zip(texts, translations):
+            normalized = normalize_source(text)
+            key = mt_cache_key(engine, language_pair, normalized)
+            rows[key] = {
+                'cache_key': key,
+                'engine': engine.name,
+                'engine_version': engine.version,
+                'source_language': source_language,
+                'target_language': target_language,
+                'source_text': normalized,
+                'target_text': translation,
+                'created_at': now,
+                'last_used_at': now,
+                'hits': 0
+            }
+        if not rows:
+            return
+        statement = sqlite_insert(MTCacheEntry.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['cache_key'],
+            set_={column: statement.excluded[column]
+                  for column in ('source_text', 'target_text', 'created_at', 'last_used_at', 'hits')}
+        )
+        db.session.execute(statement, list(rows.values()))
+        with self._lock:
+            self.stores += len(rows)
+        self.evict()
+
+    def evict(self):
+        """Deletes expired entries and the least recently used ones beyond max_entries."""
+        table = MTCacheEntry.__table__
+        evicted = 0
+        fresh_after = self._fresh_after(datetime.utcnow())
+        if fresh_after is not None:
+            evicted += db.session.execute(table.delete().where(table.c.created_at < fresh_after)).rowcount
+        excess = db.session.query(db.func.count(MTCacheEntry.cache_key)).scalar() - self.max_entries
+        if excess > 0:
+            oldest = (db.select(table.c.cache_key).order_by(table.c.last_used_at, table.c.cache_key)
+                      .limit(excess).scalar_subquery())
+            evicted += db.session.execute(table.delete().where(table.c.cache_key.in_(oldest))).rowcount
+        with self._lock:
+            self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': db.session.query(db.func.count(MTCacheEntry.cache_key)).scalar(),
+                'maxEntries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else None,
+                'stores': self.stores,
+                'evictions': self.evictions
+            }
+
+def get_mt_cache():
+    """The app's MTCache (Config.MT_CACHE_MAX_ENTRIES / MT_CACHE_TTL); None when disabled."""
+    if not current_app.config['MT_CACHE_MAX_ENTRIES']:
+        return None
+    if 'mt_cache' not in current_app.extensions:
+        current_app.extensions['mt_cache'] = MTCache(current_app.config['MT_CACHE_MAX_ENTRIES'],
+                                                     current_app.config['MT_CACHE_TTL'])
+    return current_app.extensions['mt_cache']
+
+def make_batches(engine, texts):
+    """Splits texts into consecutive batches bounded by the engine's segment and token limits."""
+    batches = []
+    batch = []
+    tokens = 0
+    for text in texts:
+        cost = engine.estimate_tokens(text)
+        if batch and (len(batch) >= engine.max_batch_segments or tokens + cost > engine.max_batch_tokens):
+            batches.append(batch)
+            batch = []
+            tokens = 0
+        batch.append(text)
+        tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _translate_batch(engine, batch, language_pair):
+    """One translate() call honouring the rate limit, retrying transient failures with backoff."""
+    for attempt in range(engine.max_retries + 1):
+        if engine.rate_limiter is not None:
+            engine.rate_limiter.acquire()
+        try:
+            translations = engine.translate(batch, language_pair)
+        except TransientEngineError:
+            if attempt == engine.max_retries:
+                raise
+            time.sleep(engine.retry_delay * 2 ** attempt)
+            continue
+        if len(translations) != len(batch):
+            raise EngineError(f'Engine {engine.name} returned {len(translations)} translations for {len(batch)} texts')
+        return translations
+
+def dispatch(engine, texts, language_pair, cache=None):
+    """
+    Translates texts with the engine: batched, engine.concurrency calls at a
+    time on a thread pool. Threads only talk to the engine, all database work
+    (the cache included) stays on the calling thread.
+
+    Args:
+        cache: Optional MTCache; cached texts are not sent to the engine and
+               engine output is stored in it.
+
+    Returns:
+        (translations in the same order as texts, number served from the cache).
+    """
+    translations = cache.lookup(engine, language_pair, texts) if cache is not None else {}
+    pending = [index for index in range(len(texts)) if index not in translations]
+    cached = len(translations)
+    if pending:
+        batches = make_batches(engine, [texts[index] for index in pending])
+        if len(batches) == 1 or engine.concurrency <= 1:
+            results = [_translate_batch(engine, batch, language_pair) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(engine.concurrency, len(batches))) as executor:
+                results = list(executor.map(lambda batch: _translate_batch(engine, batch, language_pair), batches))
+        output = [translation for batch in results for translation in batch]
+        translations.update(zip(pending, output))
+        if cache is not None:
+            cache.store(engine, language_pair, [texts[index] for index in pending], output)
+    return [translations[index] for index in range(len(texts))], cached
+
+def pretranslate_file(file, language_pair, engine=None, window=PRETRANSLATE_WINDOW, progress=None, use_cache=True):
+    """
+    Machine translates the untranslated segments of a file.
+
+    Untranslated rows are read window at a time in segment order; each
+    distinct source text is sent to the engine once and written back to all
+    of its untranslated repetitions with File.propagate_translations (one
+    set-based UPDATE per batch of sources, counters updated by delta).
+    Runs inside the caller's transaction. progress, if given, is called with
+    the number of untranslated segments processed after every window (it may
+    commit, so long runs do not hold the write lock between engine calls).
+
+    With use_cache, sources are looked up in the app's MTCache first.
+
+    Returns:
+        PretranslateResult(engine, requested, cached, translated): distinct
+        sources sent to the engine, distinct sources served from the cache
+        and segments filled.
+    """
+    engine = engine or get_engine()
+    cache = get_mt_cache() if use_cache else None
+    after = -1
+    processed = 0
+    requested = 0
+    cached = 0
+    translated = 0
+    while True:
+        rows = (db.session.query(Segment.segment_index, Segment.original_text)
+                .filter(Segment.file_id == file.id, Segment.translated_text == '',
+                        Segment.segment_index > after)
+                .order_by(Segment.segment_index)
+                .limit(window)
+                .all())
+        if not rows:
+            break
+        after = rows[-1][0]
+        processed += len(rows)
+
+        # Repetitions are translated once; blank sources are left alone
+        sources = list({normalize_source(text): text for _, text in rows if normalize_source(text)}.values())
+        if sources:
+            translations, from_cache = dispatch(engine, sources, language_pair, cache)
+            requested += len(sources) - from_cache
+            cached += from_cache
+            translated += file.propagate_translations(zip(sources, translations), scope='file')
+        if progress is not None:
+            progress(processed)
+    return PretranslateResult(engine.name, requested, cached, translated)
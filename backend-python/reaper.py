@@ -0,0 +1,127 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from flask import current_app
+from models import db, Segment, DeletedFile
+
+# Deleting a project or file only removes its own rows (see delete_file_rows /
+# delete_project_rows) and renames its directory into TRASH_DIR, so the request
+# holds SQLite's write lock for milliseconds whatever the project's size. The
+# segments of deleted files, unreachable once their file row is gone, and the
+# trashed directories are removed here by a background thread, in batches of
+# REAPER_BATCH_SIZE rows with a REAPER_BATCH_PAUSE between them, so other
+# writers waiting for the lock get it instead of queueing behind the purge.
+
+def move_to_trash(path):
+    """
+    Moves a file or directory into TRASH_DIR for the reaper to remove (a
+    rename on the same filesystem). Returns False if there was nothing to move.
+    """
+    if not os.path.exists(path):
+        return False
+    shutil.move(path, os.path.join(current_app.config['TRASH_DIR'], str(uuid.uuid4())))
+    return True
+
+def purge_deleted_segments(batch_size, pause=0):
+    """
+    Deletes the segments of files with a DeletedFile tombstone, batch_size rows
+    per committed transaction, then the tombstones left without segments.
+    Sleeps pause seconds after each full batch: SQLite's busy handler polls,
+    so a writer waiting for the lock would otherwise lose it to the next batch.
+
+    Returns:
+        Number of segments deleted.
+    """
+    segment_table = Segment.__table__
+    tombstone_table = DeletedFile.__table__
+    batch = (db.select(segment_table.c.id)
+             .join(tombstone_table, tombstone_table.c.file_id == segment_table.c.file_id)
+             .limit(batch_size).scalar_subquery())
+    purged = 0
+    while True:
+        # The DELETE opens the transaction, so it never upgrades a stale read snapshot
+        deleted = db.session.execute(segment_table.delete().where(segment_table.c.id.in_(batch))).rowcount
+        db.session.commit()
+        purged += deleted
+        if deleted < batch_size:
+            break
+        time.sleep(pause)
+    db.session.execute(tombstone_table.delete().where(
+        ~db.exists().where(segment_table.c.file_id == tombstone_table.c.file_id)
+    ))
+    db.session.commit()
+    return purged
+
+def empty_trash():
+    """Removes everything in TRASH_DIR. Returns the number of entries removed."""
+    removed = 0
+    for entry in os.scandir(current_app.config['TRASH_DIR']):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        removed += 1
+    return removed
+
+class Reaper:
+    """
+    Background thread removing what deletions left behind: segments of
+    tombstoned files and the contents of TRASH_DIR. Like the job queue it is
+    started by the first request the app serves (see init_reaper); it then
+    runs at once (finishing work interrupted by a restart), when woken after a
+    deletion and every REAPER_INTERVAL seconds. Every step is idempotent, so
+    reapers of several processes (or `flask purge-deleted`) may overlap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._work, name='reaper', daemon=True)
+
+    def start(self):
+        """Starts the thread; later calls do nothing."""
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                self._thread.start()
+                self._started = True
+
+    def wake(self):
+        self._wake.set()
+
+    def _work(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    purged = purge_deleted_segments(self.app.config['REAPER_BATCH_SIZE'],
+                                                    self.app.config['REAPER_BATCH_PAUSE'])
+                    removed = empty_trash()
+                if purged or removed:
+                    self.app.logger.info(f'已清除 {purged} 个已删除段落, {removed} 个回收目录')
+            except Exception:
+                self.app.logger.exception('后台清理出错')
+            self._wake.wait(self.app.config['REAPER_INTERVAL'])
+            self._wake.clear()
+
+def init_reaper(app):
+    """
+    Creates the app's Reaper, started by the first request the app serves
+    unless BACKGROUND_WORKERS is off (as the job queue, see jobs.init_job_queue).
+    """
+    reaper = Reaper(app)
+    app.extensions['reaper'] = reaper
+    if app.config['BACKGROUND_WORKERS']:
+        app.before_request(reaper.start)
+    return reaper
+
+def wake_reaper():
+    """Asks the reaper to run now, e.g. after a deletion was committed (no-op until it started)."""
+    current_app.extensions['reaper'].wake()
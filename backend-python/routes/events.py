@@ -0,0 +1,41 @@
+from flask import Blueprint, Response, jsonify, current_app, stream_with_context
+from models import Project, File
+from events import get_broker, iter_events
+
+# Server-Sent Event streams of a project or one of its files
+events_bp = Blueprint('events', __name__, url_prefix='/api/projects/<project_id>')
+
+def _event_stream(*channels):
+    broker = get_broker()
+    subscription = broker.subscribe(*channels)
+    return Response(
+        stream_with_context(iter_events(broker, subscription, current_app.config['SSE_HEARTBEAT_SECONDS'])),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # no proxy buffering
+    )
+
+# Project stream: file-progress, file-added, file-deleted, job and project-deleted events
+@events_bp.route('/events', methods=['GET'])
+def project_events(project_id):
+    try:
+        Project.query.get_or_404(project_id, description='项目不存在')
+        return _event_stream(f'project:{project_id}')
+    except Exception as e:
+        current_app.logger.error(f'打开项目事件流出错 (Project: {project_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目不存在'}), 404
+        return jsonify({'error': '打开事件流失败'}), 500
+
+# File stream: segments (deltas), file-changed, file-deleted and job events of the file
+@events_bp.route('/files/<file_id>/events', methods=['GET'])
+def file_events(project_id, file_id):
+    try:
+        File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+             description='文件不存在或不属于该项目'
+        )
+        return _event_stream(f'file:{file_id}')
+    except Exception as e:
+        current_app.logger.error(f'打开文件事件流出错 (Project: {project_id}, File: {file_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '文件不存在或不属于该项目'}), 404
+        return jsonify({'error': '打开事件流失败'}), 500
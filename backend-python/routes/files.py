@@ -1,18 +1,30 @@
 import os
 import uuid
-import xml.etree.ElementTree as ET # Import ElementTree
+import zipfile
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from werkzeug.utils import secure_filename
 # 导入 Segment 模型
-from models import db, Project, File, Segment
-from utils import parse_file_content
-from config import PROJECTS_DIR, DATA_DIR
+from models import db, Project, File, Segment, delete_file_rows
+from formats import FORMATS, INVALID_FORMAT_ERRORS, detect_format, get_format
+from ingest import insert_segments
+from batch import BatchTooLarge, save_batch_uploads, ingest_batch, release_blobs
+from blobs import get_blob_store, release_file_blobs
+from tm import record_translations
+from jobs import enqueue_job
+from reaper import wake_reaper
+from routes.jobs import job_response
+from events import publish_file_changes, publish_file_added, publish_file_deleted
+from export import (ExportCache, export_chunks, gunzip_chunks, read_file_chunks, translated_download_name,
+                    content_disposition)
+from wire import WIRE_FORMATS, negotiate_format, ndjson_chunks, columns_document
 
 # Create a Blueprint for project-specific file routes
 # Note the dynamic part <project_id> in the url_prefix
 files_bp = Blueprint('files', __name__, url_prefix='/api/projects/<project_id>/files')
 
+PROPAGATE_SCOPES = ('none', 'file', 'project')
+
 # Get all files in a project
 @files_bp.route('', methods=['GET'])
 def get_project_files(project_id):
@@ -28,10 +40,88 @@ def get_project_files(project_id):
              return jsonify({'error': '项目不存在'}), 404
         return jsonify({'error': '获取项目文件列表失败'}), 500
 
+def import_upload(project, file_name, store, digest, file_path):
+    """
+    Creates a File for content already in the blob store (its reference
+    taken in the current transaction) and imports its segments, or queues
+    the import with ?async=1. Used by the direct and the resumable uploads.
+
+    Returns the response; invalid or empty content is rolled back and its
+    blob collected.
+    """
+    file_id = str(uuid.uuid4())
+    project_id = project.id
+    file_format = detect_format(file_name, file_path)
+
+    # 创建 File 记录 (不包含 segments)
+    new_file = File(
+        id=file_id,
+        file_name=file_name,
+        file_path=file_path, # The blob, shared by every upload of the same content
+        upload_date=datetime.now(),
+        project_id=project_id,
+        completion_rate=0, # 初始完成率为0
+        file_format=file_format.name,
+        blob_hash=digest
+    )
+
+    # ?async=1: parse and ingest in a background job, poll /api/jobs/<id>
+    if request.args.get('async', '').lower() in ['1', 'true', 't']:
+        db.session.add(new_file)
+        job = enqueue_job('ingest', project_id=project_id, file_id=file_id)
+        return job_response(job, {
+            'id': file_id,
+            'message': '文件已上传, 正在后台解析',
+            'job': job.to_dict(),
+            'file': new_file.to_dict(include_segments=False)
+        })
+
+    db.session.add(new_file)
+    # 先写入 File 行, 计数增量需要更新该行
+    db.session.flush()
+
+    # 边解析边分块批量写入 Segment, 内存占用与文件大小无关;
+    # 已解析过的内容直接从解析缓存写入
+    try:
+        result = insert_segments(new_file.id,
+                                 store.iter_segments(digest, file_format, project.language_pair),
+                                 language_pair=project.language_pair)
+    except UnicodeDecodeError as read_err:
+        current_app.logger.error(f'读取上传文件编码错误 (Path: {file_path}): {str(read_err)}')
+        db.session.rollback()
+        store.collect(digest) # Clean up the blob if nothing else uses it
+        return jsonify({'error': '无法读取文件内容，请确保文件为UTF-8编码'}), 400
+    except INVALID_FORMAT_ERRORS:
+        db.session.rollback()
+        store.collect(digest)
+        return jsonify({'error': file_format.invalid_message}), 400
+
+    if not result.segment_total:
+         db.session.rollback()
+         store.collect(digest)
+         return jsonify({'error': file_format.empty_message}), 400
+
+    # 更新文件与项目的计数和完成率
+    new_file.apply_count_delta(result.segment_total, result.translated_total)
+
+    # 更新项目修改时间
+    project.last_modified = datetime.now()
+
+    # 提交所有更改 (File, Segments, Blob 引用, 计数, Project time)
+    db.session.commit()
+    publish_file_added(new_file, project)
+
+    return jsonify({
+        'id': file_id,
+        'message': '文件上传成功',
+        'prefilled': result.prefilled_total, # 由翻译记忆预填的段落数
+        'file': new_file.to_dict(include_segments=False) # 不回传段落内容
+    }), 201
+
 # Upload a file to a project
 @files_bp.route('', methods=['POST'])
 def upload_file_to_project(project_id):
-    file_path = None # Initialize for potential cleanup
+    digest = None # Blob to collect if the upload fails
     try:
         if 'file' not in request.files:
             return jsonify({'error': '没有上传文件'}), 400
@@ -42,133 +132,229 @@ def upload_file_to_project(project_id):
 
         project = Project.query.get_or_404(project_id, description='项目不存在')
 
-        # Ensure project file directory exists
-        project_files_dir = os.path.join(PROJECTS_DIR, project_id, 'files')
-        os.makedirs(project_files_dir, exist_ok=True) # Redundant if create_project worked, but safe
-
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
         original_filename = secure_filename(file.filename)
-        # Ensure extension (handle cases like '.jpeg')
-        _, file_extension = os.path.splitext(original_filename)
-        if not file_extension:
-             # Handle files without extensions if necessary, or default to .txt
-             file_extension = '.txt' # Example default
-        filename = f"{file_id}{file_extension}"
-        file_path = os.path.join(project_files_dir, filename)
-
-        # Save file
-        file.save(file_path)
-
-        # Read file content (handle potential encoding issues)
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-        except UnicodeDecodeError:
-             # Try other common encodings or return an error
-             try:
-                 with open(file_path, 'r', encoding='gbk') as f: # Example fallback
-                     file_content = f.read()
-             except Exception as read_err:
-                 os.remove(file_path) # Clean up saved file if unreadable
-                 current_app.logger.error(f'读取上传文件编码错误 (Path: {file_path}): {str(read_err)}')
-                 return jsonify({'error': '无法读取文件内容，请确保文件为UTF-8编码'}), 400
-        except Exception as read_err:
-             os.remove(file_path) # Clean up saved file
-             current_app.logger.error(f'读取上传文件时出错 (Path: {file_path}): {str(read_err)}')
-             return jsonify({'error': '读取文件内容时出错'}), 500
-
-        # Parse the structured content
-        try:
-            parsed_segments = parse_file_content(file_content)
-        except ET.ParseError:
-            os.remove(file_path) # Clean up invalid file
-            return jsonify({'error': '文件格式无效，请使用 <seg><source>...</source><target>...</target></seg> 结构'}), 400
-        except Exception as parse_err: # Catch other potential errors
-            os.remove(file_path)
-            current_app.logger.error(f'解析文件内容时出错 (Path: {file_path}): {str(parse_err)}')
-            return jsonify({'error': '解析文件内容时出错'}), 500
-
-        if not parsed_segments:
-             os.remove(file_path) # Clean up empty file
-             return jsonify({'error': '文件内容为空或未包含有效的 <seg> 标签'}), 400
-
-        # 创建 File 记录 (不包含 segments)
-        new_file = File(
-            id=file_id,
-            file_name=original_filename,
-            file_path=file_path, # Store relative or absolute path based on need
-            upload_date=datetime.now(),
-            project_id=project_id,
-            completion_rate=0 # 初始完成率为0
-        )
-        db.session.add(new_file)
-        # 先提交 File 记录以获取 ID (如果需要) 或在添加 Segments 后一起提交
-        # db.session.flush() # 可选：获取 new_file.id 但不结束事务
-
-        # 创建 Segment 记录 using (source, target) tuples
-        segments_to_add = []
-        for index, (source_text, target_text) in enumerate(parsed_segments):
-            segment = Segment(
-                file_id=new_file.id,
-                segment_index=index,
-                original_text=source_text,
-                translated_text=target_text # Use target from file if present
-            )
-            segments_to_add.append(segment)
-
-        if segments_to_add:
-            db.session.add_all(segments_to_add)
-
-        # 更新项目修改时间
-        project.last_modified = datetime.now()
-
-        # 提交所有更改 (File, Segments, Project time)
+        # End the read transaction: the blob reference is taken after hashing the
+        # upload, by when a stale read snapshot could not be upgraded to a write
         db.session.commit()
 
-        # 更新项目完成率 (现在 File 和 Segments 都已提交)
-        # File 的完成率在创建时是0，可以在这里更新一次，或者依赖后续更新
-        # new_file.update_completion_rate() # 更新单个文件完成率
-        project.update_completion_rate()
-        db.session.commit() # Commit project update
-
-        return jsonify({
-            'id': file_id,
-            'message': '文件上传成功',
-            'file': new_file.to_dict() # to_dict 会从 Segment 表获取数据
-        }), 201
+        # Store the content by its SHA-256; known content is neither written nor parsed again
+        store = get_blob_store()
+        digest, file_path = store.store(file.stream)
+        return import_upload(project, original_filename, store, digest, file_path)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'上传项目文件出错 (Project ID: {project_id}): {str(e)}')
-        # Clean up saved file if it exists and DB operation failed
-        if file_path and os.path.exists(file_path):
+        # The reference was rolled back: remove the blob unless another file uses it
+        if digest:
             try:
-                os.remove(file_path)
-            except OSError as rm_error:
+                get_blob_store().collect(digest)
+            except Exception as rm_error:
+                db.session.rollback()
                 current_app.logger.error(f'上传失败后清理文件时出错: {str(rm_error)}')
         if hasattr(e, 'code') and e.code == 404:
              return jsonify({'error': '项目不存在'}), 404
         return jsonify({'error': '上传项目文件失败'}), 500
 
 
+# Upload several files at once: multipart parts named 'files' (or 'file'),
+# *.zip parts are expanded. Files are parsed in parallel in the parse process
+# pool and each one is committed as soon as it is imported, so the write lock
+# is never held across the whole batch; the response lists the outcome per file.
+@files_bp.route('/batch', methods=['POST'])
+def batch_upload_files_to_project(project_id):
+    items = []
+    try:
+        uploads = [upload for upload in request.files.getlist('files') + request.files.getlist('file')
+                   if upload.filename]
+        if not uploads:
+            return jsonify({'error': '没有上传文件'}), 400
+
+        project = Project.query.get_or_404(project_id, description='项目不存在')
+        # End the read transaction: the batch writes in short transactions of
+        # its own, and SQLite cannot upgrade a stale read snapshot to a write
+        db.session.commit()
+        store = get_blob_store()
+        try:
+            items = save_batch_uploads(uploads, store, current_app.config['MAX_CONTENT_LENGTH'])
+        except zipfile.BadZipFile:
+            return jsonify({'error': '压缩包无效'}), 400
+        except BatchTooLarge:
+            return jsonify({'error': '解压后的文件总大小超出限制'}), 413
+        if not items:
+            return jsonify({'error': '压缩包中没有文件'}), 400
+
+        created = ingest_batch(project, items, store)
+
+        files = {file.id: file for file in created}
+        for file in created:
+            publish_file_added(file, project)
+        results = [item.result for item in items]
+        for result in results:
+            if result['status'] == 'created':
+                result['file'] = files[result['id']].to_dict(include_segments=False)
+        summary = {
+            'created': len(created),
+            'failed': len(items) - len(created),
+            'files': results
+        }
+        if not created:
+            return jsonify({'error': '没有可导入的文件', **summary}), 400
+        return jsonify(summary), 201
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'批量上传项目文件出错 (Project ID: {project_id}): {str(e)}')
+        # Files imported so far stay; the others drop their blob references
+        try:
+            release_blobs(get_blob_store(), (item.digest for item in items if item.result is None))
+        except Exception as rm_error:
+            db.session.rollback()
+            current_app.logger.error(f'批量上传失败后清理文件时出错: {str(rm_error)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目不存在'}), 404
+        return jsonify({'error': '批量上传项目文件失败'}), 500
+
+
 # Get a specific file in a project
+# ?format=ndjson (or Accept: application/x-ndjson) streams the file as NDJSON:
+# a first line with the file's metadata, then one line per segment.
 @files_bp.route('/<file_id>', methods=['GET'])
 def get_project_file(project_id, file_id):
     try:
         # Ensure project exists first (optional, depends if file ID is globally unique)
         # Project.query.get_or_404(project_id, description='项目不存在')
 
+        wire_format = negotiate_format(request)
+        if wire_format is None:
+            return jsonify({'error': f'未知的格式, 可选: {", ".join(WIRE_FORMATS)}'}), 400
+        # The JSON document is already columnar (originalSegments / translatedSegments)
+        if wire_format == 'columns':
+            wire_format = 'json'
+
         file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
             description='文件不存在或不属于该项目'
         )
-        return jsonify(file.to_dict())
+        # Unchanged since the client's copy: skip loading the segments
+        etag = file.etag(wire_format)
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
+        if wire_format == 'ndjson':
+            fields = list(SEGMENT_FIELDS)
+            chunks = ndjson_chunks(_segment_rows(file.id, fields), ['index'] + fields,
+                                   header=file.to_dict(include_segments=False))
+            response = Response(stream_with_context(chunks), mimetype=WIRE_FORMATS['ndjson'])
+        else:
+            response = jsonify(file.to_dict())
+        response.set_etag(etag, weak=True)
+        response.vary.add('Accept')
+        return response
     except Exception as e:
         current_app.logger.error(f'获取项目文件内容出错 (Project: {project_id}, File: {file_id}): {str(e)}')
         if hasattr(e, 'code') and e.code == 404:
              return jsonify({'error': '文件不存在或不属于该项目'}), 404
         return jsonify({'error': '获取项目文件内容失败'}), 500
 
-# Update project file translation content
+# Columns that may be requested through ?fields= on the segment window endpoint
+SEGMENT_FIELDS = {
+    'original': Segment.original_text,
+    'translated': Segment.translated_text,
+}
+DEFAULT_SEGMENT_PAGE_SIZE = 200
+MAX_SEGMENT_PAGE_SIZE = 1000
+# Rows fetched per round trip when streaming NDJSON
+SEGMENT_STREAM_FETCH_SIZE = 1000
+
+def _segment_rows(file_id, fields, after=-1, limit=None):
+    """(segment_index, *fields) rows in segment order; no ORM objects are built."""
+    query = (db.session.query(Segment.segment_index, *[SEGMENT_FIELDS[name] for name in fields])
+             .filter(Segment.file_id == file_id, Segment.segment_index > after)
+             .order_by(Segment.segment_index))
+    if limit is not None:
+        return query.limit(limit).all()
+    return query.execution_options(yield_per=SEGMENT_STREAM_FETCH_SIZE)
+
+# Get a window of segments (keyset pagination on (file_id, segment_index))
+# Wire formats (?format= or Accept): json, a list of segment objects; columns,
+# one array per field; ndjson, one segment per line, streamed. NDJSON without
+# ?limit= streams every segment after ?after=; the client pages on the last index.
+@files_bp.route('/<file_id>/segments', methods=['GET'])
+def get_project_file_segments(project_id, file_id):
+    try:
+        wire_format = negotiate_format(request)
+        if wire_format is None:
+            return jsonify({'error': f'未知的格式, 可选: {", ".join(WIRE_FORMATS)}'}), 400
+        streaming = wire_format == 'ndjson'
+        try:
+            after = int(request.args.get('after', -1))
+            limit = request.args.get('limit')
+            limit = int(limit) if limit is not None else (None if streaming else DEFAULT_SEGMENT_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'after 和 limit 必须为整数'}), 400
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit 必须大于 0'}), 400
+        if not streaming:
+            limit = min(limit, MAX_SEGMENT_PAGE_SIZE)
+
+        fields_arg = request.args.get('fields')
+        if fields_arg:
+            fields = [name.strip() for name in fields_arg.split(',') if name.strip() and name.strip() != 'index']
+            unknown = [name for name in fields if name not in SEGMENT_FIELDS]
+            if unknown:
+                return jsonify({'error': f'未知的字段: {", ".join(unknown)}'}), 400
+        else:
+            fields = list(SEGMENT_FIELDS)
+
+        File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+            description='文件不存在或不属于该项目'
+        )
+        keys = ['index'] + fields
+
+        if streaming:
+            # Rows are encoded as they come off the cursor; memory stays bounded
+            response = Response(stream_with_context(ndjson_chunks(_segment_rows(file_id, fields, after, limit), keys)),
+                                mimetype=WIRE_FORMATS['ndjson'])
+            response.vary.add('Accept')
+            return response
+
+        # Fetch one extra row to know whether another page follows
+        rows = _segment_rows(file_id, fields, after, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_after = rows[-1][0] if has_more else None
+
+        if wire_format == 'columns':
+            response = Response(columns_document(rows, keys, nextAfter=next_after, hasMore=has_more),
+                                mimetype=WIRE_FORMATS['columns'])
+        else:
+            response = jsonify({
+                'segments': [dict(zip(keys, row)) for row in rows],
+                'nextAfter': next_after,
+                'hasMore': has_more
+            })
+        response.vary.add('Accept')
+        return response
+    except Exception as e:
+        current_app.logger.error(f'获取项目文件段落出错 (Project: {project_id}, File: {file_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '文件不存在或不属于该项目'}), 404
+        return jsonify({'error': '获取项目文件段落失败'}), 500
+
+# Source texts that occur more than once in the file
+@files_bp.route('/<file_id>/repetitions', methods=['GET'])
+def get_project_file_repetitions(project_id, file_id):
+    try:
+        file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+             description='文件不存在或不属于该项目'
+        )
+        return jsonify([{'firstIndex': first_index, 'count': count}
+                        for _, first_index, count in file.repetitions()])
+    except Exception as e:
+        current_app.logger.error(f'获取项目文件重复段落出错 (Project: {project_id}, File: {file_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '文件不存在或不属于该项目'}), 404
+        return jsonify({'error': '获取重复段落失败'}), 500
+
+# Update project file translation content (?propagate= as for PATCH)
 @files_bp.route('/<file_id>', methods=['PUT'])
 def update_project_file_translation(project_id, file_id):
     try:
@@ -178,6 +364,9 @@ def update_project_file_translation(project_id, file_id):
         # Basic validation
         if translated_segments_list is None or not isinstance(translated_segments_list, list):
             return jsonify({'error': '缺少或无效的翻译内容格式 (需要列表)'}), 400
+        propagate = _propagate_scope()
+        if propagate is None:
+            return jsonify({'error': 'propagate 必须为 none, file 或 project'}), 400
 
         project = Project.query.get_or_404(project_id, description='项目不存在')
         file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
@@ -191,11 +380,20 @@ def update_project_file_translation(project_id, file_id):
         if len(translated_segments_list) != len(db_segments):
              return jsonify({'error': f'翻译段落数量 ({len(translated_segments_list)}) 与原始段落数量 ({len(db_segments)}) 不匹配'}), 400
 
-        # 更新每个 Segment 的 translated_text
+        # 更新每个 Segment 的 translated_text, 同时累计已翻译数量的变化
+        translated_delta = 0
+        changed_pairs = [] # 新写入的非空译文, 加入翻译记忆
+        changed_segments = {} # 推送给其他客户端的增量
         for index, segment_obj in enumerate(db_segments):
             # 检查传入列表对应索引是否存在，以防万一
             if index < len(translated_segments_list):
-                 segment_obj.translated_text = translated_segments_list[index]
+                 new_text = translated_segments_list[index]
+                 translated_delta += int(new_text != '') - int(segment_obj.translated_text != '')
+                 if new_text != segment_obj.translated_text:
+                     changed_segments[segment_obj.segment_index] = new_text
+                 if new_text and new_text != segment_obj.translated_text:
+                     changed_pairs.append((segment_obj.original_text, new_text))
+                 segment_obj.translated_text = new_text
             else:
                  # 如果传入列表更短（理论上不应发生，因为上面检查过），可以选择报错或跳过
                  current_app.logger.warning(f"传入的翻译列表在索引 {index} 处过短 (File ID: {file_id})")
@@ -203,16 +401,19 @@ def update_project_file_translation(project_id, file_id):
 
         project.last_modified = datetime.now()
 
-        # Update file completion rate (模型中的方法已更新)
-        file.update_completion_rate()
-
-        # Update project completion rate (模型中的方法已更新)
-        project.update_completion_rate()
+        # 按增量更新文件和项目的计数与完成率
+        db.session.flush()
+        file.apply_count_delta(translated_delta=translated_delta)
+        record_translations(project.language_pair, changed_pairs)
+        changes = {file.id: changed_segments}
+        propagated = file.propagate_translations(changed_pairs, propagate, changes) if propagate != 'none' else 0
 
         db.session.commit()
+        publish_file_changes(project, changes)
 
         return jsonify({
             'message': '翻译内容已更新',
+            'propagated': propagated,
             'completionRate': file.completion_rate,
             'projectCompletionRate': project.completion_rate
         })
@@ -223,6 +424,60 @@ def update_project_file_translation(project_id, file_id):
              return jsonify({'error': '项目或文件不存在'}), 404
         return jsonify({'error': '更新项目文件翻译内容失败'}), 500
 
+# Update only the given segments: body is {segment_index: text}
+# ?propagate=file (default) | project | none copies new translations to untranslated repetitions
+@files_bp.route('/<file_id>', methods=['PATCH'])
+def patch_project_file_translation(project_id, file_id):
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data:
+            return jsonify({'error': '缺少或无效的翻译内容格式 (需要 {段落索引: 译文})'}), 400
+        try:
+            translations = {int(index): text for index, text in data.items()}
+        except (TypeError, ValueError):
+            return jsonify({'error': '段落索引必须为整数'}), 400
+        if not all(isinstance(text, str) for text in translations.values()):
+            return jsonify({'error': '译文必须为字符串'}), 400
+        propagate = _propagate_scope()
+        if propagate is None:
+            return jsonify({'error': 'propagate 必须为 none, file 或 project'}), 400
+
+        project = Project.query.get_or_404(project_id, description='项目不存在')
+        file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+             description='文件不存在或不属于该项目'
+        )
+
+        try:
+            translated_delta, translated_pairs = Segment.apply_translations(file.id, translations)
+        except KeyError as missing:
+            db.session.rollback()
+            return jsonify({'error': f'段落索引不存在: {missing.args[0]}'}), 400
+
+        project.last_modified = datetime.now()
+
+        # 按增量更新计数, 不重新扫描文件
+        file.apply_count_delta(translated_delta=translated_delta)
+        record_translations(project.language_pair, translated_pairs)
+        changes = {file.id: dict(translations)}
+        propagated = file.propagate_translations(translated_pairs, propagate, changes) if propagate != 'none' else 0
+
+        db.session.commit()
+        publish_file_changes(project, changes)
+
+        return jsonify({
+            'message': '翻译内容已更新',
+            'updated': len(translations),
+            'propagated': propagated,
+            'completionRate': file.completion_rate,
+            'projectCompletionRate': project.completion_rate
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'更新项目文件段落译文出错 (Project: {project_id}, File: {file_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目或文件不存在'}), 404
+        return jsonify({'error': '更新项目文件翻译内容失败'}), 500
+
 # Delete a project file
 @files_bp.route('/<file_id>', methods=['DELETE'])
 def delete_project_file(project_id, file_id):
@@ -232,28 +487,34 @@ def delete_project_file(project_id, file_id):
              description='文件不存在或不属于该项目'
         )
 
-        file_path = file.file_path # Get path before deleting DB record
-
-        # Delete physical file first
-        if file_path and os.path.exists(file_path):
+        # Legacy uploads have their own copy under the project directory;
+        # uploads in the blob store drop their reference instead
+        if not file.blob_hash and file.file_path and os.path.exists(file.file_path):
              try:
-                 os.remove(file_path)
+                 os.remove(file.file_path)
              except OSError as rm_error:
-                 current_app.logger.error(f'删除物理文件时出错 (Path: {file_path}): {str(rm_error)}')
+                 current_app.logger.error(f'删除物理文件时出错 (Path: {file.file_path}): {str(rm_error)}')
                  # Decide if you want to stop or continue with DB deletion
                  # For now, log and continue
+        released = release_file_blobs([file])
 
-        # Delete file from database
-        db.session.delete(file)
+        # Drop cached exports of this file
+        _export_cache().discard(file.id)
+
+        # Remove the file's counts from the project rollup
+        project.apply_count_delta(-file.segment_count, -file.translated_count)
+
+        # Delete the file row; its segments are removed by the background reaper
+        delete_file_rows([file.id])
 
         # Update project modification time
         project.last_modified = datetime.now()
 
-        db.session.commit() # Commit deletion and project time update
-
-        # Update project completion rate (after file is deleted)
-        project.update_completion_rate()
-        db.session.commit() # Commit project rate update
+        db.session.commit() # Commit deletion, counters and project time update
+        publish_file_deleted(file_id, project)
+        wake_reaper()
+        # Remove the blob once no other file references it
+        get_blob_store().collect(*released)
 
         return jsonify({'message': '文件已从项目中删除'})
     except Exception as e:
@@ -264,9 +525,11 @@ def delete_project_file(project_id, file_id):
         return jsonify({'error': '删除项目文件失败'}), 500
 
 # Download translated project file
+# Exports are served from the revision-keyed ExportCache when possible; otherwise
+# they are rendered straight from a streaming cursor into the response and the
+# cache at the same time.
 @files_bp.route('/<file_id>/download', methods=['GET'])
 def download_project_file(project_id, file_id):
-    temp_path = None # Initialize for potential cleanup
     try:
         # Ensure project exists (optional, depends on file ID uniqueness)
         # Project.query.get_or_404(project_id, description='项目不存在')
@@ -282,46 +545,59 @@ def download_project_file(project_id, file_id):
         #     return jsonify({'error': '翻译尚未完成，无法下载'}), 400
         # Consider allowing partial download if needed. For now, keep original logic.
 
-        # Generate translated file content (use original segment if translation is empty?)
-        # 从 Segment 表获取翻译内容
-        ordered_segments = file.segments.order_by(Segment.segment_index).all()
-        translated_list = [(seg.original_text, seg.translated_text) for seg in ordered_segments]
-
-        # Generate content in the new structured format
-        output_lines = []
-        for original, translated in translated_list:
-            # Basic escaping for XML characters within text content
-            escaped_original = original.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            escaped_translated = translated.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            output_lines.append(f"<seg>\n  <source>{escaped_original}</source>\n  <target>{escaped_translated}</target>\n</seg>")
-
-        # Join segments with a newline for readability
-        translated_content = "\n".join(output_lines)
-
-        # Create temporary file for download
-        base_name, ext = os.path.splitext(file.file_name)
-        download_filename = f"{base_name}-translated{ext}"
-        # Use a temporary directory or the DATA_DIR for the temp file
-        temp_path = os.path.join(DATA_DIR, f"temp_{file_id}{ext}") # Use unique temp name
-
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            f.write(translated_content)
-
-        return send_file(
-            temp_path,
-            as_attachment=True,
-            download_name=download_filename, # Use the user-friendly name
-            mimetype='application/xml' # Use XML mime type for structured content
+        # ?format= exports to another format than the uploaded one
+        try:
+            file_format = get_format(request.args.get('format', file.file_format))
+        except ValueError:
+            return jsonify({'error': f'未知的文件格式, 可选: {", ".join(FORMATS)}'}), 400
+        if file_format.source_required and file_format.name != file.file_format:
+            return jsonify({'error': f'只有 {file_format.label} 文件可以导出为 {file_format.label} 格式'}), 400
+
+        etag = file.etag(file_format.name)
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
+        cache = _export_cache()
+        # Opened here, not when the body starts streaming, so a concurrent fill() cannot remove it in between
+        cached = cache.open(file.id, file.revision, file_format.name)
+        if cached is not None:
+            # Cached entries are already gzip-compressed
+            gzipped = read_file_chunks(cached)
+        else:
+            gzipped = cache.fill(file.id, file.revision, file_format.name, export_chunks(file, file_format))
+
+        headers = {
+            'Content-Disposition': content_disposition(translated_download_name(file.file_name, file_format)),
+            'Vary': 'Accept-Encoding'
+        }
+        if 'gzip' in request.accept_encodings:
+            body = gzipped
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            body = gunzip_chunks(gzipped)
+
+        response = Response(
+            stream_with_context(body),
+            mimetype=file_format.mimetype,
+            headers=headers
         )
+        response.set_etag(etag, weak=True)
+        return response
     except Exception as e:
         current_app.logger.error(f'下载项目文件翻译出错 (Project: {project_id}, File: {file_id}): {str(e)}')
         if hasattr(e, 'code') and e.code == 404:
              return jsonify({'error': '文件不存在或不属于该项目'}), 404
         return jsonify({'error': '下载项目文件翻译失败'}), 500
-    finally:
-        # Clean up the temporary file after sending or if an error occurred
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except OSError as rm_error:
-                current_app.logger.error(f'清理下载临时文件时出错: {str(rm_error)}')
+
+def _export_cache():
+    return ExportCache(current_app.config['EXPORT_CACHE_DIR'], current_app.config['EXPORT_CACHE_MAX_BYTES'])
+
+def _propagate_scope():
+    """?propagate= of the translation writes; None when the value is invalid."""
+    scope = request.args.get('propagate', 'file').lower()
+    return scope if scope in PROPAGATE_SCOPES else None
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
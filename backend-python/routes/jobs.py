@@ -0,0 +1,88 @@
+from flask import Blueprint, request, jsonify, current_app, url_for
+from models import Project, File, Job
+from jobs import enqueue_job, job_progress
+from mt import get_engine
+from formats import get_format
+
+# Background jobs: started per project, polled by id
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api')
+
+# Job types clients may start; 'ingest' jobs come from uploads with ?async=1
+FILE_JOB_TYPES = ('pretranslate', 'export')
+PROJECT_JOB_TYPES = ('delete_project',)
+RECENT_JOBS_LIMIT = 50
+
+def job_response(job, payload=None):
+    """202 response for a newly queued job (body defaults to the job), pointing at its polling URL."""
+    response = jsonify(payload if payload is not None else job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = url_for('jobs.get_job', job_id=job.id)
+    return response
+
+# Start a job for a project or one of its files
+@jobs_bp.route('/projects/<project_id>/jobs', methods=['POST'])
+def create_project_job(project_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        job_type = data.get('type')
+        if job_type not in FILE_JOB_TYPES + PROJECT_JOB_TYPES:
+            return jsonify({'error': f"任务类型必须为: {', '.join(FILE_JOB_TYPES + PROJECT_JOB_TYPES)}"}), 400
+
+        project = Project.query.get_or_404(project_id, description='项目不存在')
+        file_id = None
+        params = {}
+        if job_type in FILE_JOB_TYPES:
+            file_id = data.get('fileId')
+            if not file_id:
+                return jsonify({'error': '缺少 fileId'}), 400
+            file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+                description='文件不存在或不属于该项目'
+            )
+        if job_type == 'export' and data.get('format'):
+            try:
+                file_format = get_format(data['format'])
+            except ValueError:
+                return jsonify({'error': f"未知的文件格式: {data['format']}"}), 400
+            if file_format.source_required and file_format.name != file.file_format:
+                return jsonify({'error': f'只有 {file_format.label} 文件可以导出为 {file_format.label} 格式'}), 400
+            params['format'] = file_format.name
+        if job_type == 'pretranslate':
+            if not project.target_language:
+                return jsonify({'error': '项目未设置目标语言'}), 400
+            try:
+                params['engine'] = get_engine(data.get('engine')).name
+            except ValueError:
+                return jsonify({'error': f"未知的机器翻译引擎: {data.get('engine')}"}), 400
+
+        job = enqueue_job(job_type, project_id=project.id, file_id=file_id, params=params)
+        return job_response(job)
+    except Exception as e:
+        current_app.logger.error(f'创建后台任务出错 (Project: {project_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目或文件不存在'}), 404
+        return jsonify({'error': '创建后台任务失败'}), 500
+
+# Recent jobs of a project, newest first
+@jobs_bp.route('/projects/<project_id>/jobs', methods=['GET'])
+def get_project_jobs(project_id):
+    try:
+        jobs = (Job.query.filter_by(project_id=project_id)
+                .order_by(Job.created_at.desc())
+                .limit(RECENT_JOBS_LIMIT)
+                .all())
+        return jsonify([job.to_dict(job_progress(job)) for job in jobs])
+    except Exception as e:
+        current_app.logger.error(f'获取项目后台任务出错 (Project: {project_id}): {str(e)}')
+        return jsonify({'error': '获取后台任务失败'}), 500
+
+# Poll a job
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = Job.query.get_or_404(job_id, description='任务不存在')
+        return jsonify(job.to_dict(job_progress(job)))
+    except Exception as e:
+        current_app.logger.error(f'获取后台任务出错 (Job: {job_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '任务不存在'}), 404
+        return jsonify({'error': '获取后台任务失败'}), 500
@@ -0,0 +1,93 @@
+from flask import Blueprint, request, jsonify, current_app
+from models import db, Project, File, Segment
+from tm import lookup_fuzzy
+
+# Fuzzy translation memory suggestions for the segments of a file
+matches_bp = Blueprint('matches', __name__, url_prefix='/api/projects/<project_id>/files/<file_id>')
+
+DEFAULT_MATCH_LIMIT = 5
+DEFAULT_MATCH_THRESHOLD = 70
+DEFAULT_BATCH_SIZE = 50
+MAX_BATCH_SIZE = 200
+
+def _match_options():
+    """Parses ?limit= (matches per segment) and ?threshold= (minimum similarity %)."""
+    limit = int(request.args.get('limit', DEFAULT_MATCH_LIMIT))
+    threshold = int(request.args.get('threshold', DEFAULT_MATCH_THRESHOLD))
+    if limit < 1 or not 0 <= threshold <= 100:
+        raise ValueError
+    return limit, threshold
+
+def _get_project_and_file(project_id, file_id):
+    project = Project.query.get_or_404(project_id, description='项目不存在')
+    file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+        description='文件不存在或不属于该项目'
+    )
+    return project, file
+
+# Suggestions for a single segment
+@matches_bp.route('/segments/<int:segment_index>/matches', methods=['GET'])
+def get_segment_matches(project_id, file_id, segment_index):
+    try:
+        try:
+            limit, threshold = _match_options()
+        except ValueError:
+            return jsonify({'error': 'limit 必须为正整数, threshold 必须在 0-100 之间'}), 400
+
+        project, file = _get_project_and_file(project_id, file_id)
+        original_text = (db.session.query(Segment.original_text)
+                         .filter(Segment.file_id == file.id, Segment.segment_index == segment_index)
+                         .scalar())
+        if original_text is None:
+            return jsonify({'error': '段落不存在'}), 404
+
+        return jsonify({
+            'index': segment_index,
+            'matches': lookup_fuzzy(project.language_pair, original_text, limit, threshold)
+        })
+    except Exception as e:
+        current_app.logger.error(f'获取段落翻译记忆匹配出错 (Project: {project_id}, File: {file_id}, Segment: {segment_index}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目或文件不存在'}), 404
+        return jsonify({'error': '获取翻译记忆匹配失败'}), 500
+
+# Suggestions for a window of a file's segments (keyset pagination like /segments)
+@matches_bp.route('/matches', methods=['GET'])
+def get_file_matches(project_id, file_id):
+    try:
+        try:
+            limit, threshold = _match_options()
+            after = int(request.args.get('after', -1))
+            batch_size = min(int(request.args.get('batch', DEFAULT_BATCH_SIZE)), MAX_BATCH_SIZE)
+            if batch_size < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': '无效的分页或匹配参数'}), 400
+        # By default only segments that still need a translation are looked up
+        untranslated_only = request.args.get('untranslated', '1').lower() in ['1', 'true', 't']
+
+        project, file = _get_project_and_file(project_id, file_id)
+        query = (db.session.query(Segment.segment_index, Segment.original_text)
+                 .filter(Segment.file_id == file.id, Segment.segment_index > after))
+        if untranslated_only:
+            query = query.filter(Segment.translated_text == '')
+        rows = query.order_by(Segment.segment_index).limit(batch_size + 1).all()
+        has_more = len(rows) > batch_size
+        rows = rows[:batch_size]
+
+        results = []
+        for segment_index, original_text in rows:
+            matches = lookup_fuzzy(project.language_pair, original_text, limit, threshold)
+            if matches:
+                results.append({'index': segment_index, 'matches': matches})
+
+        return jsonify({
+            'segments': results,
+            'nextAfter': rows[-1][0] if has_more else None,
+            'hasMore': has_more
+        })
+    except Exception as e:
+        current_app.logger.error(f'获取文件翻译记忆匹配出错 (Project: {project_id}, File: {file_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目或文件不存在'}), 404
+        return jsonify({'error': '获取翻译记忆匹配失败'}), 500
@@ -0,0 +1,63 @@
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
+from models import db, Project, File
+from mt import get_engine, get_mt_cache, pretranslate_file, EngineError
+from events import publish_file_changes
+
+# Machine translation of a file's untranslated segments
+pretranslate_bp = Blueprint('pretranslate', __name__, url_prefix='/api/projects/<project_id>/files/<file_id>')
+# Engine-wide information
+mt_bp = Blueprint('mt', __name__, url_prefix='/api/mt')
+
+@pretranslate_bp.route('/pretranslate', methods=['POST'])
+def pretranslate_project_file(project_id, file_id):
+    try:
+        project = Project.query.get_or_404(project_id, description='项目不存在')
+        file = File.query.filter_by(id=file_id, project_id=project_id).first_or_404(
+            description='文件不存在或不属于该项目'
+        )
+        if not project.target_language:
+            return jsonify({'error': '项目未设置目标语言'}), 400
+        try:
+            engine = get_engine(request.args.get('engine'))
+        except ValueError:
+            return jsonify({'error': f"未知的机器翻译引擎: {request.args.get('engine')}"}), 400
+
+        try:
+            result = pretranslate_file(file, project.language_pair, engine)
+        except EngineError as e:
+            db.session.rollback()
+            current_app.logger.error(f'机器翻译引擎调用失败 (Project: {project_id}, File: {file_id}, Engine: {engine.name}): {str(e)}')
+            return jsonify({'error': '机器翻译引擎调用失败'}), 502
+        if result.translated:
+            project.last_modified = datetime.now()
+        db.session.commit()
+        if result.translated:
+            publish_file_changes(project, {file.id: None})
+
+        return jsonify({
+            'engine': result.engine,
+            'requested': result.requested,
+            'cached': result.cached,
+            'translated': result.translated,
+            'completionRate': file.completion_rate,
+            'projectCompletionRate': project.completion_rate
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'机器翻译项目文件出错 (Project: {project_id}, File: {file_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目或文件不存在'}), 404
+        return jsonify({'error': '机器翻译失败'}), 500
+
+# Machine translation result cache statistics (hit counters are per process)
+@mt_bp.route('/cache', methods=['GET'])
+def get_mt_cache_stats():
+    try:
+        cache = get_mt_cache()
+        if cache is None:
+            return jsonify({'enabled': False})
+        return jsonify({'enabled': True, **cache.stats()})
+    except Exception as e:
+        current_app.logger.error(f'获取机器翻译缓存统计出错: {str(e)}')
+        return jsonify({'error': '获取机器翻译缓存统计失败'}), 500
@@ -1,20 +1,36 @@
+import hashlib
 import os
 import shutil
 import uuid
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
-from models import db, Project, File
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from models import db, Project, File, delete_project_rows
 from config import PROJECTS_DIR
+from events import publish
+from blobs import get_blob_store, release_file_blobs
+from formats import FORMATS, get_format
+from export import ExportCache, archive_entries, iter_archive, content_disposition
+from reaper import move_to_trash, wake_reaper
 
 # Create a Blueprint for project routes
 projects_bp = Blueprint('projects', __name__, url_prefix='/api/projects')
 
+def _parse_expand():
+    """Parse the comma separated ?expand= query parameter into a set."""
+    return {part.strip() for part in request.args.get('expand', '').split(',') if part.strip()}
+
 # Get all projects
+# Default is a summary (counts from one aggregate query); ?expand=files adds file
+# metadata and ?expand=segments additionally embeds every file's segments.
 @projects_bp.route('', methods=['GET'])
 def get_projects():
     try:
-        projects = Project.query.all()
-        return jsonify([project.to_dict() for project in projects])
+        expand = _parse_expand()
+        if 'segments' in expand:
+            return jsonify([project.to_dict() for project in Project.query.all()])
+        if 'files' in expand:
+            return jsonify([project.to_dict(include_segments=False) for project in Project.query.all()])
+        return jsonify(Project.summaries())
     except Exception as e:
         current_app.logger.error(f'获取项目列表出错: {str(e)}')
         return jsonify({'error': '获取项目列表失败'}), 500
@@ -26,6 +42,8 @@ def create_project():
         data = request.json
         name = data.get('name')
         description = data.get('description', '')
+        source_language = data.get('sourceLanguage', '')
+        target_language = data.get('targetLanguage', '')
 
         if not name:
             return jsonify({'error': '缺少项目名称'}), 400
@@ -45,6 +63,8 @@ def create_project():
             id=project_id,
             name=name,
             description=description,
+            source_language=source_language,
+            target_language=target_language,
             creation_date=now,
             last_modified=now,
             completion_rate=0
@@ -105,6 +125,12 @@ def update_project(project_id):
         if description is not None:
             project.description = description
 
+        # Language pair (selects the translation memory used for new uploads)
+        if data.get('sourceLanguage') is not None:
+            project.source_language = data['sourceLanguage']
+        if data.get('targetLanguage') is not None:
+            project.target_language = data['targetLanguage']
+
         project.last_modified = datetime.now()
 
         db.session.commit()
@@ -120,26 +146,77 @@ def update_project(project_id):
              return jsonify({'error': '项目不存在'}), 404
         return jsonify({'error': '更新项目信息失败'}), 500
 
+# Download the translated output of every file in the project as one ZIP archive.
+# Entries are rendered one after another (PROJECT_EXPORT_WORKERS files ahead in
+# threads) straight into the streamed archive; ?format= exports every file in
+# that format instead of its own.
+@projects_bp.route('/<project_id>/export', methods=['GET'])
+def export_project(project_id):
+    try:
+        project = Project.query.get_or_404(project_id, description='项目不存在')
+        files = File.query.filter_by(project_id=project_id).order_by(File.upload_date, File.id).all()
+        if not files:
+            return jsonify({'error': '项目中没有文件'}), 400
+
+        file_format = None
+        if request.args.get('format'):
+            try:
+                file_format = get_format(request.args['format'])
+            except ValueError:
+                return jsonify({'error': f'未知的文件格式, 可选: {", ".join(FORMATS)}'}), 400
+            if file_format.source_required and any(file.file_format != file_format.name for file in files):
+                return jsonify({'error': f'只有 {file_format.label} 文件可以导出为 {file_format.label} 格式'}), 400
+
+        entries = archive_entries(files, project.language_pair, file_format)
+        # The archive changes whenever one of its files does
+        versions = '|'.join(f'{entry.file_id}-{entry.revision}-{entry.format_name}' for entry in entries)
+        etag = f'{project_id}-{hashlib.blake2b(versions.encode("utf-8"), digest_size=12).hexdigest()}'
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        cache = ExportCache(current_app.config['EXPORT_CACHE_DIR'], current_app.config['EXPORT_CACHE_MAX_BYTES'])
+        body = iter_archive(entries, cache, current_app.config['PROJECT_EXPORT_WORKERS'])
+        response = Response(
+            stream_with_context(body),
+            mimetype='application/zip',
+            headers={'Content-Disposition': content_disposition(
+                f"{project.name.replace('/', '_').replace(chr(92), '_')}-translated.zip")}
+        )
+        response.set_etag(etag, weak=True)
+        return response
+    except Exception as e:
+        current_app.logger.error(f'导出项目出错 (ID: {project_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目不存在'}), 404
+        return jsonify({'error': '导出项目失败'}), 500
+
 # Delete project
 @projects_bp.route('/<project_id>', methods=['DELETE'])
 def delete_project(project_id):
     try:
-        project = Project.query.get_or_404(project_id, description='项目不存在')
+        Project.query.get_or_404(project_id, description='项目不存在')
+        files = db.session.query(File.id, File.blob_hash).filter_by(project_id=project_id).all()
 
-        project_dir = os.path.join(PROJECTS_DIR, project_id)
+        # Drop the files' references to their uploads in the blob store
+        released = release_file_blobs(files)
 
-        # Delete project directory and files first
-        if os.path.exists(project_dir):
-            try:
-                shutil.rmtree(project_dir)
-            except OSError as rm_error:
-                 current_app.logger.error(f'删除项目目录时出错 (ID: {project_id}): {str(rm_error)}')
-                 # Decide if you want to proceed with DB deletion or return error
-                 # For now, log the error and proceed with DB deletion
-
-        # Delete from database (cascades to files due to model definition)
-        db.session.delete(project)
+        # Delete the rows with set-based statements; the files' segments are
+        # removed by the background reaper (see reaper.py)
+        delete_project_rows(project_id)
         db.session.commit()
+        publish('project-deleted', {'projectId': project_id}, project_id)
+
+        # The project directory is renamed into the trash, emptied by the reaper too
+        try:
+            move_to_trash(os.path.join(PROJECTS_DIR, project_id))
+        except OSError as rm_error:
+            current_app.logger.error(f'移动项目目录到回收目录时出错 (ID: {project_id}): {str(rm_error)}')
+        wake_reaper()
+        cache = ExportCache(current_app.config['EXPORT_CACHE_DIR'], current_app.config['EXPORT_CACHE_MAX_BYTES'])
+        cache.discard_files(file.id for file in files)
+        get_blob_store().collect(*released)
 
         return jsonify({'message': '项目已删除'})
     except Exception as e:
@@ -0,0 +1,54 @@
+from flask import Blueprint, request, jsonify, current_app
+from models import Project
+from search import search_segments, FIELDS
+
+# Full-text search over segment texts, across all projects or within one
+search_bp = Blueprint('search', __name__, url_prefix='/api')
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+def _search(project_id=None):
+    """Runs the search described by ?q=&field=&order=&after=&limit= and builds the response."""
+    query = request.args.get('q', '')
+    field = request.args.get('field') or None
+    order = request.args.get('order', 'relevance')
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+        if limit < 1 or (field is not None and field not in FIELDS) or order not in ('relevance', 'position'):
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': '无效的搜索参数 (field: original/translated, order: relevance/position)'}), 400
+    if not query.split():
+        return jsonify({'error': '缺少搜索词'}), 400
+    try:
+        page = search_segments(query, project_id=project_id, field=field, order=order,
+                               after=request.args.get('after'), limit=limit)
+    except ValueError:
+        return jsonify({'error': '无效的分页游标'}), 400
+    return jsonify({
+        'results': page.results,
+        'nextAfter': page.next_after,
+        'hasMore': page.next_after is not None
+    })
+
+# Search every project
+@search_bp.route('/search', methods=['GET'])
+def search_all():
+    try:
+        return _search()
+    except Exception as e:
+        current_app.logger.error(f'搜索段落出错 (Query: {request.args.get("q")}): {str(e)}')
+        return jsonify({'error': '搜索失败'}), 500
+
+# Search within one project
+@search_bp.route('/projects/<project_id>/search', methods=['GET'])
+def search_project(project_id):
+    try:
+        Project.query.get_or_404(project_id, description='项目不存在')
+        return _search(project_id)
+    except Exception as e:
+        current_app.logger.error(f'搜索项目段落出错 (Project: {project_id}, Query: {request.args.get("q")}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目不存在'}), 404
+        return jsonify({'error': '搜索失败'}), 500
@@ -0,0 +1,173 @@
+import os
+import re
+from flask import Blueprint, request, jsonify, current_app, url_for
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.http import parse_content_range_header
+from werkzeug.utils import secure_filename
+from models import db, Project, UploadSession
+from blobs import get_blob_store
+from uploads import (RangeError, create_upload_session, write_chunk, upload_offset, upload_status, part_path,
+                     discard_upload_session, expire_upload_sessions)
+from routes.files import import_upload
+
+# Resumable uploads of a project (see uploads.py):
+#   POST   /uploads                {fileName, size, sha256?} -> session with its offset
+#   PUT    /uploads/<id>           a byte range (Content-Range: bytes start-end/size)
+#   GET    /uploads/<id>           offset to resume from after a dropped connection
+#   POST   /uploads/<id>/complete  imports the file like POST /files (?async=1 too)
+#   DELETE /uploads/<id>           abandons the upload
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/projects/<project_id>/uploads')
+
+SHA256_PATTERN = re.compile(r'^[0-9a-fA-F]{64}$')
+
+def _get_upload(project_id, upload_id):
+    return UploadSession.query.filter_by(id=upload_id, project_id=project_id).first_or_404(
+        description='上传会话不存在或已过期'
+    )
+
+# Start a resumable upload
+@uploads_bp.route('', methods=['POST'])
+def create_upload(project_id):
+    try:
+        project = Project.query.get_or_404(project_id, description='项目不存在')
+        data = request.get_json(silent=True) or {}
+        file_name = secure_filename(data.get('fileName') or '')
+        if not file_name:
+            return jsonify({'error': '缺少文件名'}), 400
+        size = data.get('size')
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            return jsonify({'error': '无效的文件大小'}), 400
+        if size > current_app.config['MAX_UPLOAD_SIZE']:
+            return jsonify({'error': '文件大小超出限制'}), 413
+        sha256 = data.get('sha256')
+        if sha256 is not None and not SHA256_PATTERN.match(str(sha256)):
+            return jsonify({'error': '无效的 SHA-256 校验和'}), 400
+
+        # Idle sessions are cleaned up whenever a new one starts
+        expire_upload_sessions()
+        upload = create_upload_session(project, file_name, size, sha256)
+        db.session.commit()
+        response = jsonify(upload_status(upload))
+        response.status_code = 201
+        response.headers['Location'] = url_for('uploads.get_upload', project_id=project_id, upload_id=upload.id)
+        return response
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'创建上传会话出错 (Project ID: {project_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '项目不存在'}), 404
+        return jsonify({'error': '创建上传会话失败'}), 500
+
+# Status of an upload: the offset to resume from
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+def get_upload(project_id, upload_id):
+    try:
+        return jsonify(upload_status(_get_upload(project_id, upload_id)))
+    except Exception as e:
+        current_app.logger.error(f'获取上传会话出错 (Project: {project_id}, Upload: {upload_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '上传会话不存在或已过期'}), 404
+        return jsonify({'error': '获取上传会话失败'}), 500
+
+# Send a chunk. The body is written to disk as it arrives; without a
+# Content-Range header it is appended at the current offset.
+@uploads_bp.route('/<upload_id>', methods=['PUT'])
+def put_upload_chunk(project_id, upload_id):
+    try:
+        upload = _get_upload(project_id, upload_id)
+        length = request.content_length
+        if length is None:
+            return jsonify({'error': '缺少 Content-Length'}), 411
+        header = request.headers.get('Content-Range')
+        if header:
+            content_range = parse_content_range_header(header)
+            if (content_range is None or content_range.units != 'bytes' or content_range.length != upload.size
+                    or content_range.stop - content_range.start != length):
+                return jsonify({'error': '无效的 Content-Range'}), 400
+            start = content_range.start
+        else:
+            start = upload_offset(upload)
+        try:
+            offset = write_chunk(upload, start, request.stream, length)
+        except RangeError:
+            return jsonify({'error': '数据范围与已接收的内容不连续', 'offset': upload_offset(upload)}), 409
+        db.session.commit()
+        return jsonify({'offset': offset, 'complete': offset >= upload.size})
+    except ClientDisconnected:
+        # What reached the disk is kept; the client resumes from GET /uploads/<id>
+        db.session.rollback()
+        current_app.logger.warning(f'上传分块时连接中断 (Project: {project_id}, Upload: {upload_id})')
+        return jsonify({'error': '连接中断'}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'写入上传分块出错 (Project: {project_id}, Upload: {upload_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '上传会话不存在或已过期'}), 404
+        return jsonify({'error': '写入上传分块失败'}), 500
+
+# Finish an upload: the assembled file is moved into the blob store and imported
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+def complete_upload(project_id, upload_id):
+    digest = None
+    try:
+        upload = _get_upload(project_id, upload_id)
+        offset = upload_offset(upload)
+        if offset < upload.size:
+            return jsonify({'error': '上传尚未完成', 'offset': offset}), 409
+
+        store = get_blob_store()
+        path = part_path(upload.id)
+        with open(path, 'rb') as f:
+            digest, size = store.hash_stream(f)
+        if upload.sha256 and digest != upload.sha256:
+            discard_upload_session(upload.id)
+            db.session.commit()
+            return jsonify({'error': '文件校验失败，请重新上传'}), 400
+
+        # End the read transaction before taking the blob reference: hashing may
+        # have taken long enough for another writer to commit, and SQLite cannot
+        # upgrade a stale read snapshot to a write
+        db.session.commit()
+
+        # Known content is dropped in favour of the stored blob (and its parse cache)
+        file_path = store.adopt(path, digest, size)
+        project, file_name = upload.project, upload.file_name
+        db.session.delete(upload)
+        response = import_upload(project, file_name, store, digest, file_path)
+        status = response[1] if isinstance(response, tuple) else response.status_code
+        if status >= 400:
+            # The import was rolled back, but the part file is gone: end the session
+            discard_upload_session(upload_id)
+            db.session.commit()
+        return response
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'完成上传出错 (Project: {project_id}, Upload: {upload_id}): {str(e)}')
+        # Before the part file was moved into the blob store the session is
+        # intact and the client can retry; afterwards it is used up
+        if digest and not os.path.exists(part_path(upload_id)):
+            try:
+                get_blob_store().collect(digest)
+                discard_upload_session(upload_id)
+                db.session.commit()
+            except Exception as rm_error:
+                db.session.rollback()
+                current_app.logger.error(f'完成上传失败后清理文件时出错: {str(rm_error)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '上传会话不存在或已过期'}), 404
+        return jsonify({'error': '完成上传失败'}), 500
+
+# Abandon an upload
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+def delete_upload(project_id, upload_id):
+    try:
+        upload = _get_upload(project_id, upload_id)
+        discard_upload_session(upload.id)
+        db.session.commit()
+        return jsonify({'message': '上传已取消'})
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'取消上传出错 (Project: {project_id}, Upload: {upload_id}): {str(e)}')
+        if hasattr(e, 'code') and e.code == 404:
+             return jsonify({'error': '上传会话不存在或已过期'}), 404
+        return jsonify({'error': '取消上传失败'}), 500
@@ -0,0 +1,204 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from models import db
+
+# External-content FTS5 index over segment(original_text, translated_text).
+# The trigram tokenizer matches substrings, which also works for CJK text
+# that has no spaces between words; terms shorter than 3 characters cannot
+# use it and fall back to a LIKE scan (see search_segments).
+SEARCH_TABLE = 'segment_fts'
+MIN_TERM_LENGTH = 3
+SNIPPET_TOKENS = 48 # trigram tokens, i.e. roughly characters
+SNIPPET_MARKERS = ('<mark>', '</mark>', '…')
+
+SEARCH_INDEX_DDL = [
+    f"""CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+            original_text, translated_text,
+            content='segment', content_rowid='id', tokenize='trigram')""",
+    # One-row switch for bulk_search_index. It is only ever set inside a write
+    # transaction and reset before commit, so other connections never see it set.
+    f"CREATE TABLE {SEARCH_TABLE}_control (id INTEGER PRIMARY KEY CHECK (id = 0), deferred INTEGER NOT NULL)",
+    f"INSERT INTO {SEARCH_TABLE}_control (id, deferred) VALUES (0, 0)",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON segment
+        WHEN (SELECT deferred FROM {SEARCH_TABLE}_control) = 0 BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, original_text, translated_text)
+            VALUES (new.id, new.original_text, new.translated_text);
+        END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON segment BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_text, translated_text)
+            VALUES ('delete', old.id, old.original_text, old.translated_text);
+        END""",
+    # Only the indexed columns: source_hash backfills and the like do not touch the index
+    f"""CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF original_text, translated_text ON segment BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_text, translated_text)
+            VALUES ('delete', old.id, old.original_text, old.translated_text);
+            INSERT INTO {SEARCH_TABLE}(rowid, original_text, translated_text)
+            VALUES (new.id, new.original_text, new.translated_text);
+        END""",
+]
+
+FIELDS = {'original': 'original_text', 'translated': 'translated_text'}
+
+SearchPage = namedtuple('SearchPage', ['results', 'next_after'])
+
+def ensure_search_index():
+    """
+    Creates the FTS5 table and its sync triggers if they are missing and
+    indexes the existing segments. Returns True if the index was built.
+    """
+    if db.engine.dialect.name != 'sqlite' or db.inspect(db.engine).has_table(SEARCH_TABLE):
+        return False
+    with db.engine.begin() as connection:
+        for ddl in SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(ddl)
+        connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    return True
+
+def rebuild_search_index():
+    """Re-indexes every segment from the segment table."""
+    db.session.execute(db.text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+    db.session.commit()
+
+@contextmanager
+def bulk_search_index(file_id, start_index=0):
+    """
+    Defers full-text indexing of segments inserted for a file inside the
+    block, then indexes them with one INSERT ... SELECT. Row-by-row trigger
+    inserts into FTS5 are several times slower than a single bulk insert.
+    Runs inside the caller's transaction, which must be rolled back if the
+    block raises (the rollback also resets the switch).
+    """
+    db.session.execute(db.text(f'UPDATE {SEARCH_TABLE}_control SET deferred = 1'))
+    yield
+    db.session.execute(
+        db.text(f'INSERT INTO {SEARCH_TABLE}(rowid, original_text, translated_text) '
+                f'SELECT id, original_text, translated_text FROM segment '
+                f'WHERE file_id = :file_id AND segment_index >= :start_index'),
+        {'file_id': file_id, 'start_index': start_index})
+    db.session.execute(db.text(f'UPDATE {SEARCH_TABLE}_control SET deferred = 0'))
+
+def match_expression(terms, field=None):
+    """FTS5 query matching every term as a literal substring, optionally in one column."""
+    expression = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    if field is not None:
+        expression = f'{{{FIELDS[field]}}} : ({expression})'
+    return expression
+
+def _like_snippet(text, terms):
+    """Python counterpart of FTS5 snippet() for the LIKE fallback: a window around the first term."""
+    lowered = text.lower()
+    positions = [(lowered.find(term.lower()), term) for term in terms if term.lower() in lowered]
+    if not positions:
+        return text[:SNIPPET_TOKENS * 4]
+    start, term = min(positions)
+    begin = max(start - SNIPPET_TOKENS * 2, 0)
+    end = min(start + len(term) + SNIPPET_TOKENS * 2, len(text))
+    mark_open, mark_close, ellipsis = SNIPPET_MARKERS
+    return ((ellipsis if begin else '') + text[begin:start] + mark_open + text[start:start + len(term)]
+            + mark_close + text[start + len(term):end] + (ellipsis if end < len(text) else ''))
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_segments(query, project_id=None, field=None, order='relevance', after=None, limit=50):
+    """
+    Searches segment texts.
+
+    Args:
+        query: Whitespace-separated terms; all must occur (as substrings,
+               case-insensitive).
+        project_id: Restricts the search to one project.
+        field: 'original', 'translated' or None for both.
+        order: 'relevance' (bm25, best first) or 'position' (segment id).
+        after: Cursor returned as next_after by the previous page.
+        limit: Results per page.
+
+    Returns:
+        SearchPage(results, next_after); results are dicts with the segment's
+        location, snippets and score; next_after is None on the last page.
+
+    Raises:
+        ValueError: If the query has no terms or the cursor is malformed.
+    """
+    terms = query.split()
+    if not terms:
+        raise ValueError('empty query')
+    if min(len(term) for term in terms) < MIN_TERM_LENGTH:
+        return _like_search(terms, project_id, field, after, limit)
+
+    mark_open, mark_close, ellipsis = SNIPPET_MARKERS
+    score = f'bm25({SEARCH_TABLE})'
+    sql = (f"SELECT {SEARCH_TABLE}.rowid, s.file_id, f.project_id, f.file_name, s.segment_index, "
+           f"snippet({SEARCH_TABLE}, 0, :mark_open, :mark_close, :ellipsis, {SNIPPET_TOKENS}), "
+           f"snippet({SEARCH_TABLE}, 1, :mark_open, :mark_close, :ellipsis, {SNIPPET_TOKENS}), {score} "
+           f"FROM {SEARCH_TABLE} "
+           f"JOIN segment s ON s.id = {SEARCH_TABLE}.rowid "
+           f"JOIN file f ON f.id = s.file_id "
+           f"WHERE {SEARCH_TABLE} MATCH :match")
+    params = {'match': match_expression(terms, field), 'mark_open': mark_open, 'mark_close': mark_close,
+              'ellipsis': ellipsis, 'limit': limit + 1}
+    if project_id is not None:
+        sql += ' AND f.project_id = :project_id'
+        params['project_id'] = project_id
+    if order == 'relevance':
+        if after is not None:
+            # Cursor "<score>:<id>": continue after that (score, id) pair
+            after_score, after_id = after.rsplit(':', 1)
+            params.update(after_score=float(after_score), after_id=int(after_id))
+            sql += (f' AND ({score} > :after_score OR '
+                    f'({score} = :after_score AND {SEARCH_TABLE}.rowid > :after_id))')
+        sql += f' ORDER BY {score}, {SEARCH_TABLE}.rowid LIMIT :limit'
+    else:
+        if after is not None:
+            params['after_id'] = int(after)
+            sql += f' AND {SEARCH_TABLE}.rowid > :after_id'
+        sql += f' ORDER BY {SEARCH_TABLE}.rowid LIMIT :limit'
+
+    rows = db.session.execute(db.text(sql), params).all()
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_after = f'{last[7]!r}:{last[0]}' if order == 'relevance' else str(last[0])
+    results = [_result(file_id, row_project_id, file_name, index, original, translated, row_score)
+               for _, file_id, row_project_id, file_name, index, original, translated, row_score in rows]
+    return SearchPage(results, next_after)
+
+def _like_search(terms, project_id, field, after, limit):
+    """Fallback for short terms: LIKE scan in segment id order, no ranking."""
+    columns = [FIELDS[field]] if field is not None else list(FIELDS.values())
+    conditions = []
+    params = {'limit': limit + 1}
+    for i, term in enumerate(terms):
+        params[f'term_{i}'] = f'%{_escape_like(term)}%'
+        conditions.append('(' + ' OR '.join(f"s.{column} LIKE :term_{i} ESCAPE '\\'" for column in columns) + ')')
+    sql = ('SELECT s.id, s.file_id, f.project_id, f.file_name, s.segment_index, s.original_text, s.translated_text '
+           'FROM segment s JOIN file f ON f.id = s.file_id WHERE ' + ' AND '.join(conditions))
+    if project_id is not None:
+        sql += ' AND f.project_id = :project_id'
+        params['project_id'] = project_id
+    if after is not None:
+        params['after_id'] = int(after.rsplit(':', 1)[-1])
+        sql += ' AND s.id > :after_id'
+    sql += ' ORDER BY s.id LIMIT :limit'
+
+    rows = db.session.execute(db.text(sql), params).all()
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = str(rows[-1][0])
+    results = [_result(file_id, row_project_id, file_name, index,
+                       _like_snippet(original, terms), _like_snippet(translated, terms), None)
+               for _, file_id, row_project_id, file_name, index, original, translated in rows]
+    return SearchPage(results, next_after)
+
+def _result(file_id, project_id, file_name, index, original_snippet, translated_snippet, score):
+    return {
+        'projectId': project_id,
+        'fileId': file_id,
+        'fileName': file_name,
+        'index': index,
+        'originalSnippet': original_snippet,
+        'translatedSnippet': translated_snippet,
+        'score': score
+    }
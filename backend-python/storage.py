@@ -0,0 +1,33 @@
+from sqlalchemy import event
+from config import SQLITE_PROFILES
+
+def sqlite_pragmas(profile):
+    """
+    Returns the pragma dict of a SQLite storage profile.
+
+    Raises:
+        ValueError: If the profile is not defined in config.SQLITE_PROFILES.
+    """
+    try:
+        return SQLITE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown SQLITE_PROFILE '{profile}', expected one of: {', '.join(SQLITE_PROFILES)}")
+
+def apply_sqlite_profile(engine, profile):
+    """
+    Registers a connect listener that runs the profile's PRAGMAs on every new
+    DB-API connection. Must be called before the engine opens its first
+    connection; does nothing for non-SQLite engines or an empty profile.
+    """
+    pragmas = sqlite_pragmas(profile)
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
@@ -0,0 +1,112 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, UploadSession
+from utils import READ_CHUNK_SIZE
+
+# Resumable uploads: a session is created with the file's name and size, the
+# content is sent as byte ranges in any number of requests, each written
+# straight to the session's part file, and the complete file is finally moved
+# into the blob store and imported like a direct upload. The part file's size
+# is the offset a client resumes from, so a dropped connection only loses the
+# bytes that never reached the disk.
+
+class RangeError(ValueError):
+    """A chunk does not fit the session: beyond the declared size or past the received offset."""
+
+def part_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_SESSION_DIR'], f'{upload_id}.part')
+
+def upload_offset(upload):
+    """Bytes received so far."""
+    try:
+        return os.path.getsize(part_path(upload.id))
+    except FileNotFoundError:
+        return 0
+
+def upload_status(upload):
+    offset = upload_offset(upload)
+    ttl = current_app.config['UPLOAD_SESSION_TTL']
+    return {
+        'id': upload.id,
+        'projectId': upload.project_id,
+        'fileName': upload.file_name,
+        'size': upload.size,
+        'offset': offset,
+        'complete': offset >= upload.size,
+        'chunkSize': current_app.config['UPLOAD_CHUNK_SIZE'],
+        'createdAt': upload.created_at.isoformat(),
+        'expiresAt': (upload.updated_at + timedelta(seconds=ttl)).isoformat()
+    }
+
+def create_upload_session(project, file_name, size, sha256=None):
+    """Adds a session with an empty part file; the caller commits."""
+    upload = UploadSession(id=str(uuid.uuid4()), project_id=project.id, file_name=file_name,
+                           size=size, sha256=sha256.lower() if sha256 else None)
+    db.session.add(upload)
+    open(part_path(upload.id), 'wb').close()
+    return upload
+
+def write_chunk(upload, start, stream, length):
+    """
+    Writes length bytes from stream at byte start of the part file, in
+    READ_CHUNK_SIZE pieces, and returns the new offset. Chunks may overlap
+    what was received (a retried request) but not leave a gap. The caller
+    commits (the session's updated_at is refreshed).
+
+    Bytes written before the client disconnects are kept: the stream's
+    error propagates and the client resumes from the part file's size.
+
+    Raises:
+        RangeError: If the chunk starts past the offset or ends past the size.
+    """
+    offset = upload_offset(upload)
+    if start > offset:
+        raise RangeError(f'chunk starts at {start}, {offset} bytes received')
+    if start + length > upload.size:
+        raise RangeError(f'chunk ends at {start + length}, file size is {upload.size}')
+    upload.updated_at = datetime.utcnow()
+    with open(part_path(upload.id), 'r+b') as f:
+        f.seek(start)
+        remaining = length
+        while remaining:
+            chunk = stream.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            remaining -= len(chunk)
+    return upload_offset(upload)
+
+def discard_upload_session(upload_id):
+    """Deletes a session's row (if it still exists) and part file; the caller commits."""
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is not None:
+        db.session.delete(upload)
+    path = part_path(upload_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+def expire_upload_sessions():
+    """
+    Deletes sessions idle for longer than UPLOAD_SESSION_TTL, and part files
+    whose session is gone (e.g. with its project). The caller commits.
+
+    Returns:
+        Number of part files removed.
+    """
+    ttl = current_app.config['UPLOAD_SESSION_TTL']
+    expired_before = datetime.utcnow() - timedelta(seconds=ttl)
+    table = UploadSession.__table__
+    db.session.execute(table.delete().where(table.c.updated_at < expired_before))
+    active = {upload_id for (upload_id,) in db.session.query(UploadSession.id)}
+    removed = 0
+    for entry in os.scandir(current_app.config['UPLOAD_SESSION_DIR']):
+        upload_id, extension = os.path.splitext(entry.name)
+        if extension == '.part' and upload_id not in active:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
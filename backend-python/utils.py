@@ -1,42 +1,142 @@
+import codecs
+import hashlib
 import xml.etree.ElementTree as ET
 
-def parse_file_content(content):
+# Size of the text chunks fed to the pull parser / read while sniffing encodings
+READ_CHUNK_SIZE = 1024 * 1024
+# Encodings tried, in order, when reading uploaded files
+CANDIDATE_ENCODINGS = ('utf-8', 'gbk')
+
+def normalize_source(text):
+    """Normalization applied before hashing: surrounding and repeated whitespace is ignored."""
+    return ' '.join(text.split())
+
+def source_hash(text):
     """
-    Parses structured text content with <seg>, <source>, <target> tags.
+    Signed 64-bit hash of the normalized source text (fits SQLite's INTEGER).
+
+    Keys the translation memory and the repetition groups stored in
+    Segment.source_hash.
+    """
+    digest = hashlib.blake2b(normalize_source(text).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def detect_encoding(path, candidates=CANDIDATE_ENCODINGS, chunk_size=READ_CHUNK_SIZE):
+    """
+    Returns the first encoding in candidates that decodes the whole file.
+
+    The file is decoded incrementally, so memory use does not depend on its size.
+
+    Raises:
+        UnicodeDecodeError: If none of the candidate encodings can decode the file.
+    """
+    last_error = None
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+            return encoding
+        except UnicodeDecodeError as e:
+            last_error = e
+    raise last_error
+
+def iter_segments(chunks):
+    """
+    Incrementally parses structured text with <seg>, <source>, <target> tags.
 
     Args:
-        content: The string content of the file.
+        chunks: An iterable of string pieces of the content.
 
-    Returns:
-        A list of tuples, where each tuple is (source_text, target_text).
-        Returns an empty list if parsing fails or content is empty.
+    Yields:
+        (source_text, target_text) tuples, in document order. Segments without
+        source text are skipped. Each <seg> is discarded once yielded, so memory
+        use is bounded by the largest segment rather than the whole document.
 
     Raises:
         ET.ParseError: If the XML structure is invalid.
     """
-    segments = []
-    if not content or not content.strip():
-        return segments
-
-    try:
-        # Wrap content in a root element for valid XML parsing
-        # Use a namespace-agnostic approach for finding tags
-        root = ET.fromstring(f"<root>{content}</root>")
-        for seg_element in root.findall('.//seg'):
-            source_element = seg_element.find('.//source')
-            target_element = seg_element.find('.//target')
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+    seg_depth = 0 # > 0 while inside a <seg>; nested <seg> elements are not split out
+
+    def drain():
+        nonlocal root, seg_depth
+        for event, element in parser.read_events():
+            if root is None:
+                root = element
+                continue
+            if element.tag != 'seg':
+                continue
+            if event == 'start':
+                seg_depth += 1
+                continue
+            seg_depth -= 1
+            if seg_depth:
+                continue
+
+            source_element = element.find('.//source')
+            target_element = element.find('.//target')
 
             source_text = source_element.text.strip() if source_element is not None and source_element.text else ""
             target_text = target_element.text.strip() if target_element is not None and target_element.text else ""
 
-            # Only add if source text is present
+            # Drop everything parsed so far; the wrapper root stays
+            root.clear()
+
+            # Only yield if source text is present
             if source_text:
-                segments.append((source_text, target_text))
+                yield source_text, target_text
+
+    try:
+        # Wrap content in a root element for valid XML parsing
+        parser.feed('<root>')
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from drain()
+        parser.feed('</root>')
+        parser.close()
+        yield from drain()
     except ET.ParseError as e:
         print(f"XML Parse Error: {e}") # Log the error
         raise # Re-raise the error to be handled by the caller
 
-    return segments
+def iter_file_content(path, encoding=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Streams (source_text, target_text) tuples from a file on disk.
+
+    Args:
+        path: Path of the uploaded file.
+        encoding: Text encoding; detected with detect_encoding() when omitted.
+        chunk_size: Number of characters read per chunk.
+
+    Raises:
+        UnicodeDecodeError: If the encoding cannot be determined.
+        ET.ParseError: If the XML structure is invalid.
+    """
+    encoding = encoding or detect_encoding(path)
+    with open(path, 'r', encoding=encoding) as f:
+        yield from iter_segments(iter(lambda: f.read(chunk_size), ''))
+
+def parse_file_content(content):
+    """
+    Parses structured text content with <seg>, <source>, <target> tags.
+
+    Args:
+        content: The string content of the file.
+
+    Returns:
+        A list of tuples, where each tuple is (source_text, target_text).
+        Returns an empty list if parsing fails or content is empty.
+
+    Raises:
+        ET.ParseError: If the XML structure is invalid.
+    """
+    if not content or not content.strip():
+        return []
+    return list(iter_segments([content]))
 
 # Example usage and test cases
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError: # Falls back to the standard library encoder
+    orjson = None
+
+# Wire formats of the segment endpoints, selected by ?format= or the Accept header:
+#   json     the endpoint's JSON document (default)
+#   columns  one array per field instead of one object per segment
+#   ndjson   one JSON object per line, streamed while rows are read
+NDJSON_MIMETYPE = 'application/x-ndjson'
+COLUMNS_MIMETYPE = 'application/vnd.auto-translate.columns+json'
+WIRE_FORMATS = {
+    'json': 'application/json',
+    'columns': COLUMNS_MIMETYPE,
+    'ndjson': NDJSON_MIMETYPE,
+}
+# Encoded NDJSON lines are buffered up to this many bytes before being yielded
+NDJSON_BUFFER_SIZE = 16 * 1024
+
+if orjson is not None:
+    def dumps(obj):
+        """Compact JSON as UTF-8 bytes."""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj):
+        """Compact JSON as UTF-8 bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed.
+    Output matches the default provider (sorted keys, dates as HTTP dates,
+    indentation in debug mode) except that non-ASCII text is not escaped.
+    """
+
+    def _options(self, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {'sort_keys'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options(**kwargs)).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._options()
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=option),
+                                        mimetype=self.mimetype)
+
+def negotiate_format(request, default='json'):
+    """
+    Wire format name for a request: ?format= wins over the Accept header.
+    Returns None if ?format= names an unknown format.
+    """
+    name = request.args.get('format')
+    if name:
+        return name if name in WIRE_FORMATS else None
+    mimetypes = list(WIRE_FORMATS.values())
+    best = request.accept_mimetypes.best_match(mimetypes, default=WIRE_FORMATS[default])
+    return next(name for name, mimetype in WIRE_FORMATS.items() if mimetype == best)
+
+def ndjson_chunks(rows, keys, header=None, buffer_size=NDJSON_BUFFER_SIZE):
+    """
+    Encodes rows (tuples matching keys) as NDJSON byte chunks, one object per
+    line. A header object, if given, is the first line and is yielded on its
+    own so the client gets it before the first rows are read.
+    """
+    if header is not None:
+        yield dumps(header) + b'\n'
+    buffer = []
+    buffered = 0
+    for row in rows:
+        line = dumps(dict(zip(keys, row))) + b'\n'
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def columns_document(rows, keys, **extra):
+    """
+    Columnar JSON bytes: {key: [values...], ...} for rows (tuples matching
+    keys), plus the extra top-level members.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(keys)
+    return dumps({**dict(zip(keys, columns)), **extra})
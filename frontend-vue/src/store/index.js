@@ -11,6 +11,10 @@ export default new Vuex.Store({
     currentFile: null,
     originalSegments: [],
     translatedSegments: [],
+    // 自上次保存以来修改过的段落 { index: text }
+    dirtySegments: {},
+    // 当前文件的服务端事件流 (EventSource)
+    fileEvents: null,
     loading: false
   },
   mutations: {
@@ -29,9 +33,42 @@ export default new Vuex.Store({
         state.originalSegments = [];
         state.translatedSegments = [];
       }
+      state.dirtySegments = {};
     },
     UPDATE_TRANSLATED_SEGMENT(state, { index, text }) {
       Vue.set(state.translatedSegments, index, text);
+      Vue.set(state.dirtySegments, index, text);
+    },
+    CLEAR_DIRTY_SEGMENTS(state, saved) {
+      // 保存期间再次修改的段落保持为脏
+      Object.keys(saved).forEach(index => {
+        if (state.dirtySegments[index] === saved[index]) {
+          Vue.delete(state.dirtySegments, index);
+        }
+      });
+    },
+    APPLY_SEGMENT_CHANGES(state, segments) {
+      // 其他客户端或重复段落传播写入的译文; 本地未保存的修改优先
+      Object.keys(segments).forEach(index => {
+        if (!(index in state.dirtySegments)) {
+          Vue.set(state.translatedSegments, index, segments[index]);
+        }
+      });
+    },
+    SET_FILE_PROGRESS(state, progress) {
+      if (state.currentFile && state.currentFile.id === progress.fileId) {
+        state.currentFile.completionRate = progress.completionRate;
+      }
+      if (state.currentProject) {
+        state.currentProject.completionRate = progress.projectCompletionRate;
+        const file = (state.currentProject.files || []).find(f => f.id === progress.fileId);
+        if (file) {
+          file.completionRate = progress.completionRate;
+        }
+      }
+    },
+    SET_FILE_EVENTS(state, source) {
+      state.fileEvents = source;
     },
     SET_LOADING(state, loading) {
       state.loading = loading;
@@ -91,6 +128,52 @@ export default new Vuex.Store({
         commit('SET_LOADING', false);
       }
     },
+    // 大文件分块续传: 创建上传会话, 按块 PUT, 网络中断后从服务端记录的偏移继续
+    async uploadFileResumable({ commit, dispatch }, { projectId, file, maxRetries = 5 }) {
+      commit('SET_LOADING', true);
+      try {
+        const base = `/api/projects/${projectId}/uploads`;
+        const session = (await axios.post(base, { fileName: file.name, size: file.size })).data;
+        let offset = session.offset;
+        let retries = 0;
+        while (offset < file.size) {
+          const end = Math.min(offset + session.chunkSize, file.size);
+          try {
+            const response = await axios.put(`${base}/${session.id}`, file.slice(offset, end), {
+              headers: {
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`
+              }
+            });
+            offset = response.data.offset;
+            retries = 0;
+          } catch (error) {
+            const status = error.response && error.response.status;
+            if (status === 404 || status === 413 || ++retries > maxRetries) {
+              throw error;
+            }
+            // 连接中断或数据不连续: 查询服务端已接收的字节数后继续
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            offset = (await axios.get(`${base}/${session.id}`)).data.offset;
+          }
+        }
+        const response = await axios.post(`${base}/${session.id}/complete`);
+        await dispatch('fetchProject', projectId);
+        return response.data;
+      } finally {
+        commit('SET_LOADING', false);
+      }
+    },
+    async uploadFiles({ commit, dispatch }, { projectId, formData }) {
+      commit('SET_LOADING', true);
+      try {
+        const response = await axios.post(`/api/projects/${projectId}/files/batch`, formData);
+        await dispatch('fetchProject', projectId);
+        return response.data;
+      } finally {
+        commit('SET_LOADING', false);
+      }
+    },
     async fetchFile({ commit }, { projectId, fileId }) {
       commit('SET_LOADING', true);
       try {
@@ -113,18 +196,56 @@ export default new Vuex.Store({
         commit('SET_LOADING', false);
       }
     },
-    async saveTranslation({ commit, state, dispatch }, { projectId, fileId }) {
+    async saveTranslation({ commit, state }, { projectId, fileId }) {
       commit('SET_LOADING', true);
       try {
-        const response = await axios.put(`/api/projects/${projectId}/files/${fileId}`, {
-          translatedSegments: state.translatedSegments
+        // 只发送修改过的段落
+        const changes = { ...state.dirtySegments };
+        if (!Object.keys(changes).length) {
+          return { message: '没有需要保存的修改' };
+        }
+        const response = await axios.patch(`/api/projects/${projectId}/files/${fileId}`, changes);
+        commit('CLEAR_DIRTY_SEGMENTS', changes);
+        // 完成率直接取自响应; 传播到重复段落的译文通过事件流推送, 无需重新加载文件
+        commit('SET_FILE_PROGRESS', {
+          fileId,
+          completionRate: response.data.completionRate,
+          projectCompletionRate: response.data.projectCompletionRate
         });
-        await dispatch('fetchProject', projectId);
         return response.data;
       } finally {
         commit('SET_LOADING', false);
       }
     },
+    // 重新加载当前文件, 保留尚未保存的修改
+    async reloadFile({ commit, state, dispatch }, { projectId, fileId }) {
+      const dirty = { ...state.dirtySegments };
+      await dispatch('fetchFile', { projectId, fileId });
+      Object.keys(dirty).forEach(index => {
+        commit('UPDATE_TRANSLATED_SEGMENT', { index: Number(index), text: dirty[index] });
+      });
+    },
+    // 订阅当前文件的服务端事件 (段落增量、完成率、后台任务进度)
+    subscribeFileEvents({ commit, dispatch }, { projectId, fileId }) {
+      dispatch('unsubscribeFileEvents');
+      const source = new EventSource(`/api/projects/${projectId}/files/${fileId}/events`);
+      source.addEventListener('segments', event => {
+        const data = JSON.parse(event.data);
+        commit('APPLY_SEGMENT_CHANGES', data.segments);
+        commit('SET_FILE_PROGRESS', data);
+      });
+      // 大量段落变化 (如机器翻译) 或事件积压时才重新加载
+      const reload = () => dispatch('reloadFile', { projectId, fileId });
+      source.addEventListener('file-changed', reload);
+      source.addEventListener('resync', reload);
+      commit('SET_FILE_EVENTS', source);
+    },
+    unsubscribeFileEvents({ commit, state }) {
+      if (state.fileEvents) {
+        state.fileEvents.close();
+        commit('SET_FILE_EVENTS', null);
+      }
+    },
     async downloadTranslatedFile({ commit }, { projectId, fileId }) {
       commit('SET_LOADING', true);
       try {